@@ -11,6 +11,8 @@ import httpx
 
 from config import settings
 from database import get_db_connection
+from monitoring import ALERT_NOTIFICATIONS
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -21,21 +23,24 @@ class AlertService:
         
     async def send_alert(self, alert_id: int, alert_data: Dict[str, Any]):
         """Send alert through all configured channels"""
-        # Check throttling
-        if self._is_throttled(alert_data):
-            logger.info(f"Alert {alert_id} throttled")
-            return
-        
-        # Send via email
-        if settings.SMTP_ENABLED and settings.SMTP_USER:
-            asyncio.create_task(self._send_email(alert_id, alert_data))
-        
-        # Send via webhook/Slack
-        if settings.SLACK_WEBHOOK_URL:
-            asyncio.create_task(self._send_webhook(alert_id, alert_data))
-        
-        # In-app notification is handled by storing in database
-        logger.info(f"Alert {alert_id} sent: {alert_data['title']}")
+        with tracer.span("alert.send", **{"alert.id": alert_id}) as span:
+            # Check throttling
+            if self._is_throttled(alert_data):
+                ALERT_NOTIFICATIONS.labels('all', 'throttled').inc()
+                span.set_attribute("alert.throttled", True)
+                logger.info(f"Alert {alert_id} throttled")
+                return
+            
+            # Send via email
+            if settings.SMTP_ENABLED and settings.SMTP_USER:
+                asyncio.create_task(self._send_email(alert_id, alert_data))
+            
+            # Send via webhook/Slack
+            if settings.SLACK_WEBHOOK_URL:
+                asyncio.create_task(self._send_webhook(alert_id, alert_data))
+            
+            # In-app notification is handled by storing in database
+            logger.info(f"Alert {alert_id} sent: {alert_data['title']}")
     
     def _is_throttled(self, alert_data: Dict) -> bool:
         """Check if similar alert was recently sent"""
@@ -135,6 +140,7 @@ class AlertService:
     
     def _log_notification(self, alert_id: int, channel: str, status: str, error: str = None):
         """Log notification attempt to database"""
+        ALERT_NOTIFICATIONS.labels(channel, status).inc()
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
@@ -0,0 +1,153 @@
+"""
+Cache - Short-lived result cache for dashboard queries
+
+Dashboards poll the same metrics from every open tab. Results are cached
+per normalized query and user scope for a few seconds; concurrent identical
+requests share one execution, which completes even when the request that
+started it is cancelled. The cache is LRU-bounded, and entries carry tags so
+writers (new alerts, acknowledgements) can drop what they affect.
+
+The cache is per process: other workers only see a change once their own
+entries expire, so TTLs are kept short.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from config import settings
+from monitoring import Counter
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = Counter(
+    "boing_cache_requests_total", "Result cache lookups", ["cache", "result"]
+)
+
+TIME_FIELDS = ("start_time", "end_time")
+
+
+def scope_of(user: dict) -> str:
+    """Cache scope: admins share results, other users only see their own"""
+    return "admin" if user['role'] == 'admin' else f"user:{user['id']}"
+
+
+def alert_tags(api_id: Optional[int]) -> tuple:
+    """Tags for results that include alerts of one API (or of every API)"""
+    return (f"alerts:api:{api_id}",) if api_id else ("alerts:all",)
+
+
+class ResultCache:
+    def __init__(self, name: str, ttl: float, max_entries: int = 1000, enabled: bool = True):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[asyncio.Task, tuple]] = {}
+        # Bumped by invalidate(): a result computed across a bump is not stored
+        self._generation = 0
+        self._tag_generations: Dict[str, int] = {}
+
+    def key(self, user: dict, **params) -> str:
+        """Normalize a query into a cache key
+
+        Sliding time windows are rounded to the TTL, so polls a few seconds
+        apart share an entry; the result is then no staler than the TTL.
+        """
+        normalized = {}
+        for name, value in params.items():
+            if hasattr(value, "value"):
+                value = value.value
+            if name in TIME_FIELDS and value and self.ttl > 0:
+                value = math.floor(value / self.ttl) * self.ttl
+            normalized[name] = value
+        return scope_of(user) + ":" + json.dumps(normalized, sort_keys=True, default=str)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             tags: Iterable[str] = ()) -> Any:
+        if not self.enabled:
+            return await compute()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, _ = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.labels(self.name, "hit").inc()
+                return value
+            del self._entries[key]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            CACHE_REQUESTS.labels(self.name, "coalesced").inc()
+            return await asyncio.shield(pending[0])
+
+        CACHE_REQUESTS.labels(self.name, "miss").inc()
+        # Its own task, so cancelling any caller, the first included, leaves it running for the rest
+        tags = tuple(tags)
+        task = asyncio.ensure_future(self._compute(key, compute, tags, self._generations(tags)))
+        # Mark a failure retrieved, so an error nobody else waited for is not logged
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = (task, tags)
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], tags: tuple,
+                       generations: tuple) -> Any:
+        try:
+            value = await compute()
+        finally:
+            if self._inflight.get(key, (None,))[0] is asyncio.current_task():
+                del self._inflight[key]
+        # An invalidation while computing may have missed what the result was read from
+        if self._generations(tags) == generations:
+            self._store(key, value, tags)
+        return value
+
+    def _generations(self, tags: tuple) -> tuple:
+        return (self._generation,) + tuple(self._tag_generations.get(tag, 0) for tag in tags)
+
+    def _store(self, key: str, value: Any, tags: tuple):
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *tags: str):
+        """Drop entries carrying any of the tags (every entry when no tag is given)"""
+        if not tags:
+            self._generation += 1
+            self._entries.clear()
+            self._inflight.clear()
+            return
+        for tag in tags:
+            self._tag_generations[tag] = self._tag_generations.get(tag, 0) + 1
+        wanted = set(tags)
+        for key in [k for k, (_, _, entry_tags) in self._entries.items() if wanted.intersection(entry_tags)]:
+            del self._entries[key]
+        # Later requests start a fresh computation instead of joining one that may be stale
+        for key in [k for k, (_, entry_tags) in self._inflight.items() if wanted.intersection(entry_tags)]:
+            del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+metrics_cache = ResultCache(
+    "metrics", ttl=settings.METRICS_CACHE_TTL_SECONDS,
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES, enabled=settings.RESULT_CACHE_ENABLED
+)
+alert_stats_cache = ResultCache(
+    "alert_stats", ttl=settings.ALERT_STATS_CACHE_TTL_SECONDS,
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES, enabled=settings.RESULT_CACHE_ENABLED
+)
+
+
+def invalidate_alerts(api_id: Optional[int] = None):
+    """Drop cached results that count alerts, after alerts of an API changed"""
+    tags = ("alerts:all",) + alert_tags(api_id) if api_id else ()
+    metrics_cache.invalidate(*tags)
+    alert_stats_cache.invalidate(*tags)
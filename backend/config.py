@@ -4,11 +4,21 @@ from typing import List
 
 class Settings(BaseSettings):
     # Database
+    DB_BACKEND: str = "mysql"  # mysql, or sqlite for an embedded single-node database
+    SQLITE_PATH: str = "data/boing.db"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # how long a writer waits for another one
     DB_HOST: str = "localhost"
     DB_PORT: int = 3306
     DB_USER: str = "boing_user"
     DB_PASSWORD: str = "boing_password"
     DB_NAME: str = "boing"
+    DB_POOL_SIZE: int = 10  # idle connections kept per server; 0 opens one per request
+    DB_POOL_PING_SECONDS: float = 30.0  # connections idle for longer are pinged before reuse
+    DB_REPLICAS: str = ""  # comma separated host[:port] read replicas for dashboard queries
+    DB_REPLICA_MAX_LAG_SECONDS: float = 10.0  # staleness dashboard reads tolerate
+    DB_REPLICA_CHECK_SECONDS: float = 5.0
+    STATEMENT_STATS_ENABLED: bool = True
+    STATEMENT_STATS_MAX_ENTRIES: int = 500  # distinct statements tracked; the rest count as "(other)"
     
     # Security
     JWT_SECRET: str = "change-this-secret-key-min-32-chars"
@@ -59,6 +69,78 @@ class Settings(BaseSettings):
     # ML Settings
     ML_RETRAIN_INTERVAL_HOURS: int = 24
     
+    # Tracing
+    TRACING_ENABLED: bool = True
+    TRACING_SAMPLE_RATE: float = 0.01
+    TRACING_MAX_TRACES_PER_SECOND: float = 10.0
+    TRACING_BUFFER_SPANS: int = 2000
+    TRACING_OTLP_ENDPOINT: str = ""
+    
+    # Event loop watchdog
+    LOOP_WATCHDOG_ENABLED: bool = True
+    LOOP_WATCHDOG_INTERVAL_MS: int = 100
+    LOOP_STALL_THRESHOLD_MS: int = 250
+    
+    # Metrics rollups
+    ROLLUPS_ENABLED: bool = True
+    ROLLUP_FLUSH_SECONDS: int = 10
+    
+    # Result cache for dashboard queries
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_ENTRIES: int = 1000
+    METRICS_CACHE_TTL_SECONDS: float = 10.0
+    ALERT_STATS_CACHE_TTL_SECONDS: float = 5.0
+    
+    # Daily partitions of request_logs
+    PARTITIONING_ENABLED: bool = True
+    PARTITION_DAYS_AHEAD: int = 7
+    PARTITION_RETENTION_DAYS: int = 0  # drop day partitions older than this, unless the suspicious/alert tiers keep rows in them; 0 keeps everything
+    PARTITION_MAINTENANCE_SECONDS: int = 3600
+    
+    # Raw log retention tiers (0 keeps forever; per-API overrides in retention_policies)
+    RETENTION_ENABLED: bool = True
+    RETENTION_HEADERS_DAYS: int = 0
+    RETENTION_RAW_DAYS: int = 0
+    RETENTION_SUSPICIOUS_DAYS: int = 0
+    RETENTION_ALERT_DAYS: int = 0
+    RETENTION_BATCH_ROWS: int = 1000
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.5
+    RETENTION_INTERVAL_SECONDS: int = 3600
+    
+    # Header capture (per-API overrides in header_policies)
+    HEADER_ALLOW_LIST: str = ""  # comma separated, 'x-*' matches a prefix; empty keeps every header
+    HEADER_SENSITIVE: str = "authorization,proxy-authorization,cookie,set-cookie,x-api-key"
+    HEADER_MAX_VALUE_BYTES: int = 512
+    HEADER_MAX_TOTAL_BYTES: int = 4096
+    HEADER_COMPRESS: bool = False
+    HEADER_COMPRESS_MIN_BYTES: int = 256  # smaller documents are stored as plain JSON
+    HEADER_COMPRESS_LEVEL: int = 6
+    HEADER_HASH_KEY: str = ""  # defaults to JWT_SECRET
+    HEADER_POLICY_CACHE_SECONDS: float = 60.0
+    
+    # Endpoint / user agent dictionaries (per-process id cache)
+    DICTIONARY_CACHE_ENTRIES: int = 100000
+    
+    # Route templates (OpenAPI or learned from traffic, per API)
+    ROUTE_CACHE_SECONDS: float = 60.0
+    ROUTE_LEARN_THRESHOLD: int = 50  # distinct values after one prefix that make a position a {param}
+    ROUTE_LEARN_MAX_NODES: int = 10000  # per API
+    ROUTE_BASELINE_MIN_SAMPLES: int = 30  # latency baselines fall back to the whole API below this
+    
+    # Columnar telemetry store (replaces request_logs for ingest, metrics and detection baselines)
+    TELEMETRY_STORE_ENABLED: bool = False
+    TELEMETRY_DIR: str = "data/telemetry"
+    TELEMETRY_SEGMENT_SECONDS: int = 3600  # one segment per window
+    TELEMETRY_SEGMENT_ROWS: int = 1000000  # preallocated rows of an open segment
+    TELEMETRY_SEAL_GRACE_SECONDS: int = 300  # late events still join their window's open segment
+    TELEMETRY_FLUSH_SECONDS: float = 5.0
+    TELEMETRY_RETENTION_DAYS: int = 0  # 0 keeps everything
+    TELEMETRY_CACHE_COLUMNS: int = 64  # decompressed columns of sealed segments kept in memory
+    
+    # Log exports
+    EXPORT_BATCH_ROWS: int = 5000
+    EXPORT_GZIP_LEVEL: int = 6
+    
     # SMTP Settings (alternative names for compatibility)
     SMTP_USE_TLS: bool = True
     
@@ -1,26 +1,441 @@
+"""
+Database - Connections to the configured storage backend
+
+DB_BACKEND selects the implementation behind get_db_connection():
+
+- mysql (default): pymysql connections to a MySQL server
+- sqlite: an embedded SQLite database file (SQLITE_PATH) in WAL mode, for
+  single-node deployments and hermetic test runs. Its connections mirror the
+  pymysql API used in this codebase (dict rows, %s placeholders, lastrowid,
+  rowcount) and translate MySQL statements on the fly (see sql_dialect.py);
+  init_db() creates the schema from schema.sql on first start.
+
+Daily partitions of request_logs are a MySQL feature: with SQLite the
+partition manager does not run (retention tiers still apply).
+
+MySQL connections come from per-server pools: close() rolls back the open
+transaction and keeps up to DB_POOL_SIZE idle connections for reuse.
+Dashboard reads ask for get_db_connection(read_only=True); with DB_REPLICAS
+set, those go to a read replica whose replication lag, measured every
+DB_REPLICA_CHECK_SECONDS by the replica monitor, is within
+DB_REPLICA_MAX_LAG_SECONDS, and to the primary when every replica lags, is
+down or has not been checked recently.
+"""
 import pymysql
-from pymysql.cursors import DictCursor
+from pymysql.cursors import DictCursor, SSDictCursor
 from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
 from config import settings
+from monitoring import (
+    DB_QUERIES, DB_QUERY_DURATION, DB_CONNECTIONS_OPEN, DB_CONNECTIONS_OPENED, DB_READS, DB_REPLICA_LAG
+)
+from sql_dialect import translate
+from statements import stats as statement_stats
+from typing import Callable, Dict, List, Optional
+import asyncio
 import logging
+import math
+import sqlite3
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    """Create database connection"""
-    return pymysql.connect(
-        host=settings.DB_HOST,
-        port=settings.DB_PORT,
+
+class _InstrumentedExecute:
+    """Records statement counts and latency, overall and per statement"""
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = super().execute(query, args)
+            ok = True
+        except Exception:
+            DB_QUERIES.labels('error').inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_QUERY_DURATION.observe(elapsed)
+            if settings.STATEMENT_STATS_ENABLED:
+                # Unbuffered results report an unknown (2^64 - 1) row count
+                rows = self.rowcount if ok and 0 <= self.rowcount < 2 ** 63 else 0
+                statement_stats.record(query, elapsed, rows, ok)
+        DB_QUERIES.labels('ok').inc()
+        return result
+
+
+class InstrumentedCursor(_InstrumentedExecute, DictCursor):
+    """DictCursor that records statement counts and latency"""
+
+
+class InstrumentedStreamingCursor(_InstrumentedExecute, SSDictCursor):
+    """Unbuffered DictCursor: rows are read from the server as they are fetched
+
+    Use fetchmany() for large result sets; the connection cannot run other
+    statements until the result is read or the connection is closed.
+    """
+
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    """Connection that tracks how many connections are open
+
+    A connection taken from a ConnectionPool goes back to it on close().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._counted = True
+        self._pool = None
+        self._checked_out = False
+        DB_CONNECTIONS_OPEN.inc()
+        DB_CONNECTIONS_OPENED.inc()
+
+    def close(self):
+        if self._pool is None:
+            return self.discard()
+        if not self._checked_out:
+            return  # closed twice: the pool may have handed it out again
+        self._checked_out = False
+        if not self.open or getattr(self._result, 'unbuffered_active', False):
+            # Unread streaming results cannot be skipped cheaply
+            return self.discard()
+        try:
+            self.rollback()  # the next user starts a fresh transaction
+        except Exception:
+            return self.discard()
+        self._pool.release(self)
+
+    def discard(self):
+        """Close the connection for good"""
+        try:
+            if self.open:
+                super().close()
+        finally:
+            if getattr(self, '_counted', False):
+                self._counted = False
+                DB_CONNECTIONS_OPEN.dec()
+
+
+class ConnectionPool:
+    """Idle connections to one server, reused instead of reconnecting per request"""
+
+    def __init__(self, name: str, connect: Callable[[], InstrumentedConnection], size: int, ping_after: float):
+        self.name = name
+        self._connect = connect
+        self.size = size
+        self.ping_after = ping_after
+        self._idle = []  # (connection, released at), most recently used last
+        self._lock = threading.Lock()
+
+    def acquire(self) -> InstrumentedConnection:
+        while True:
+            with self._lock:
+                conn, released = self._idle.pop() if self._idle else (None, None)
+            if conn is None:
+                conn = self._connect()
+                break
+            if time.monotonic() - released < self.ping_after:
+                break
+            try:
+                conn.ping(reconnect=False)
+                break
+            except Exception:
+                conn.discard()
+        conn._pool = self
+        conn._checked_out = True
+        return conn
+
+    def release(self, conn: InstrumentedConnection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.discard()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.discard()
+
+
+class ReplicaRouter:
+    """Picks a read replica within the staleness tolerance, round robin"""
+
+    def __init__(self, pools: List[ConnectionPool], interval: float):
+        self.pools = {pool.name: pool for pool in pools}
+        self.interval = interval
+        self.lag: Dict[str, Optional[float]] = {name: None for name in self.pools}  # None: down or not replicating
+        self.checked_at = None
+        self._turn = 0
+        self._task = None
+
+    def measure(self, pool: ConnectionPool) -> Optional[float]:
+        """Seconds the replica is behind its source, None when it is down or not replicating"""
+        try:
+            conn = pool.acquire()
+        except Exception as e:
+            logger.warning(f"Read replica {pool.name} is unreachable: {e}")
+            return None
+        try:
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.err.ProgrammingError:
+                    cursor.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+                status = cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"Could not read the replication status of {pool.name}: {e}")
+            return None
+        finally:
+            conn.close()
+        if not status:
+            logger.warning(f"{pool.name} is not a replica")
+            return None
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        return float(lag) if lag is not None else None
+
+    def check(self):
+        for name, pool in self.pools.items():
+            lag = self.measure(pool)
+            self.lag[name] = lag
+            DB_REPLICA_LAG.labels(name).set(lag if lag is not None else -1)
+        self.checked_at = time.monotonic()
+
+    def select(self, max_lag: float) -> Optional[ConnectionPool]:
+        """A replica at most max_lag seconds behind, None to use the primary"""
+        if self.checked_at is None or time.monotonic() - self.checked_at > 3 * self.interval:
+            return None  # lag unknown: the monitor is not running or stuck
+        fresh = [name for name, lag in self.lag.items() if lag is not None and lag <= max_lag]
+        if not fresh:
+            return None
+        self._turn = (self._turn + 1) % len(fresh)
+        return self.pools[fresh[self._turn]]
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception as e:
+                logger.error(f"Replica lag check failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+class _SQLiteCursor:
+    """sqlite3 cursor that speaks the MySQL dialect and returns dict rows"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+        self._columns = None
+        self._rows = None
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def execute(self, query, args=None):
+        style = None if args is None else ("named" if isinstance(args, dict) else "positional")
+        for statement in translate(query, style):
+            self._cursor.execute(statement, () if args is None else args)
+        self._after(statement)
+        return self.rowcount
+
+    def executemany(self, query, args):
+        statement, = translate(query, "positional")
+        self._cursor.executemany(statement, args)
+        self._after(statement)
+        return self.rowcount
+
+    def _after(self, statement: str):
+        description = self._cursor.description
+        self._columns = [column[0] for column in description] if description else None
+        self._rows = None
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        if self._columns and not statement.lstrip().upper().startswith(("SELECT", "WITH", "EXPLAIN", "PRAGMA")):
+            # INSERT ... RETURNING: the statement only completes once its rows are read
+            self._rows = self._cursor.fetchall()
+            if self._rows:
+                self.lastrowid = self._rows[0][0]
+
+    def _dict(self, row):
+        return dict(zip(self._columns, row)) if row is not None else None
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._dict(self._rows.pop(0)) if self._rows else None
+        return self._dict(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        if self._rows is not None:
+            size = size or 1
+            rows, self._rows = self._rows[:size], self._rows[size:]
+        else:
+            rows = self._cursor.fetchmany(size or 1)
+        return [self._dict(row) for row in rows]
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+        else:
+            rows = self._cursor.fetchall()
+        return [self._dict(row) for row in rows]
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class InstrumentedSQLiteCursor(_InstrumentedExecute, _SQLiteCursor):
+    """SQLite cursor that records statement counts and latency"""
+
+
+def _floor(value):
+    return None if value is None else math.floor(value)
+
+
+def _ceil(value):
+    return None if value is None else math.ceil(value)
+
+
+def _ln(value):
+    # MySQL answers NULL outside the domain instead of failing the statement
+    return math.log(value) if value is not None and value > 0 else None
+
+
+# Math functions of the MySQL SQL that older SQLite builds (no SQLITE_ENABLE_MATH_FUNCTIONS) lack
+_MATH_FUNCTIONS = {"FLOOR": _floor, "CEIL": _ceil, "LN": _ln}
+
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+for _type in ("TIMESTAMP", "DATETIME"):
+    sqlite3.register_converter(_type, lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SQLiteConnection:
+    """Connection to the embedded database with the pymysql connection API used here"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(
+            path, timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+        )
+        # request_logs.ts_day is generated with FLOOR(), rollup latency bins use CEIL(LN())
+        for name, function in _MATH_FUNCTIONS.items():
+            self._conn.create_function(name, 1, function, deterministic=True)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._counted = True
+        DB_CONNECTIONS_OPEN.inc()
+        DB_CONNECTIONS_OPENED.inc()
+
+    def cursor(self, cursorclass=None):
+        # SQLite steps through results as they are fetched: the streaming cursor class needs no counterpart
+        return InstrumentedSQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        try:
+            self._conn.close()
+        finally:
+            if self._counted:
+                self._counted = False
+                DB_CONNECTIONS_OPEN.dec()
+
+
+def _mysql_connect(host: str, port: int) -> InstrumentedConnection:
+    return InstrumentedConnection(
+        host=host,
+        port=port,
         user=settings.DB_USER,
         password=settings.DB_PASSWORD,
         database=settings.DB_NAME,
-        cursorclass=DictCursor,
+        cursorclass=InstrumentedCursor,
         autocommit=False
     )
 
+
+def _pool(address: str) -> ConnectionPool:
+    host, _, port = address.strip().partition(":")
+    port = int(port) if port else settings.DB_PORT
+    return ConnectionPool(
+        f"{host}:{port}", lambda: _mysql_connect(host, port), settings.DB_POOL_SIZE, settings.DB_POOL_PING_SECONDS
+    )
+
+
+primary = _pool(f"{settings.DB_HOST}:{settings.DB_PORT}")
+replicas = ReplicaRouter(
+    [_pool(address) for address in settings.DB_REPLICAS.split(",") if address.strip()],
+    settings.DB_REPLICA_CHECK_SECONDS
+)
+
+
+def get_db_connection(read_only: bool = False, max_lag: Optional[float] = None):
+    """Database connection; read_only ones may come from a replica at most
+    max_lag (default DB_REPLICA_MAX_LAG_SECONDS) seconds behind the primary"""
+    if settings.DB_BACKEND == "sqlite":
+        return SQLiteConnection(settings.SQLITE_PATH)
+    if read_only and replicas.pools:
+        pool = replicas.select(settings.DB_REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag)
+        if pool is not None:
+            try:
+                conn = pool.acquire()
+                DB_READS.labels('replica').inc()
+                return conn
+            except Exception as e:
+                logger.warning(f"Read replica {pool.name} failed, using the primary: {e}")
+                replicas.lag[pool.name] = None
+        DB_READS.labels('primary').inc()
+    return primary.acquire()
+
+def _create_sqlite_schema():
+    """Create the schema of a new SQLite database; existing databases are left alone"""
+    from migrate import load_migrations, split_statements
+
+    Path(settings.SQLITE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users'")
+        if cursor.fetchone():
+            return
+        schema = (Path(__file__).parent / "schema.sql").read_text()
+        for statement in split_statements(schema):
+            cursor.execute(statement)
+        # schema.sql is the latest schema: every migration is already in it
+        cursor.executemany(
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+            [(m.version, m.name) for m in load_migrations()]
+        )
+        conn.commit()
+        logger.info(f"Created SQLite database {settings.SQLITE_PATH}")
+    finally:
+        cursor.close()
+        conn.close()
+
 def init_db():
     """Initialize database connection - called on startup"""
     try:
+        if settings.DB_BACKEND == "sqlite":
+            _create_sqlite_schema()
         conn = get_db_connection()
         conn.close()
         logger.info("Database connection successful")
@@ -28,8 +443,25 @@ def init_db():
         logger.error(f"Failed to connect to database: {e}")
         raise
 
+def check_db() -> bool:
+    """Return True if the database answers a trivial query"""
+    try:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"Database health check failed: {e}")
+        return False
+
 def close_db():
     """Close database connections - called on shutdown"""
+    primary.clear()
+    for pool in replicas.pools.values():
+        pool.clear()
     logger.info("Database connections closed")
 
 @contextmanager
@@ -3,7 +3,7 @@ Detection Engine - Multi-layer anomaly detection pipeline
 """
 import asyncio
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import numpy as np
 from sklearn.ensemble import IsolationForest
@@ -11,13 +11,37 @@ from sklearn.preprocessing import StandardScaler
 import pickle
 import re
 import json
+import time
 
 from database import get_db_connection
 from config import settings, DETECTOR_CONFIG, ATTACK_PATTERNS
 from models import DetectionResult
+from monitoring import DETECTOR_DURATION, DETECTOR_HITS, ALERTS_CREATED
+from tracing import tracer
+from cache import invalidate_alerts
+from partitions import day_of
+from header_policy import normalize, scan_text
+from dictionaries import decode_rows
+from endpoint_templates import placeholder_count, split_endpoint, template_path
+from telemetry_store import store as telemetry
+from statements import register
 
 logger = logging.getLogger(__name__)
 
+INSERT_ALERT = register("detection.insert_alert", """
+    INSERT INTO alerts (api_id, log_id, event_id, alert_type, severity, score, title, description, metadata)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+""")
+
+# Telemetry store columns the ML model trains on (see _extract_features)
+TRAINING_COLUMNS = ['latency_ms', 'body_size', 'status_code', 'endpoint']
+
+# Attack signatures compiled once: (attack type, [(pattern, compiled)])
+SIGNATURES = [
+    (attack_type, [(pattern, re.compile(pattern, re.IGNORECASE)) for pattern in patterns])
+    for attack_type, patterns in ATTACK_PATTERNS.items()
+]
+
 
 class DetectionEngine:
     def __init__(self, alert_service):
@@ -54,16 +78,16 @@ class DetectionEngine:
         detections.extend(rule_results)
         
         # Layer 2: Statistical anomaly detection
-        stat_results = await self._statistical_detection(log_data)
+        stat_results = await self._timed('latency_spike', self._statistical_detection(log_data))
         detections.extend(stat_results)
         
         # Layer 3: ML-based detection
-        ml_results = await self._ml_detection(log_data)
+        ml_results = await self._timed('ml_anomaly', self._ml_detection(log_data))
         detections.extend(ml_results)
         
         # Layer 4: LLM-based analysis (if enabled)
         if settings.LLM_ENABLED:
-            llm_results = await self._llm_detection(log_data)
+            llm_results = await self._timed('llm_analysis', self._llm_detection(log_data))
             detections.extend(llm_results)
         
         # Calculate composite risk score
@@ -88,30 +112,42 @@ class DetectionEngine:
             detections=detections
         )
     
+    async def _timed(self, detector: str, coro):
+        """Await a detector coroutine, recording its duration and whether it fired"""
+        watchdog_activity = f"detector:{detector}"  # noqa: F841 - read by loop_watchdog
+        with tracer.span(f"detector.{detector}") as span:
+            start = time.perf_counter()
+            result = await coro
+            DETECTOR_DURATION.labels(detector).observe(time.perf_counter() - start)
+            if result:
+                DETECTOR_HITS.labels(detector).inc()
+                span.set_attribute("detector.hit", True)
+        return result
+    
     async def _rule_based_detection(self, log_data: Dict) -> List[Dict]:
         """Rule-based detectors: rate limits, blacklists, signatures"""
         detections = []
         
         # Rate limit check
         if DETECTOR_CONFIG['rate_limit']['enabled']:
-            rate_detection = await self._check_rate_limit(log_data)
+            rate_detection = await self._timed('rate_limit', self._check_rate_limit(log_data))
             if rate_detection:
                 detections.append(rate_detection)
         
         # IP blacklist check
         if DETECTOR_CONFIG['ip_blacklist']['enabled']:
-            blacklist_detection = await self._check_ip_blacklist(log_data)
+            blacklist_detection = await self._timed('ip_blacklist', self._check_ip_blacklist(log_data))
             if blacklist_detection:
                 detections.append(blacklist_detection)
         
         # Attack signature detection
         if DETECTOR_CONFIG['attack_signature']['enabled']:
-            signature_detections = await self._check_attack_signatures(log_data)
+            signature_detections = await self._timed('attack_signature', self._check_attack_signatures(log_data))
             detections.extend(signature_detections)
         
         # Error rate check
         if DETECTOR_CONFIG['error_rate']['enabled']:
-            error_detection = await self._check_error_rate(log_data)
+            error_detection = await self._timed('error_rate', self._check_error_rate(log_data))
             if error_detection:
                 detections.append(error_detection)
         
@@ -183,12 +219,14 @@ class DetectionEngine:
         """Check for known attack patterns"""
         detections = []
         
-        # Check endpoint and headers for attack patterns
-        text_to_check = f"{log_data.get('endpoint', '')} {str(log_data.get('headers', {}))}"
+        # Check endpoint and headers for attack patterns; ingest prepares the text
+        text_to_check = log_data.get('scan_text')
+        if text_to_check is None:
+            text_to_check = scan_text(log_data.get('endpoint', ''), normalize(log_data.get('headers')))
         
-        for attack_type, patterns in ATTACK_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, text_to_check, re.IGNORECASE):
+        for attack_type, patterns in SIGNATURES:
+            for pattern, compiled in patterns:
+                if compiled.search(text_to_check):
                     detections.append({
                         'detector': 'attack_signature',
                         'score': DETECTOR_CONFIG['attack_signature']['severity_weight'],
@@ -208,35 +246,41 @@ class DetectionEngine:
         if status_code < 400:
             return None
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        window = DETECTOR_CONFIG['error_rate']['window_seconds']
+        since = datetime.now().timestamp() - window
+        threshold = DETECTOR_CONFIG['error_rate']['threshold']
+        
+        # Count recent requests
+        if settings.TELEMETRY_STORE_ENABLED:
+            result = {'total': 0, 'errors': 0}
+            for batch in telemetry.scan([api_id], start=since, columns=['status_code']):
+                result['total'] += len(batch)
+                result['errors'] += int(np.count_nonzero(batch['status_code'] >= 400))
+        else:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT 
+                        COUNT(*) as total,
+                        SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) as errors
+                    FROM request_logs
+                    WHERE api_id = %s AND timestamp > %s AND ts_day >= %s
+                """, (api_id, since, day_of(since)))
+                result = cursor.fetchone()
+            finally:
+                cursor.close()
+                conn.close()
         
-        try:
-            window = DETECTOR_CONFIG['error_rate']['window_seconds']
-            threshold = DETECTOR_CONFIG['error_rate']['threshold']
-            
-            # Count recent requests
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total,
-                    SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) as errors
-                FROM request_logs
-                WHERE api_id = %s AND timestamp > %s
-            """, (api_id, datetime.now().timestamp() - window))
-            
-            result = cursor.fetchone()
-            if result and result['total'] > 10:  # Need minimum sample
-                error_rate = result['errors'] / result['total']
-                if error_rate > threshold:
-                    return {
-                        'detector': 'error_rate',
-                        'score': DETECTOR_CONFIG['error_rate']['severity_weight'],
-                        'reason': f'High error rate: {error_rate:.1%} (threshold: {threshold:.1%})',
-                        'metadata': {'error_rate': error_rate, 'threshold': threshold}
-                    }
-        finally:
-            cursor.close()
-            conn.close()
+        if result and result['total'] > 10:  # Need minimum sample
+            error_rate = result['errors'] / result['total']
+            if error_rate > threshold:
+                return {
+                    'detector': 'error_rate',
+                    'score': DETECTOR_CONFIG['error_rate']['severity_weight'],
+                    'reason': f'High error rate: {error_rate:.1%} (threshold: {threshold:.1%})',
+                    'metadata': {'error_rate': error_rate, 'threshold': threshold}
+                }
         
         return None
     
@@ -251,43 +295,61 @@ class DetectionEngine:
         if not latency:
             return detections
         
-        api_id = log_data['api_id']
+        latencies = self._recent_latencies(log_data['api_id'], log_data.get('endpoint_id'),
+                                           log_data.get('endpoint_template'))
+        if len(latencies) < 30:  # Need minimum sample
+            return detections
+        
+        mean = np.mean(latencies)
+        std = np.std(latencies)
+        
+        if std > 0:
+            z_score = abs((latency - mean) / std)
+            threshold = DETECTOR_CONFIG['latency_spike']['z_score_threshold']
+            
+            if z_score > threshold:
+                detections.append({
+                    'detector': 'latency_spike',
+                    'score': DETECTOR_CONFIG['latency_spike']['severity_weight'],
+                    'reason': f'Latency spike detected: {latency:.0f}ms (z-score: {z_score:.2f})',
+                    'metadata': {'latency': latency, 'mean': mean, 'z_score': z_score}
+                })
+        
+        return detections
+    
+    def _recent_latencies(self, api_id: int, endpoint_id: Optional[int], template: Optional[str]) -> List[float]:
+        """Last 100 latencies of the same route, of the whole API while the route has too few"""
+        if settings.TELEMETRY_STORE_ENABLED:
+            latencies = []
+            for endpoint in ([template] if template else []) + [None]:
+                batches = telemetry.recent(api_id, 100, ['latency_ms'], endpoint=endpoint)
+                latencies = [v for batch in batches for v in batch['latency_ms'].tolist() if v == v]
+                if len(latencies) >= settings.ROUTE_BASELINE_MIN_SAMPLES:
+                    break
+            return latencies
         
         conn = get_db_connection()
         cursor = conn.cursor()
-        
         try:
-            # Get recent latencies
-            cursor.execute("""
-                SELECT latency_ms FROM request_logs
-                WHERE api_id = %s AND latency_ms IS NOT NULL
-                ORDER BY id DESC LIMIT 100
-            """, (api_id,))
-            
-            results = cursor.fetchall()
-            if len(results) < 30:  # Need minimum sample
-                return detections
-            
-            latencies = [r['latency_ms'] for r in results]
-            mean = np.mean(latencies)
-            std = np.std(latencies)
-            
-            if std > 0:
-                z_score = abs((latency - mean) / std)
-                threshold = DETECTOR_CONFIG['latency_spike']['z_score_threshold']
-                
-                if z_score > threshold:
-                    detections.append({
-                        'detector': 'latency_spike',
-                        'score': DETECTOR_CONFIG['latency_spike']['severity_weight'],
-                        'reason': f'Latency spike detected: {latency:.0f}ms (z-score: {z_score:.2f})',
-                        'metadata': {'latency': latency, 'mean': mean, 'z_score': z_score}
-                    })
+            results = []
+            if endpoint_id is not None:
+                cursor.execute("""
+                    SELECT latency_ms FROM request_logs
+                    WHERE api_id = %s AND endpoint_id = %s AND latency_ms IS NOT NULL
+                    ORDER BY id DESC LIMIT 100
+                """, (api_id, endpoint_id))
+                results = cursor.fetchall()
+            if len(results) < settings.ROUTE_BASELINE_MIN_SAMPLES:
+                cursor.execute("""
+                    SELECT latency_ms FROM request_logs
+                    WHERE api_id = %s AND latency_ms IS NOT NULL
+                    ORDER BY id DESC LIMIT 100
+                """, (api_id,))
+                results = cursor.fetchall()
+            return [r['latency_ms'] for r in results]
         finally:
             cursor.close()
             conn.close()
-        
-        return detections
     
     async def _ml_detection(self, log_data: Dict) -> List[Dict]:
         """ML-based anomaly detection using Isolation Forest"""
@@ -330,19 +392,26 @@ class DetectionEngine:
     def _extract_features(self, log_data: Dict) -> List[float]:
         """Extract numerical features for ML model"""
         try:
+            endpoint = log_data.get('endpoint', '')
+            path, query = split_endpoint(endpoint)
+            template = log_data.get('endpoint_template') or template_path(path)
+            now = datetime.now()
             return [
                 log_data.get('latency_ms', 0),
                 log_data.get('body_size', 0),
                 1 if log_data.get('status_code', 200) >= 400 else 0,
-                len(log_data.get('endpoint', '')),
-                datetime.now().hour,  # Time of day
-                datetime.now().weekday(),  # Day of week
+                len(template),  # Route, not the raw path: ids do not look like anomalies
+                placeholder_count(template),
+                len(query or ''),
+                now.hour,  # Time of day
+                now.weekday(),  # Day of week
             ]
         except:
             return None
     
     async def _train_ml_model(self, api_id: int):
         """Train Isolation Forest model for an API"""
+        watchdog_activity = f"ml_training:{api_id}"  # noqa: F841 - read by loop_watchdog
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -350,13 +419,17 @@ class DetectionEngine:
             min_samples = DETECTOR_CONFIG['ml_anomaly']['min_samples']
             
             # Get historical normal traffic
-            cursor.execute("""
-                SELECT * FROM request_logs
-                WHERE api_id = %s AND is_suspicious = FALSE
-                ORDER BY id DESC LIMIT 1000
-            """, (api_id,))
-            
-            results = cursor.fetchall()
+            if settings.TELEMETRY_STORE_ENABLED:
+                batches = telemetry.recent(api_id, 1000, TRAINING_COLUMNS, suspicious=False)
+                # Stored endpoints are route templates already
+                results = [dict(row, endpoint_template=row['endpoint']) for batch in batches for row in batch.rows()]
+            else:
+                cursor.execute("""
+                    SELECT * FROM request_logs
+                    WHERE api_id = %s AND is_suspicious = FALSE
+                    ORDER BY id DESC LIMIT 1000
+                """, (api_id,))
+                results = decode_rows(cursor.fetchall())
             if len(results) < min_samples:
                 logger.info(f"Not enough data to train ML model for API {api_id}")
                 return
@@ -419,42 +492,44 @@ class DetectionEngine:
     
     async def _create_alert(self, log_data: Dict, detections: List[Dict], risk_score: float, severity: str):
         """Create an alert in the database"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        try:
-            title = f"{severity.upper()}: {len(detections)} threats detected"
-            description = "; ".join([d['reason'] for d in detections])
-            metadata = {'detections': detections, 'log_data': log_data}
-            
-            cursor.execute("""
-                INSERT INTO alerts (api_id, log_id, alert_type, severity, score, title, description, metadata)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                log_data['api_id'],
-                log_data.get('log_id'),
-                'multi_threat' if len(detections) > 1 else detections[0]['detector'],
-                severity,
-                risk_score,
-                title,
-                description,
-                json.dumps(metadata)
-            ))
-            conn.commit()
-            alert_id = cursor.lastrowid
-            
-            # Send alert notifications
-            await self.alert_service.send_alert(alert_id, {
-                'title': title,
-                'description': description,
-                'severity': severity,
-                'risk_score': risk_score,
-                'api_id': log_data['api_id']
-            })
+        watchdog_activity = "alert:create"  # noqa: F841 - read by loop_watchdog
+        with tracer.span("alert.create", **{"alert.severity": severity}):
+            conn = get_db_connection()
+            cursor = conn.cursor()
             
-        finally:
-            cursor.close()
-            conn.close()
+            try:
+                title = f"{severity.upper()}: {len(detections)} threats detected"
+                description = "; ".join([d['reason'] for d in detections])
+                metadata = {'detections': detections, 'log_data': log_data}
+                
+                cursor.execute(INSERT_ALERT, (
+                    log_data['api_id'],
+                    log_data.get('log_id'),
+                    log_data.get('event_id'),
+                    'multi_threat' if len(detections) > 1 else detections[0]['detector'],
+                    severity,
+                    risk_score,
+                    title,
+                    description,
+                    json.dumps(metadata)
+                ))
+                conn.commit()
+                alert_id = cursor.lastrowid
+                ALERTS_CREATED.labels(severity).inc()
+                invalidate_alerts(log_data['api_id'])
+                
+                # Send alert notifications
+                await self.alert_service.send_alert(alert_id, {
+                    'title': title,
+                    'description': description,
+                    'severity': severity,
+                    'risk_score': risk_score,
+                    'api_id': log_data['api_id']
+                })
+                
+            finally:
+                cursor.close()
+                conn.close()
     
     async def _retrain_ml_models(self):
         """Periodically retrain ML models"""
@@ -462,12 +537,15 @@ class DetectionEngine:
             try:
                 await asyncio.sleep(settings.ML_RETRAIN_INTERVAL_HOURS * 3600)
                 
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT DISTINCT api_id FROM request_logs")
-                api_ids = [row[0] for row in cursor.fetchall()]
-                cursor.close()
-                conn.close()
+                if settings.TELEMETRY_STORE_ENABLED:
+                    api_ids = sorted(telemetry.api_ids())
+                else:
+                    conn = get_db_connection()
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT DISTINCT api_id FROM request_logs")
+                    api_ids = [row['api_id'] for row in cursor.fetchall()]
+                    cursor.close()
+                    conn.close()
                 
                 for api_id in api_ids:
                     await self._train_ml_model(api_id)
@@ -0,0 +1,138 @@
+"""
+Dictionaries - Dictionary-encoded request_logs dimensions
+
+Endpoints (as templates, see endpoint_templates.py) and user agents repeat
+on almost every row, so request_logs stores small integer ids into the
+endpoints and user_agents tables instead of the strings. Ids are assigned
+on first sight and never change; each process caches both directions in an
+LRU, so ingest and readers only touch the tables for values they have not
+seen yet.
+
+Misses are resolved on a connection of their own and new values committed
+at once: an id handed out is always visible to other workers, even if the
+request that introduced it rolls back, and callers streaming a result on
+their own connection can still decode it.
+
+SQL over request_logs groups by the id column and selects the value with
+value_sql(), a lookup that runs once per group.
+"""
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from config import settings
+from database import get_db_connection
+from endpoint_templates import expand
+
+logger = logging.getLogger(__name__)
+
+
+class Dictionary:
+    def __init__(self, table: str, max_entries: int):
+        self.table = table
+        self.max_entries = max_entries
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self._values: "OrderedDict[int, str]" = OrderedDict()
+
+    def _remember(self, value: str, value_id: int):
+        for cache, key, item in ((self._ids, value, value_id), (self._values, value_id, value)):
+            cache[key] = item
+            cache.move_to_end(key)
+            if len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+    def id_for(self, value: str) -> int:
+        """Id of a value, assigned on first use"""
+        value_id = self._ids.get(value)
+        if value_id is not None:
+            self._ids.move_to_end(value)
+            return value_id
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT id FROM {self.table} WHERE value = %s", (value,))
+            row = cursor.fetchone()
+            if row:
+                value_id = row['id']
+            else:
+                # Another worker may insert the same value concurrently: both get its id
+                cursor.execute(f"""
+                    INSERT INTO {self.table} (value) VALUES (%s)
+                    ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+                """, (value,))
+                conn.commit()
+                value_id = cursor.lastrowid
+        finally:
+            cursor.close()
+            conn.close()
+
+        self._remember(value, value_id)
+        return value_id
+
+    def values(self, ids: Iterable[Optional[int]]) -> Dict[int, str]:
+        """Values of a set of ids; unknown ids are left out"""
+        wanted = {value_id for value_id in ids if value_id is not None}
+        found = {value_id: self._values[value_id] for value_id in wanted if value_id in self._values}
+        missing = sorted(wanted - found.keys())
+        if missing:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    f"SELECT id, value FROM {self.table} WHERE id IN ({', '.join(['%s'] * len(missing))})",
+                    missing
+                )
+                for row in cursor.fetchall():
+                    found[row['id']] = row['value']
+                    self._remember(row['value'], row['id'])
+            finally:
+                cursor.close()
+                conn.close()
+        return found
+
+    def clear(self):
+        self._ids.clear()
+        self._values.clear()
+
+
+endpoints = Dictionary("endpoints", settings.DICTIONARY_CACHE_ENTRIES)
+user_agents = Dictionary("user_agents", settings.DICTIONARY_CACHE_ENTRIES)
+
+# request dimension -> (dictionary, request_logs id column)
+DIMENSIONS = {
+    'endpoint': (endpoints, 'endpoint_id'),
+    'user_agent': (user_agents, 'user_agent_id'),
+}
+
+
+def id_column(dimension: str) -> str:
+    """request_logs column to filter and group a dimension by"""
+    return DIMENSIONS[dimension][1] if dimension in DIMENSIONS else dimension
+
+
+def value_sql(dimension: str) -> str:
+    """SQL expression of a dimension's value in a query over request_logs"""
+    if dimension not in DIMENSIONS:
+        return dimension
+    dictionary, column = DIMENSIONS[dimension]
+    return f"(SELECT value FROM {dictionary.table} WHERE {dictionary.table}.id = request_logs.{column})"
+
+
+def decode_rows(rows: List[dict]) -> List[dict]:
+    """Replace the dictionary ids of request_logs rows by their values
+
+    endpoint is the raw endpoint again, endpoint_template the route it was
+    stored under.
+    """
+    if not rows or 'endpoint_id' not in rows[0]:
+        return rows
+    templates = endpoints.values(row['endpoint_id'] for row in rows)
+    agents = user_agents.values(row.get('user_agent_id') for row in rows)
+    for row in rows:
+        template = templates.get(row.pop('endpoint_id'))
+        params = row.pop('endpoint_params', None)
+        row['endpoint'] = expand(template, params) if template is not None else None
+        row['endpoint_template'] = template
+        row['user_agent'] = agents.get(row.pop('user_agent_id', None))
+    return rows
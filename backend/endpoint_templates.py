@@ -0,0 +1,321 @@
+"""
+Endpoint templates - Collapse request paths into route templates
+
+/posts/1 and /posts/2 are one route: identifier-like path segments are
+replaced by placeholders (/posts/{id}) and kept aside as the request's
+parameters, so rows store a shared template plus a short parameter string
+and metrics group by route instead of by path.
+
+Templating is lossless: every {...} segment of a template is a placeholder,
+and expand() rebuilds the original endpoint from the template and the
+parameters ("/"-joined segment values, then "?" and the query string).
+
+Each API also has known route templates, matched before the segment rules:
+OpenAPI path definitions uploaded for the API, and templates learned from
+traffic. The learner watches the literal segments seen at each position of
+a route; once more than ROUTE_LEARN_THRESHOLD distinct values followed the
+same prefix (slugs, usernames), that position becomes a {param} and the
+resulting templates are stored in api_routes. Routes are compiled into a
+segment trie per API and cached for ROUTE_CACHE_SECONDS, so matching costs
+one dict lookup per path segment on the ingest path.
+"""
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from config import settings
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+MAX_LENGTH = 512
+LEARNED_PARAM = "{param}"
+
+# (placeholder, segment pattern), first match wins
+PARAMETER_SEGMENTS = [
+    ("{id}", re.compile(r"^\d+$")),
+    ("{uuid}", re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE)),
+    ("{hash}", re.compile(r"^[0-9a-f]{16,}$", re.IGNORECASE)),
+    # A literal {...} segment is kept as a parameter, so templates stay unambiguous
+    ("{param}", re.compile(r"^\{.*\}$")),
+]
+
+
+def is_placeholder(segment: str) -> bool:
+    return segment.startswith("{") and segment.endswith("}")
+
+
+def split_endpoint(endpoint: str) -> Tuple[str, Optional[str]]:
+    """(path, query string or None)"""
+    path, separator, query = endpoint.partition("?")
+    return path, query if separator else None
+
+
+def encode_params(values: List[str], query: Optional[str]) -> Optional[str]:
+    if not values and query is None:
+        return None
+    params = "/".join(values) + ("?" + query if query is not None else "")
+    return params[:MAX_LENGTH]
+
+
+def template_segments(segments: List[str]) -> Tuple[List[str], List[str]]:
+    """(template segments, parameter values) from the identifier rules"""
+    templated, values = [], []
+    for segment in segments:
+        for placeholder, pattern in PARAMETER_SEGMENTS:
+            if segment and pattern.match(segment):
+                templated.append(placeholder)
+                values.append(segment)
+                break
+        else:
+            templated.append(segment)
+    return templated, values
+
+
+def template_endpoint(endpoint: str) -> Tuple[str, Optional[str]]:
+    """(template, parameters) of a raw endpoint; parameters are None for static paths"""
+    path, query = split_endpoint(endpoint)
+    segments, values = template_segments(path.split("/"))
+    return "/".join(segments)[:MAX_LENGTH], encode_params(values, query)
+
+
+@lru_cache(maxsize=4096)
+def template_path(path: str) -> str:
+    """Template of a path from the identifier rules, cached for hot paths"""
+    return "/".join(template_segments(path.split("/"))[0])[:MAX_LENGTH]
+
+
+@lru_cache(maxsize=4096)
+def placeholder_count(template: str) -> int:
+    """Placeholder segments of a template, cached for hot paths"""
+    return sum(1 for segment in template.split("/") if is_placeholder(segment))
+
+
+def expand(template: str, params: Optional[str]) -> str:
+    """The raw endpoint of a template and its parameters"""
+    if params is None:
+        return template
+    path_params, separator, query = params.partition("?")
+    values = iter(path_params.split("/") if path_params else [])
+    segments = [
+        next(values, segment) if is_placeholder(segment) else segment
+        for segment in template.split("/")
+    ]
+    return "/".join(segments) + ("?" + query if separator else "")
+
+
+def parse_template(template: str) -> List[str]:
+    """Segments of a route template; a segment with a {param} anywhere becomes a whole placeholder"""
+    segments = []
+    for segment in template.split("/"):
+        match = re.search(r"\{[^}]*\}", segment)
+        segments.append(match.group(0) if match and not is_placeholder(segment) else segment)
+    return segments
+
+
+def openapi_templates(document: dict) -> List[str]:
+    """Route templates of an OpenAPI 3 / Swagger 2 document, prefixed with its base path"""
+    paths = document.get('paths')
+    if not isinstance(paths, dict):
+        raise ValueError("OpenAPI document has no paths")
+    base = document.get('basePath') or ""
+    servers = document.get('servers') or []
+    if not base and servers and isinstance(servers[0], dict):
+        base = urlparse(servers[0].get('url', "")).path
+    base = base.rstrip("/")
+    return ["/".join(parse_template(base + path)) for path in paths if isinstance(path, str) and path.startswith("/")]
+
+
+class _Node:
+    __slots__ = ("literals", "param", "template")
+
+    def __init__(self):
+        self.literals: Dict[str, "_Node"] = {}
+        self.param: Optional["_Node"] = None
+        self.template: Optional[str] = None
+
+
+class RouteMatcher:
+    """Segment trie of an API's route templates; literal segments win over placeholders"""
+
+    def __init__(self, templates: Iterable[str] = ()):
+        self._root = _Node()
+        for template in templates:
+            self.add(template)
+
+    def add(self, template: str):
+        node = self._root
+        for segment in parse_template(template):
+            if is_placeholder(segment):
+                node.param = node.param or _Node()
+                node = node.param
+            else:
+                node = node.literals.setdefault(segment, _Node())
+        if node.template is None:
+            node.template = template
+
+    def match(self, segments: List[str]) -> Optional[Tuple[str, List[str]]]:
+        """(template, parameter values) of the best matching route, None without one"""
+        values: List[str] = []
+        template = self._match(self._root, segments, 0, values)
+        return (template, values) if template is not None else None
+
+    def _match(self, node: _Node, segments: List[str], i: int, values: List[str]) -> Optional[str]:
+        if i == len(segments):
+            return node.template
+        segment = segments[i]
+        child = node.literals.get(segment)
+        if child is not None:
+            template = self._match(child, segments, i + 1, values)
+            if template is not None:
+                return template
+        if node.param is not None and segment:
+            values.append(segment)
+            template = self._match(node.param, segments, i + 1, values)
+            if template is not None:
+                return template
+            values.pop()
+        return None
+
+
+class _LearnerNode:
+    __slots__ = ("children", "seen", "variable")
+
+    def __init__(self):
+        self.children: Dict[str, "_LearnerNode"] = {}
+        self.seen: set = set()
+        self.variable = False
+
+    def size(self) -> int:
+        return 1 + sum(child.size() for child in self.children.values())
+
+
+class RouteLearner:
+    """Learns which route positions hold values, from the paths of one API"""
+
+    def __init__(self, threshold: int, max_nodes: int):
+        self.threshold = threshold
+        self.max_nodes = max_nodes
+        self._root = _LearnerNode()
+        self._nodes = 1
+
+    def observe(self, segments: List[str]) -> Tuple[List[str], bool]:
+        """Segments with learned positions replaced by {param}, and whether any was"""
+        node = self._root
+        result, learned = [], False
+        for segment in segments:
+            if not is_placeholder(segment) and segment and not node.variable:
+                node.seen.add(segment)
+                if len(node.seen) > self.threshold:
+                    # Too many distinct values after this prefix: it is a parameter
+                    node.variable = True
+                    self._nodes -= sum(child.size() for child in node.children.values())
+                    node.children = {}
+                    node.seen = set()
+            if node.variable and segment and not is_placeholder(segment):
+                result.append(LEARNED_PARAM)
+                learned = True
+                key = LEARNED_PARAM
+            else:
+                result.append(segment)
+                key = segment
+            child = node.children.get(key)
+            if child is None:
+                if self._nodes >= self.max_nodes:
+                    return result + segments[len(result):], learned
+                child = node.children[key] = _LearnerNode()
+                self._nodes += 1
+            node = child
+        return result, learned
+
+
+class EndpointTemplater:
+    """Per-API route matching and learning, on top of the identifier rules"""
+
+    def __init__(self, ttl: float, learn_threshold: int, max_nodes: int):
+        self.ttl = ttl
+        self.learn_threshold = learn_threshold
+        self.max_nodes = max_nodes
+        self._matchers: Dict[int, tuple] = {}
+        self._learners: Dict[int, RouteLearner] = {}
+
+    def matcher(self, api_id: int) -> RouteMatcher:
+        entry = self._matchers.get(api_id)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            # Uploaded definitions first, so they name a route when a learned template matches too
+            cursor.execute(
+                "SELECT template FROM api_routes WHERE api_id = %s ORDER BY source = 'learned', template",
+                (api_id,)
+            )
+            matcher = RouteMatcher(row['template'] for row in cursor.fetchall())
+        finally:
+            cursor.close()
+            conn.close()
+        self._matchers[api_id] = (now + self.ttl, matcher)
+        return matcher
+
+    def template(self, api_id: int, endpoint: str) -> Tuple[str, Optional[str]]:
+        """(template, parameters) of an endpoint of an API"""
+        path, query = split_endpoint(endpoint)
+        segments = path.split("/")
+        matcher = self.matcher(api_id)
+        matched = matcher.match(segments)
+        if matched is None:
+            templated, _ = template_segments(segments)
+            learner = self._learners.get(api_id)
+            if learner is None:
+                learner = self._learners[api_id] = RouteLearner(self.learn_threshold, self.max_nodes)
+            templated, learned = learner.observe(templated)
+            template = "/".join(templated)[:MAX_LENGTH]
+            if learned:
+                self._remember(api_id, template, matcher)
+            matched = matcher.match(segments) if learned else None
+            if matched is None:
+                values = [segment for segment, part in zip(segments, templated) if is_placeholder(part)]
+                return template, encode_params(values, query)
+        template, values = matched
+        return template, encode_params(values, query)
+
+    def lookup(self, api_id: int, endpoint: str) -> Tuple[str, Optional[str]]:
+        """(template, parameters) ingest stores for an endpoint, without learning from it"""
+        path, query = split_endpoint(endpoint)
+        matched = self.matcher(api_id).match(path.split("/"))
+        if matched is None:
+            return template_endpoint(endpoint)
+        template, values = matched
+        return template, encode_params(values, query)
+
+    def _remember(self, api_id: int, template: str, matcher: RouteMatcher):
+        """Add a learned template to the API's routes, here and for the other workers"""
+        matcher.add(template)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT IGNORE INTO api_routes (api_id, template, source) VALUES (%s, %s, 'learned')",
+                (api_id, template)
+            )
+            conn.commit()
+            logger.info(f"Learned route {template} of API {api_id}")
+        except Exception as e:
+            logger.error(f"Failed to store learned route {template}: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+
+    def invalidate(self, api_id: int):
+        self._matchers.pop(api_id, None)
+        self._learners.pop(api_id, None)
+
+
+templater = EndpointTemplater(
+    settings.ROUTE_CACHE_SECONDS, settings.ROUTE_LEARN_THRESHOLD, settings.ROUTE_LEARN_MAX_NODES
+)
@@ -0,0 +1,220 @@
+"""
+Exports - Streaming encoders for request log exports
+
+Rows are read in batches through an unbuffered server-side cursor and
+encoded chunk by chunk, optionally gzipped on the fly, so memory stays flat
+whatever the size of the export. The generators are synchronous: Starlette
+iterates them in its threadpool, off the event loop.
+
+Parquet and Arrow IPC exports (pyarrow required) are written one record
+batch per row batch, with low-cardinality columns dictionary-encoded, so
+pandas loads them as categoricals without parsing text.
+"""
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # columnar exports are unavailable without pyarrow
+    pa = pq = None
+
+from config import settings
+from database import get_db_connection, InstrumentedStreamingCursor
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+# request_logs columns in columnar exports; True marks dictionary-encoded columns
+LOG_COLUMNS = [
+    ('id', 'int64', False),
+    ('api_id', 'int32', False),
+    ('timestamp', 'float64', False),
+    ('method', 'string', True),
+    ('endpoint', 'string', True),
+    ('endpoint_template', 'string', True),
+    ('client_ip', 'string', True),
+    ('status_code', 'int32', True),
+    ('latency_ms', 'float32', False),
+    ('headers', 'string', False),
+    ('body_size', 'int32', False),
+    ('user_agent', 'string', True),
+    ('geo_country', 'string', True),
+    ('geo_city', 'string', True),
+    ('is_suspicious', 'bool', False),
+    ('created_at', 'timestamp_s', False),
+]
+
+Batches = Iterable[List[dict]]
+
+
+def stream_rows(sql: str, params: list, batch_rows: int = None) -> Iterator[List[dict]]:
+    """Batches of rows of a query, read from the server as they are consumed"""
+    batch_rows = batch_rows or settings.EXPORT_BATCH_ROWS
+    conn = get_db_connection(read_only=True)
+    try:
+        cursor = conn.cursor(InstrumentedStreamingCursor)
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            yield rows
+    except Exception as e:
+        logger.error(f"Export query failed: {e}")
+        raise
+    finally:
+        # Closing the connection (not the cursor) skips reading the rest of an
+        # abandoned result, e.g. when the client disconnects mid-download
+        conn.close()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode(errors="replace")
+    return str(value)
+
+
+def _dumps(row: dict) -> str:
+    return json.dumps(row, default=_json_default, separators=(",", ":"))
+
+
+def encode_csv(batches: Batches) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = None
+    for rows in batches:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode_ndjson(batches: Batches) -> Iterator[bytes]:
+    for rows in batches:
+        yield "".join(_dumps(row) + "\n" for row in rows).encode()
+
+
+def encode_json(batches: Batches) -> Iterator[bytes]:
+    """{"logs": [...]}, the shape of the former non-streaming JSON export"""
+    yield b'{"logs":['
+    separator = ""
+    for rows in batches:
+        yield (separator + ",".join(_dumps(row) for row in rows)).encode()
+        separator = ","
+    yield b"]}"
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = None) -> Iterator[bytes]:
+    compressor = zlib.compressobj(
+        settings.EXPORT_GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31  # 31: gzip container
+    )
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+def _arrow_type(name: str):
+    return pa.timestamp('s') if name == 'timestamp_s' else pa.type_for_alias(name)
+
+
+def log_schema():
+    return pa.schema([
+        pa.field(name, pa.dictionary(pa.int32(), _arrow_type(kind)) if encoded else _arrow_type(kind))
+        for name, kind, encoded in LOG_COLUMNS
+    ])
+
+
+def record_batch(rows: List[dict], schema) -> "pa.RecordBatch":
+    arrays = []
+    for name, kind, encoded in LOG_COLUMNS:
+        values = [row.get(name) for row in rows]
+        if kind == 'bool':
+            # MySQL BOOLEAN columns come back as 0/1
+            values = [bool(value) if value is not None else None for value in values]
+        array = pa.array(values, type=_arrow_type(kind))
+        arrays.append(array.dictionary_encode() if encoded else array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def encode_parquet(batches: Batches) -> Iterator[bytes]:
+    """One row group per batch; the footer is written when the stream ends"""
+    schema = log_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in batches:
+            writer.write_batch(record_batch(rows, schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def encode_arrow(batches: Batches) -> Iterator[bytes]:
+    """Arrow IPC stream format, readable with pyarrow.ipc.open_stream"""
+    schema = log_schema()
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for rows in batches:
+            writer.write_batch(record_batch(rows, schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# format -> (encoder, media type, file extension)
+ENCODERS: Dict[str, Tuple[Callable[[Batches], Iterator[bytes]], str, str]] = {
+    'csv': (encode_csv, "text/csv", "csv"),
+    'ndjson': (encode_ndjson, "application/x-ndjson", "ndjson"),
+    'json': (encode_json, "application/json", "json"),
+    'parquet': (encode_parquet, "application/vnd.apache.parquet", "parquet"),
+    'arrow': (encode_arrow, "application/vnd.apache.arrow.stream", "arrows"),
+}
@@ -0,0 +1,163 @@
+"""
+Header policy - What of a request's headers is stored, and how
+
+Clients send every header they saw (the demo app forwards cookies and
+authorization tokens), which bloats request_logs and keeps secrets around.
+Each API has a capture policy:
+    allow_list       header names to keep ('x-*' matches a prefix); empty keeps all
+    sensitive        header names whose values are replaced by a keyed hash
+    max_value_bytes  longer values are truncated
+    max_total_bytes  headers past this budget are dropped
+    compress         store the JSON zlib-compressed in headers_compressed
+
+NULL columns of header_policies use the HEADER_* defaults. Hashes are
+HMAC-SHA256 prefixes, so equal values still correlate across requests
+without the value being recoverable.
+
+Headers are normalized once at ingest (lowercase names, string values,
+sorted); detection scans the normalized headers before the policy applies,
+so truncation and hashing never hide an attack.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('allow_list', 'sensitive', 'max_value_bytes', 'max_total_bytes', 'compress')
+LIST_FIELDS = ('allow_list', 'sensitive')
+HASH_PREFIX = "hmac:"
+
+
+def header_names(value) -> List[str]:
+    """Header names from a comma separated string or a list, lowercased"""
+    if isinstance(value, str):
+        value = value.split(",")
+    return [name.strip().lower() for name in value or () if name.strip()]
+
+
+def default_policy() -> Dict[str, Any]:
+    return {
+        'allow_list': header_names(settings.HEADER_ALLOW_LIST),
+        'sensitive': header_names(settings.HEADER_SENSITIVE),
+        'max_value_bytes': settings.HEADER_MAX_VALUE_BYTES,
+        'max_total_bytes': settings.HEADER_MAX_TOTAL_BYTES,
+        'compress': settings.HEADER_COMPRESS,
+    }
+
+
+def effective_policy(row: Optional[dict]) -> Dict[str, Any]:
+    """Per-API overrides on top of the defaults"""
+    policy = default_policy()
+    for field in FIELDS:
+        if row and row.get(field) is not None:
+            value = row[field]
+            if field in LIST_FIELDS:
+                policy[field] = header_names(value)
+            elif field == 'compress':
+                policy[field] = bool(value)
+            else:
+                policy[field] = int(value)
+    return policy
+
+
+def normalize(headers: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Lowercase names and string values, sorted by name"""
+    if not headers:
+        return {}
+    normalized = {}
+    for name, value in headers.items():
+        if isinstance(value, (list, tuple)):
+            value = ", ".join(str(v) for v in value)
+        normalized[str(name).lower()] = "" if value is None else str(value)
+    return dict(sorted(normalized.items()))
+
+
+def scan_text(endpoint: str, headers: Dict[str, str]) -> str:
+    """Endpoint and normalized headers as the text attack signatures are matched against"""
+    return "\n".join([endpoint or ""] + [f"{name}: {value}" for name, value in headers.items()])
+
+
+def _allowed(name: str, allow_list: List[str]) -> bool:
+    if not allow_list:
+        return True
+    return any(name.startswith(entry[:-1]) if entry.endswith("*") else name == entry for entry in allow_list)
+
+
+def _hash(value: str) -> str:
+    key = (settings.HEADER_HASH_KEY or settings.JWT_SECRET).encode()
+    return HASH_PREFIX + hmac.new(key, value.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def _truncate(value: str, max_bytes: int) -> str:
+    encoded = value.encode()
+    if max_bytes <= 0 or len(encoded) <= max_bytes:
+        return value
+    return encoded[:max_bytes].decode(errors="ignore")
+
+
+def capture(headers: Dict[str, str], policy: Dict[str, Any]) -> Dict[str, str]:
+    """The normalized headers a policy keeps"""
+    captured = {}
+    total = 0
+    for name, value in headers.items():
+        if not _allowed(name, policy['allow_list']):
+            continue
+        if name in policy['sensitive']:
+            value = _hash(value)
+        else:
+            value = _truncate(value, policy['max_value_bytes'])
+        size = len(name) + len(value.encode())
+        if policy['max_total_bytes'] > 0 and total + size > policy['max_total_bytes']:
+            continue
+        captured[name] = value
+        total += size
+    return captured
+
+
+def encode(headers: Dict[str, str], policy: Dict[str, Any]) -> Tuple[Optional[str], Optional[bytes]]:
+    """(headers, headers_compressed) column values; at most one is set"""
+    if not headers:
+        return None, None
+    document = json.dumps(headers, separators=(",", ":"))
+    if policy['compress'] and len(document) >= settings.HEADER_COMPRESS_MIN_BYTES:
+        return None, zlib.compress(document.encode(), settings.HEADER_COMPRESS_LEVEL)
+    return document, None
+
+
+def inflate(row: dict) -> dict:
+    """Put compressed headers of a request_logs row back into its headers column"""
+    compressed = row.pop('headers_compressed', None)
+    if compressed is not None:
+        row['headers'] = zlib.decompress(compressed).decode()
+    return row
+
+
+class PolicyCache:
+    """Effective policies per API, re-read after ttl seconds (ingest looks one up per request)"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[int, tuple] = {}
+
+    def get(self, cursor, api_id: int) -> Dict[str, Any]:
+        entry = self._entries.get(api_id)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+        cursor.execute("SELECT * FROM header_policies WHERE api_id = %s", (api_id,))
+        policy = effective_policy(cursor.fetchone())
+        self._entries[api_id] = (now + self.ttl, policy)
+        return policy
+
+    def invalidate(self, api_id: int):
+        self._entries.pop(api_id, None)
+
+
+policies = PolicyCache(settings.HEADER_POLICY_CACHE_SECONDS)
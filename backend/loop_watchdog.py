@@ -0,0 +1,161 @@
+"""
+Event loop watchdog - Measures asyncio loop lag and catches blocking calls
+
+A heartbeat task on the event loop records when it last ran. A daemon thread
+checks the heartbeat; when the loop has not come back for longer than the
+stall threshold, the thread captures the loop thread's current stack and the
+route/detector that was running, so blocking pymysql or scikit-learn calls
+inside async code can be found in production.
+
+Code that wants to be attributed in stall reports assigns a local variable
+named ``watchdog_activity`` (e.g. ``"detector:ip_blacklist"``); the watchdog
+collects these from the frames on the blocked stack.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import settings
+from monitoring import EVENT_LOOP_LAG, EVENT_LOOP_LAG_HISTOGRAM, Counter
+
+logger = logging.getLogger(__name__)
+
+LOOP_STALLS = Counter(
+    "boing_event_loop_stalls_total", "Event loop stalls longer than the watchdog threshold"
+)
+
+ACTIVITY_LOCAL = "watchdog_activity"
+
+
+class ActivityMiddleware:
+    """ASGI middleware that tags the running route for stall reports"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        watchdog_activity = f"route:{scope.get('method', 'WS')} {scope.get('path', '')}"  # noqa: F841
+        return await self.app(scope, receive, send)
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, history: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = deque(maxlen=history)
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._current_stall: Optional[Dict] = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the heartbeat on the running loop and the monitoring thread"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Event loop watchdog started (threshold {self.threshold * 1000:.0f}ms)"
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        """Record loop wake-ups and the lag between expected and actual wake-up"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._last_beat = time.monotonic()
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.set(lag)
+            EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+    def _watch(self):
+        """Watchdog thread: detect stalls and capture the blocking stack"""
+        poll = self.interval / 2
+        while not self._stop.wait(poll):
+            now = time.monotonic()
+            silent_for = now - self._last_beat - self.interval
+            stall = self._current_stall
+
+            if silent_for > self.threshold and stall is None:
+                self._current_stall = self._capture(silent_for)
+            elif stall is not None and self._last_beat > stall['_beat']:
+                stall['duration_ms'] = round((self._last_beat - stall['_beat']) * 1000, 1)
+                stall['resolved'] = True
+                self._current_stall = None
+                logger.warning(
+                    f"Event loop blocked for {stall['duration_ms']:.0f}ms "
+                    f"in {', '.join(stall['activity']) or 'unknown activity'}"
+                )
+
+    def _capture(self, silent_for: float) -> Dict:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        stall = {
+            'detected_at': datetime.now().isoformat(timespec="milliseconds"),
+            'duration_ms': round(silent_for * 1000, 1),
+            'resolved': False,
+            'activity': self._activity(frame),
+            'stack': [line.rstrip() for line in stack],
+            '_beat': self._last_beat,
+        }
+        self.stalls.append(stall)
+        LOOP_STALLS.inc()
+        logger.warning(
+            f"Event loop stalled for {silent_for * 1000:.0f}ms "
+            f"in {', '.join(stall['activity']) or 'unknown activity'}; stack:\n"
+            + "".join(stack[-15:])
+        )
+        return stall
+
+    @staticmethod
+    def _activity(frame) -> List[str]:
+        """Collect watchdog_activity tags from the blocked stack, outermost first"""
+        activity = []
+        while frame is not None:
+            tag = frame.f_locals.get(ACTIVITY_LOCAL)
+            if tag:
+                activity.append(tag)
+            frame = frame.f_back
+        return list(reversed(activity))
+
+    def snapshot(self) -> Dict:
+        """Current lag and recent stalls for the debug endpoint"""
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'interval_ms': self.interval * 1000,
+            'last_lag_ms': round(self.last_lag * 1000, 2),
+            'max_lag_ms': round(self.max_lag * 1000, 2),
+            'stalled_now': self._current_stall is not None,
+            'stalls': [
+                {k: v for k, v in stall.items() if not k.startswith('_')}
+                for stall in reversed(self.stalls)
+            ]
+        }
+
+
+watchdog = LoopWatchdog(
+    interval=settings.LOOP_WATCHDOG_INTERVAL_MS / 1000,
+    threshold=settings.LOOP_STALL_THRESHOLD_MS / 1000
+)
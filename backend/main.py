@@ -4,15 +4,23 @@ Main FastAPI application entry point
 """
 import asyncio
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
 from config import settings
-from database import init_db, close_db
+from database import init_db, close_db, check_db, replicas
 from routes import auth, apis, ingest, alerts, metrics, admin, profile
 from detection_engine import DetectionEngine
 from alert_service import AlertService
+from monitoring import render_prometheus, WEBSOCKET_CLIENTS, WEBSOCKET_MESSAGES, WEBSOCKET_SEND_FAILURES
+from loop_watchdog import watchdog, ActivityMiddleware
+from tracing import otlp_exporter
+from rollups import aggregator as rollup_aggregator
+from partitions import manager as partition_manager
+from retention import job as retention_job
+from telemetry_store import store as telemetry_store
 
 # Configure logging
 logging.basicConfig(
@@ -25,6 +33,7 @@ logger = logging.getLogger(__name__)
 detection_engine = None
 alert_service = None
 websocket_connections = set()
+WEBSOCKET_CLIENTS.set_function(lambda: len(websocket_connections))
 
 
 @asynccontextmanager
@@ -47,6 +56,20 @@ async def lifespan(app: FastAPI):
     
     # Start background tasks
     asyncio.create_task(detection_engine.start())
+    if settings.LOOP_WATCHDOG_ENABLED:
+        watchdog.start()
+    if otlp_exporter:
+        span_export = asyncio.create_task(otlp_exporter.run())
+    if settings.ROLLUPS_ENABLED:
+        await rollup_aggregator.start()
+    if settings.PARTITIONING_ENABLED and settings.DB_BACKEND == "mysql":
+        await partition_manager.start()
+    if settings.RETENTION_ENABLED:
+        await retention_job.start()
+    if settings.TELEMETRY_STORE_ENABLED:
+        await telemetry_store.start()
+    if replicas.pools and settings.DB_BACKEND == "mysql":
+        await replicas.start()
     
     logger.info("Boing is ready!")
     
@@ -54,6 +77,20 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Boing...")
+    watchdog.stop()
+    if otlp_exporter:
+        span_export.cancel()
+        await otlp_exporter.flush()
+    if settings.ROLLUPS_ENABLED:
+        await rollup_aggregator.stop()
+    if settings.PARTITIONING_ENABLED and settings.DB_BACKEND == "mysql":
+        await partition_manager.stop()
+    if settings.RETENTION_ENABLED:
+        await retention_job.stop()
+    if settings.TELEMETRY_STORE_ENABLED:
+        await telemetry_store.stop()
+    if replicas.pools and settings.DB_BACKEND == "mysql":
+        await replicas.stop()
     if detection_engine:
         await detection_engine.stop()
     close_db()
@@ -75,8 +112,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Tag requests so event loop stalls can be attributed to a route
+app.add_middleware(ActivityMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api", tags=["Authentication"])
 app.include_router(profile.router, prefix="/api", tags=["Profile"])
@@ -100,14 +141,21 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
+    database_ok = await asyncio.to_thread(check_db)
     return {
-        "status": "healthy",
-        "database": "connected",
+        "status": "healthy" if database_ok else "degraded",
+        "database": "connected" if database_ok else "unreachable",
         "detection_engine": "running" if detection_engine else "stopped",
         "alert_service": "running" if alert_service else "stopped"
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Boing's own performance metrics in Prometheus text format"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.websocket("/ws/live")
 async def websocket_live_feed(websocket: WebSocket):
     """WebSocket endpoint for live activity feed"""
@@ -130,9 +178,11 @@ async def broadcast_to_websockets(message: dict):
     for ws in websocket_connections:
         try:
             await ws.send_json(message)
+            WEBSOCKET_MESSAGES.inc()
             logger.info(f"Broadcasted message to WebSocket: {message.get('type')}")
         except Exception as e:
             logger.error(f"Error broadcasting to WebSocket: {e}")
+            WEBSOCKET_SEND_FAILURES.inc()
             disconnected.add(ws)
     
     # Clean up disconnected clients
@@ -0,0 +1,151 @@
+"""
+Migrate - Versioned schema migrations
+
+schema.sql creates a new database at the latest schema; the numbered files in
+migrations/ (NNN_description.sql) bring existing databases up to it. Applied
+versions are recorded in schema_migrations.
+
+MySQL DDL commits implicitly, so a migration that fails half-way is re-run
+from its first statement. Statements that would only repeat work already done
+(adding an index or column that exists, dropping one that does not) are
+skipped, and so are data copies from a column the migration drops later on,
+which keeps migrations re-runnable and harmless on databases created
+from the current schema.sql.
+
+On the SQLite backend, init_db() creates new databases from schema.sql and
+records every migration present; later migrations run through the dialect
+translation of sql_dialect.py.
+
+Usage:
+    python migrate.py           # apply pending migrations
+    python migrate.py status    # list applied and pending migrations
+"""
+import logging
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import List, NamedTuple
+
+import pymysql
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+# MySQL errors meaning the statement's change is already in place
+ALREADY_APPLIED = {
+    1050,  # table already exists
+    1060,  # duplicate column name
+    1054,  # unknown column: copying from a column a later statement already dropped
+    1061,  # duplicate key name
+    1091,  # can't drop: column/key does not exist
+}
+# The same for the SQLite backend, which reports them by message
+ALREADY_APPLIED_MESSAGES = ("already exists", "duplicate column name")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: List[str]
+
+
+def split_statements(sql: str) -> List[str]:
+    """Statements of a migration file; -- comments are dropped, ';' ends a statement"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = re.match(r"^(\d+)_(.+)\.sql$", path.name)
+        if not match:
+            raise ValueError(f"Migration file {path.name} must be named NNN_description.sql")
+        migrations.append(Migration(int(match.group(1)), match.group(2), split_statements(path.read_text())))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError("Duplicate migration versions")
+    return migrations
+
+
+def _applied_versions(cursor) -> set:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def _execute(cursor, statement: str):
+    try:
+        cursor.execute(statement)
+    except pymysql.MySQLError as e:
+        if e.args and e.args[0] in ALREADY_APPLIED:
+            logger.info(f"Skipped (already applied): {' '.join(statement.split())[:120]}")
+            return
+        raise
+    except sqlite3.OperationalError as e:
+        if any(message in str(e) for message in ALREADY_APPLIED_MESSAGES):
+            logger.info(f"Skipped (already applied): {' '.join(statement.split())[:120]}")
+            return
+        raise
+
+
+def migrate(migrations: List[Migration] = None) -> List[int]:
+    """Apply pending migrations in version order; returns the versions applied"""
+    migrations = load_migrations() if migrations is None else migrations
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    done = []
+
+    try:
+        applied = _applied_versions(cursor)
+        for migration in sorted(migrations):
+            if migration.version in applied:
+                continue
+            logger.info(f"Applying migration {migration.version:03d}_{migration.name}")
+            for statement in migration.statements:
+                _execute(cursor, statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (migration.version, migration.name)
+            )
+            conn.commit()
+            done.append(migration.version)
+        return done
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def status() -> List[tuple]:
+    """(version, name, applied) of every migration"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        applied = _applied_versions(cursor)
+        return [(m.version, m.name, m.version in applied) for m in load_migrations()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        for version, name, applied in status():
+            print(f"{version:03d}_{name}: {'applied' if applied else 'pending'}")
+    elif len(sys.argv) == 1:
+        print(f"Applied: {migrate() or 'nothing to do'}")
+    else:
+        print("Usage: python migrate.py [status]")
+        sys.exit(1)
@@ -0,0 +1,23 @@
+-- Composite indexes matching the query shapes: every request_logs and alerts
+-- query filters by api_id and then a time range, or orders by id/created_at.
+-- New indexes are added before the ones they replace are dropped, so foreign
+-- keys always have an index to use.
+
+-- request_logs: dashboard/log queries, suspicious-only listings, recent latencies
+ALTER TABLE request_logs ADD INDEX idx_api_timestamp (api_id, timestamp);
+ALTER TABLE request_logs ADD INDEX idx_api_suspicious_timestamp (api_id, is_suspicious, timestamp);
+ALTER TABLE request_logs ADD INDEX idx_api_id_latency (api_id, id, latency_ms);
+ALTER TABLE request_logs DROP INDEX idx_api_id;
+ALTER TABLE request_logs DROP INDEX idx_is_suspicious;
+
+-- alerts: listings and stats per API, newest first
+ALTER TABLE alerts ADD INDEX idx_api_created (api_id, created_at);
+ALTER TABLE alerts ADD INDEX idx_log_id (log_id);
+ALTER TABLE alerts DROP INDEX idx_api_id;
+
+-- Duplicates of UNIQUE keys
+ALTER TABLE users DROP INDEX idx_email;
+ALTER TABLE apis DROP INDEX idx_api_key;
+ALTER TABLE detector_configs DROP INDEX idx_api_id;
+ALTER TABLE ip_blacklist DROP INDEX idx_ip_address;
+ALTER TABLE ip_whitelist DROP INDEX idx_ip_address;
@@ -0,0 +1,15 @@
+-- Selective header capture: compressed header documents and per-API capture
+-- policies (see header_policy.py)
+
+ALTER TABLE request_logs ADD COLUMN headers_compressed BLOB AFTER headers;
+
+CREATE TABLE IF NOT EXISTS header_policies (
+    api_id INT PRIMARY KEY,
+    allow_list TEXT,
+    sensitive TEXT,
+    max_value_bytes INT,
+    max_total_bytes INT,
+    compress BOOLEAN,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
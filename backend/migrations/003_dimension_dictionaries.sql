@@ -0,0 +1,35 @@
+-- Dictionary-encoded endpoints and user agents (see dictionaries.py):
+-- request_logs stores ids into endpoints / user_agents instead of the strings.
+-- Existing rows keep their raw endpoint as their template; only rows ingested
+-- from now on are templated. The backfill rewrites every row: run it in a
+-- quiet period.
+
+CREATE TABLE IF NOT EXISTS endpoints (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(512) COLLATE utf8mb4_bin NOT NULL,
+    UNIQUE KEY uq_value (value)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS user_agents (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(512) COLLATE utf8mb4_bin NOT NULL,
+    UNIQUE KEY uq_value (value)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+ALTER TABLE request_logs ADD COLUMN endpoint_id INT AFTER method;
+ALTER TABLE request_logs ADD COLUMN endpoint_params VARCHAR(512) AFTER endpoint_id;
+ALTER TABLE request_logs ADD COLUMN user_agent_id INT AFTER body_size;
+
+INSERT IGNORE INTO endpoints (value)
+SELECT DISTINCT endpoint COLLATE utf8mb4_bin FROM request_logs;
+INSERT IGNORE INTO user_agents (value)
+SELECT DISTINCT user_agent COLLATE utf8mb4_bin FROM request_logs WHERE user_agent IS NOT NULL;
+
+UPDATE request_logs l JOIN endpoints e ON e.value = l.endpoint COLLATE utf8mb4_bin
+SET l.endpoint_id = e.id WHERE l.endpoint_id IS NULL;
+UPDATE request_logs l JOIN user_agents u ON u.value = l.user_agent COLLATE utf8mb4_bin
+SET l.user_agent_id = u.id WHERE l.user_agent_id IS NULL;
+
+ALTER TABLE request_logs MODIFY endpoint_id INT NOT NULL;
+ALTER TABLE request_logs DROP COLUMN endpoint;
+ALTER TABLE request_logs DROP COLUMN user_agent;
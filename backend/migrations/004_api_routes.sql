@@ -0,0 +1,13 @@
+-- Route templates per API (see endpoint_templates.py) and the index of the
+-- per-route latency baselines
+
+CREATE TABLE IF NOT EXISTS api_routes (
+    api_id INT NOT NULL,
+    template VARCHAR(512) COLLATE utf8mb4_bin NOT NULL,
+    source VARCHAR(10) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (api_id, template),
+    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+ALTER TABLE request_logs ADD INDEX idx_api_endpoint_id_latency (api_id, endpoint_id, id, latency_ms);
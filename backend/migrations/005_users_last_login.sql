@@ -0,0 +1,3 @@
+-- Login records the time of the last sign-in (routes/auth.py)
+
+ALTER TABLE users ADD COLUMN last_login TIMESTAMP NULL;
@@ -0,0 +1,4 @@
+-- Alerts of requests kept in the telemetry store reference them by event id
+-- (segment << 32 | row, see telemetry_store.py), apart from request_logs ids
+
+ALTER TABLE alerts ADD COLUMN event_id BIGINT NULL;
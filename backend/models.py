@@ -68,6 +68,45 @@ class APIResponse(BaseModel):
     created_at: datetime
 
 
+class RetentionPolicy(BaseModel):
+    headers_days: Optional[int] = Field(default=None, ge=0)  # None uses the server default, 0 keeps forever
+    raw_days: Optional[int] = Field(default=None, ge=0)
+    suspicious_days: Optional[int] = Field(default=None, ge=0)
+    alert_days: Optional[int] = Field(default=None, ge=0)
+
+
+class RetentionPolicyResponse(BaseModel):
+    api_id: int
+    overrides: RetentionPolicy
+    effective: Dict[str, int]
+
+
+class HeaderPolicy(BaseModel):
+    # None uses the server default; an empty allow_list keeps every header
+    allow_list: Optional[List[str]] = None
+    sensitive: Optional[List[str]] = None
+    max_value_bytes: Optional[int] = Field(default=None, ge=0)  # 0: no limit
+    max_total_bytes: Optional[int] = Field(default=None, ge=0)
+    compress: Optional[bool] = None
+
+
+class HeaderPolicyResponse(BaseModel):
+    api_id: int
+    overrides: HeaderPolicy
+    effective: Dict[str, Any]
+
+
+class RouteDefinitions(BaseModel):
+    # Route templates of an API: an OpenAPI document or a plain list, e.g. /products/{id}
+    openapi: Optional[Dict[str, Any]] = None
+    templates: Optional[List[str]] = None
+
+
+class RouteResponse(BaseModel):
+    template: str
+    source: str  # openapi or learned
+
+
 # Ingestion models
 class RequestLog(BaseModel):
     api_key: str
@@ -117,7 +156,9 @@ class MetricsQuery(BaseModel):
     api_id: Optional[int] = None
     start_time: Optional[float] = None
     end_time: Optional[float] = None
-    interval: Optional[str] = "hour"  # minute, hour, day
+    interval: Optional[str] = "hour"  # minute, hour, day or a width such as 10s, 5m, 6h
+    timezone: str = "UTC"  # IANA name used to align and label time buckets
+    exact: bool = False  # exact unique_ips and top lists instead of sketch estimates
 
 
 class MetricsResponse(BaseModel):
@@ -125,10 +166,16 @@ class MetricsResponse(BaseModel):
     error_rate: float
     avg_latency_ms: float
     unique_ips: int
+    unique_ips_exact: bool = True
+    unique_ips_error: float = 0.0  # relative standard error of unique_ips (~1.6% when estimated)
     suspicious_requests: int
     alerts_count: int
-    top_endpoints: List[Dict[str, Any]]
+    top_endpoints: List[Dict[str, Any]]  # count may overestimate by up to error
+    top_client_ips: List[Dict[str, Any]] = []
+    top_user_agents: List[Dict[str, Any]] = []
     requests_over_time: List[Dict[str, Any]]
+    latency_percentiles: Dict[str, Optional[float]] = {}  # p50/p95/p99 ms, within 1% relative error
+    latency_over_time: List[Dict[str, Any]] = []
 
 
 # Admin models
@@ -159,6 +206,15 @@ class AuditLogResponse(BaseModel):
 class ExportFormat(str, Enum):
     csv = "csv"
     json = "json"
+    ndjson = "ndjson"
+    parquet = "parquet"
+    arrow = "arrow"  # Arrow IPC stream
+
+
+class TotalMode(str, Enum):
+    exact = "exact"          # COUNT(*) over every matching row
+    estimate = "estimate"    # optimizer row estimate, much cheaper on large tables (MySQL only, None on SQLite)
+    none = "none"
 
 
 class LogQuery(BaseModel):
@@ -167,8 +223,15 @@ class LogQuery(BaseModel):
     end_time: Optional[float] = None
     client_ip: Optional[str] = None
     endpoint: Optional[str] = None
+    route: Optional[str] = None  # exact route template, e.g. /products/{id}
     min_status: Optional[int] = None
     max_status: Optional[int] = None
     suspicious_only: bool = False
     limit: int = Field(default=100, le=10000)
     offset: int = 0
+    cursor: Optional[str] = None  # next_cursor of the previous page; offset is ignored when set
+    total: TotalMode = TotalMode.exact
+
+
+class LogExportQuery(LogQuery):
+    limit: Optional[int] = Field(default=None, ge=1)  # None exports every matching row
@@ -0,0 +1,261 @@
+"""
+Monitoring - Boing's own performance metrics in Prometheus text format
+
+Counters, gauges and histograms here are deliberately lock-free: updates are
+plain attribute increments, which is safe on the event loop thread and
+"good enough" for monitoring when the occasional update comes from a worker
+thread. Label children are created once and cached, so the hot path is a
+dict lookup plus an add.
+"""
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    kind = ""
+    child_class = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+    child_class = _CounterChild
+
+    def inc(self, amount: float = 1.0):
+        self._default.value += amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self._function = None
+        super().__init__(name, documentation, labelnames)
+
+    def set(self, value: float):
+        self._default.value = value
+
+    def inc(self, amount: float = 1.0):
+        self._default.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self._default.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the (unlabelled) value at scrape time instead of on the hot path"""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                self._default.value = float(self._function())
+            except Exception as e:
+                logger.error(f"Error collecting gauge {self.name}: {e}")
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_prometheus() -> str:
+    """Render every registered metric in Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# Ingestion
+INGEST_REQUESTS = Counter(
+    "boing_ingest_requests_total", "Telemetry records received by /api/ingest", ["outcome"]
+)
+INGEST_LATENCY = Histogram(
+    "boing_ingest_duration_seconds", "Time spent handling one /api/ingest call"
+)
+INGEST_IN_FLIGHT = Gauge(
+    "boing_ingest_in_flight", "Ingest calls currently being processed (the ingest queue depth)"
+)
+
+# Detection
+DETECTOR_DURATION = Histogram(
+    "boing_detector_duration_seconds", "Time spent in each detector per request", ["detector"]
+)
+DETECTOR_HITS = Counter(
+    "boing_detector_hits_total", "Requests flagged by each detector", ["detector"]
+)
+ALERTS_CREATED = Counter(
+    "boing_alerts_created_total", "Alerts created by the detection engine", ["severity"]
+)
+
+# Database
+DB_QUERIES = Counter(
+    "boing_db_queries_total", "SQL statements executed", ["status"]
+)
+DB_QUERY_DURATION = Histogram(
+    "boing_db_query_duration_seconds", "SQL statement execution time"
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    "boing_db_connections_open", "Database connections currently open"
+)
+DB_CONNECTIONS_OPENED = Counter(
+    "boing_db_connections_opened_total", "Database connections opened"
+)
+DB_READS = Counter(
+    "boing_db_routed_reads_total", "Read-only connections handed out, by server role", ["target"]
+)
+DB_REPLICA_LAG = Gauge(
+    "boing_db_replica_lag_seconds", "Replication lag of each read replica (-1: down or not replicating)", ["replica"]
+)
+
+# WebSocket live feed
+WEBSOCKET_CLIENTS = Gauge(
+    "boing_websocket_clients", "Connected live feed WebSocket clients"
+)
+WEBSOCKET_MESSAGES = Counter(
+    "boing_websocket_messages_sent_total", "Messages delivered to WebSocket clients"
+)
+WEBSOCKET_SEND_FAILURES = Counter(
+    "boing_websocket_send_failures_total", "Failed WebSocket sends (client dropped)"
+)
+
+# Alert notifications
+ALERT_NOTIFICATIONS = Counter(
+    "boing_alert_notifications_total", "Alert notification attempts", ["channel", "status"]
+)
+
+# Event loop
+EVENT_LOOP_LAG = Gauge(
+    "boing_event_loop_lag_seconds", "Most recent event loop scheduling lag"
+)
+EVENT_LOOP_LAG_HISTOGRAM = Histogram(
+    "boing_event_loop_lag_distribution_seconds", "Event loop scheduling lag samples"
+)
@@ -0,0 +1,69 @@
+"""
+Pagination - Opaque keyset cursors for newest-first listings
+
+Rows are ordered by (sort column DESC, id DESC). A cursor is the position of
+the last row of a page, and the next page starts strictly after it:
+
+    sort < %s OR (sort = %s AND id < %s)
+
+so every page is an index range scan, however deep, instead of an OFFSET
+that reads and discards all earlier rows. The cursor is opaque to clients.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from config import settings
+
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    if isinstance(sort_value, datetime):
+        payload = {"t": sort_value.isoformat(), "id": row_id}
+    else:
+        payload = {"v": sort_value, "id": row_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, int]:
+    """(sort value, id) of a cursor; ValueError if it was not produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        sort_value = datetime.fromisoformat(payload["t"]) if "t" in payload else payload["v"]
+        row_id = int(payload["id"])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(sort_value, (int, float, datetime)):
+        raise ValueError("Invalid pagination cursor")
+    return sort_value, row_id
+
+
+def after_cursor(cursor: str, column: str) -> Tuple[str, list]:
+    """WHERE condition and params selecting the rows after the cursor position"""
+    sort_value, row_id = decode_cursor(cursor)
+    return f"({column} < %s OR ({column} = %s AND id < %s))", [sort_value, sort_value, row_id]
+
+
+def page(rows: List[dict], limit: int, column: str) -> Tuple[List[dict], Optional[str]]:
+    """Trim rows fetched with LIMIT limit + 1 and build the cursor of the next page"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[column], last['id'])
+
+
+def estimated_count(cursor, table: str, where_clause: str, params: list) -> Optional[int]:
+    """Optimizer estimate of the matching rows; cheap, but can be off by a large factor
+
+    None on SQLite: its EXPLAIN lists bytecode, and its planner keeps no row
+    estimates to read instead.
+    """
+    if settings.DB_BACKEND == "sqlite":
+        return None
+    cursor.execute(f"EXPLAIN SELECT id FROM {table} {where_clause}", params)
+    estimates = [row.get('rows') for row in cursor.fetchall() if row.get('table') == table]
+    estimates = [int(value) for value in estimates if value is not None]
+    return max(estimates) if estimates else None
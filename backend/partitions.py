@@ -0,0 +1,219 @@
+"""
+Partitions - Daily range partitions of request_logs
+
+request_logs is partitioned by RANGE on ts_day, a stored generated column
+holding FLOOR(timestamp / 86400). Each partition holds one UTC day and the
+last one, p_future, everything after the newest day. The manager splits
+p_future ahead of time, so new rows never land in a partition that has to be
+reorganized later, and drops whole expired partitions instead of running
+large DELETEs. An expired partition still holding suspicious or alerted rows
+that the retention tiers keep longer (see retention.py) is kept; the
+retention job then deletes its other rows in batches.
+
+MySQL only prunes partitions on predicates over the partitioning column, so
+queries with a time range also filter on ts_day (see day_conditions).
+
+Partitioned InnoDB tables cannot have foreign keys: rows of a deleted API
+are purged in batches after the API is deleted (RetentionJob.purge_api), and
+alerts.log_id is a plain column.
+
+Usage:
+    python partitions.py maintain     # create/drop partitions once
+    python partitions.py convert      # partition an existing request_logs table
+"""
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from config import settings
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+TABLE = "request_logs"
+FUTURE_PARTITION = "p_future"
+
+
+def day_of(timestamp: float) -> int:
+    return int(timestamp // DAY)
+
+
+def partition_name(day: int) -> str:
+    return "p" + datetime.fromtimestamp(day * DAY, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def day_conditions(start_time: Optional[float], end_time: Optional[float]) -> Tuple[List[str], list]:
+    """ts_day conditions matching a timestamp range, so MySQL can prune partitions"""
+    conditions, params = [], []
+    if start_time:
+        conditions.append("ts_day >= %s")
+        params.append(day_of(start_time))
+    if end_time:
+        conditions.append("ts_day <= %s")
+        params.append(day_of(end_time))
+    return conditions, params
+
+
+def _partition_clause(days: List[int]) -> str:
+    parts = [f"PARTITION {partition_name(day)} VALUES LESS THAN ({day + 1})" for day in days]
+    parts.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return "(" + ", ".join(parts) + ")"
+
+
+class PartitionManager:
+    def __init__(self, interval: float, days_ahead: int, retention_days: int):
+        self.interval = interval
+        self.days_ahead = days_ahead
+        self.retention_days = retention_days
+        self._task = None
+        self._warned = False
+
+    def partitions(self, cursor) -> List[Tuple[str, Optional[int]]]:
+        """(name, exclusive upper ts_day) of every partition, MAXVALUE as None"""
+        cursor.execute("""
+            SELECT PARTITION_NAME as name, PARTITION_DESCRIPTION as bound
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (TABLE,))
+        return [
+            (row['name'], None if row['bound'] == 'MAXVALUE' else int(row['bound']))
+            for row in cursor.fetchall()
+        ]
+
+    def maintain(self, now: Optional[float] = None) -> dict:
+        """Create the partitions of the coming days and drop expired ones"""
+        today = day_of(now if now is not None else time.time())
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        created, dropped = [], []
+
+        try:
+            partitions = self.partitions(cursor)
+            if not partitions:
+                if not self._warned:
+                    logger.warning(f"{TABLE} is not partitioned; run 'python partitions.py convert'")
+                    self._warned = True
+                return {'created': created, 'dropped': dropped}
+
+            bounds = [bound for _, bound in partitions if bound is not None]
+            first_new = max(bounds) if bounds else today
+            days = list(range(first_new, today + self.days_ahead + 1))
+            if days:
+                # p_future only holds future-dated stragglers, so this moves few rows
+                cursor.execute(
+                    f"ALTER TABLE {TABLE} REORGANIZE PARTITION {FUTURE_PARTITION} INTO {_partition_clause(days)}"
+                )
+                created = [partition_name(day) for day in days]
+
+            if self.retention_days > 0:
+                cutoff = today - self.retention_days
+                expired = [name for name, bound in partitions if bound is not None and bound <= cutoff]
+                held = self._held(cursor, expired, now if now is not None else time.time())
+                dropped = [name for name in expired if name not in held]
+                if held:
+                    logger.warning(
+                        f"Kept expired partitions {held}: they hold suspicious or alerted rows "
+                        f"that the retention tiers keep longer"
+                    )
+                if dropped:
+                    cursor.execute(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(dropped)}")
+
+            if created or dropped:
+                logger.info(f"Partitions of {TABLE}: created {created}, dropped {dropped}")
+            return {'created': created, 'dropped': dropped}
+
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _held(self, cursor, names: List[str], now: float) -> List[str]:
+        """Partitions among names holding rows a suspicious or alert retention tier still keeps"""
+        if not names:
+            return []
+        # Imported here: retention imports day_of from this module
+        from retention import job as retention_job, kept_condition
+        where, params = kept_condition([policy for _, policy in retention_job.policies(cursor)], now)
+        held = []
+        for name in names:
+            cursor.execute(f"SELECT 1 FROM {TABLE} PARTITION ({name}) WHERE {where} LIMIT 1", params)
+            if cursor.fetchone():
+                held.append(name)
+        return held
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.maintain)
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+manager = PartitionManager(
+    settings.PARTITION_MAINTENANCE_SECONDS, settings.PARTITION_DAYS_AHEAD, settings.PARTITION_RETENTION_DAYS
+)
+
+
+def convert(now: Optional[float] = None):
+    """Partition an existing request_logs table in place (rebuilds the table; run in a quiet period)"""
+    today = day_of(now if now is not None else time.time())
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        if manager.partitions(cursor):
+            logger.info(f"{TABLE} is already partitioned")
+            return
+
+        cursor.execute("""
+            SELECT TABLE_NAME as table_name, CONSTRAINT_NAME as name
+            FROM information_schema.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+                AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)
+        """, (TABLE, TABLE))
+        for row in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {row['table_name']} DROP FOREIGN KEY {row['name']}")
+
+        cursor.execute("SHOW COLUMNS FROM request_logs LIKE 'ts_day'")
+        if not cursor.fetchone():
+            cursor.execute(f"""
+                ALTER TABLE {TABLE}
+                    ADD COLUMN ts_day INT GENERATED ALWAYS AS (FLOOR(timestamp / 86400)) STORED NOT NULL,
+                    DROP PRIMARY KEY,
+                    ADD PRIMARY KEY (id, ts_day)
+            """)
+
+        cursor.execute(f"SELECT MIN(ts_day) as first_day FROM {TABLE}")
+        first_day = cursor.fetchone()['first_day']
+        first_day = today if first_day is None else min(int(first_day), today)
+        days = list(range(first_day, today + manager.days_ahead + 1))
+        cursor.execute(f"ALTER TABLE {TABLE} PARTITION BY RANGE (ts_day) {_partition_clause(days)}")
+        logger.info(f"Partitioned {TABLE} into {len(days)} daily partitions")
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "maintain"
+    if command == "convert":
+        convert()
+    elif command == "maintain":
+        print(manager.maintain())
+    else:
+        print(__doc__)
+        sys.exit(1)
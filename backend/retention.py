@@ -0,0 +1,211 @@
+"""
+Retention - Per-API retention tiers for raw request logs
+
+Raw rows age through tiers:
+    headers_days     full rows, then the stored headers are dropped
+    raw_days         raw rows, then only rollups remain
+    suspicious_days  suspicious rows are kept this long instead
+    alert_days       rows referenced by alerts.log_id are kept this long instead
+
+Zero keeps rows forever in that tier. Defaults come from settings and can be
+overridden per API in retention_policies (NULL columns use the default).
+
+Rows are only deleted once rollups cover them (from the rollup coverage
+start), so dashboards keep their totals. The job deletes in batches of
+RETENTION_BATCH_ROWS, committing and pausing between batches, so locks stay
+short and ingest is never stalled.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from config import settings
+from database import get_db_connection
+from partitions import day_of
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+TIERS = ('headers_days', 'raw_days', 'suspicious_days', 'alert_days')
+REFERENCED = "EXISTS (SELECT 1 FROM alerts WHERE alerts.log_id = request_logs.id)"
+
+
+def default_policy() -> Dict[str, int]:
+    return {
+        'headers_days': settings.RETENTION_HEADERS_DAYS,
+        'raw_days': settings.RETENTION_RAW_DAYS,
+        'suspicious_days': settings.RETENTION_SUSPICIOUS_DAYS,
+        'alert_days': settings.RETENTION_ALERT_DAYS,
+    }
+
+
+def effective_policy(row: Optional[dict]) -> Dict[str, int]:
+    """Per-API overrides on top of the defaults"""
+    policy = default_policy()
+    for tier in TIERS:
+        if row and row.get(tier) is not None:
+            policy[tier] = int(row[tier])
+    return policy
+
+
+def kept_condition(policies: List[Dict[str, int]], now: float) -> tuple:
+    """WHERE fragment and params of the rows a suspicious or alert tier still keeps, under any policy"""
+    conditions, params = [], []
+    for tier, condition in (('suspicious_days', "is_suspicious = TRUE"), ('alert_days', REFERENCED)):
+        days = [policy[tier] for policy in policies or [default_policy()]]
+        if min(days) <= 0:
+            conditions.append(condition)
+        else:
+            conditions.append(f"({condition} AND timestamp >= %s)")
+            params.append(now - max(days) * DAY)
+    return " OR ".join(conditions), params
+
+
+def delete_condition(policy: Dict[str, int], now: float) -> Optional[tuple]:
+    """WHERE fragment and params of the rows of one API past every tier, None if none can go"""
+    raw_days = policy['raw_days']
+    if raw_days <= 0:
+        return None
+    cutoff = now - raw_days * DAY
+    conditions = ["timestamp < %s", "ts_day <= %s"]
+    params: list = [cutoff, day_of(cutoff)]
+
+    suspicious_days = policy['suspicious_days']
+    if suspicious_days <= 0:
+        conditions.append("is_suspicious = FALSE")
+    elif suspicious_days > raw_days:
+        conditions.append("(is_suspicious = FALSE OR timestamp < %s)")
+        params.append(now - suspicious_days * DAY)
+
+    alert_days = policy['alert_days']
+    if alert_days <= 0:
+        conditions.append(f"NOT {REFERENCED}")
+    elif alert_days > raw_days:
+        conditions.append(f"(timestamp < %s OR NOT {REFERENCED})")
+        params.append(now - alert_days * DAY)
+
+    return " AND ".join(conditions), params
+
+
+class RetentionJob:
+    def __init__(self, interval: float, batch_rows: int, pause: float):
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.pause = pause
+        self._task = None
+        self._stopping = False
+
+    def _batches(self, conn, cursor, sql: str, params: list) -> int:
+        """Run a LIMITed statement until it affects fewer rows than a batch"""
+        total = 0
+        while not self._stopping:
+            cursor.execute(f"{sql} LIMIT %s", params + [self.batch_rows])
+            affected = cursor.rowcount
+            conn.commit()
+            total += affected
+            if affected < self.batch_rows:
+                break
+            time.sleep(self.pause)
+        return total
+
+    def policies(self, cursor) -> List[tuple]:
+        cursor.execute("""
+            SELECT a.id as api_id, p.headers_days, p.raw_days, p.suspicious_days, p.alert_days
+            FROM apis a LEFT JOIN retention_policies p ON p.api_id = a.id
+            ORDER BY a.id
+        """)
+        return [(row['api_id'], effective_policy(row)) for row in cursor.fetchall()]
+
+    def run_once(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Apply every API's policy once; returns the rows stripped and deleted"""
+        now = now if now is not None else time.time()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        stripped = deleted = 0
+
+        try:
+            cursor.execute("SELECT value FROM rollup_state WHERE name = 'coverage_start'")
+            row = cursor.fetchone()
+            coverage_start = float(row['value']) if row else None
+
+            for api_id, policy in self.policies(cursor):
+                if self._stopping:
+                    break
+
+                if policy['headers_days'] > 0:
+                    cutoff = now - policy['headers_days'] * DAY
+                    stripped += self._batches(conn, cursor, """
+                        UPDATE request_logs SET headers = NULL, headers_compressed = NULL
+                        WHERE api_id = %s AND timestamp < %s AND ts_day <= %s
+                            AND (headers IS NOT NULL OR headers_compressed IS NOT NULL)
+                    """, [api_id, cutoff, day_of(cutoff)])
+
+                condition = delete_condition(policy, now)
+                if condition is None:
+                    continue
+                if coverage_start is None:
+                    logger.warning("Raw log retention skipped: rollups have no coverage yet")
+                    continue
+                where, params = condition
+                # Rows older than the rollup coverage would vanish from the dashboards
+                deleted += self._batches(
+                    conn, cursor,
+                    f"DELETE FROM request_logs WHERE api_id = %s AND timestamp >= %s AND {where}",
+                    [api_id, coverage_start] + params
+                )
+
+            if stripped or deleted:
+                logger.info(f"Retention: stripped headers of {stripped} rows, deleted {deleted} rows")
+            return {'stripped': stripped, 'deleted': deleted}
+
+        finally:
+            cursor.close()
+            conn.close()
+
+    def purge_api(self, api_id: int) -> int:
+        """Delete every raw row of a deleted API, in batches"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        try:
+            deleted = self._batches(conn, cursor, "DELETE FROM request_logs WHERE api_id = %s", [api_id])
+            logger.info(f"Retention: deleted {deleted} rows of deleted API {api_id}")
+            return deleted
+
+        finally:
+            cursor.close()
+            conn.close()
+
+    async def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Retention job failed: {e}")
+
+
+job = RetentionJob(
+    settings.RETENTION_INTERVAL_SECONDS, settings.RETENTION_BATCH_ROWS, settings.RETENTION_BATCH_PAUSE_SECONDS
+)
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        print(job.run_once())
+    elif len(sys.argv) > 2 and sys.argv[1] == "purge":
+        print(job.purge_api(int(sys.argv[2])))
+    else:
+        print("Usage: python retention.py run | purge <api_id>")
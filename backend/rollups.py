@@ -0,0 +1,685 @@
+"""
+Rollups - Pre-aggregated per-API request metrics
+
+Ingest records every request into an in-process aggregator keyed by API and
+minute. Every ROLLUP_FLUSH_SECONDS the pending buckets are added to the
+minute, hour and day rows of request_rollups / request_rollup_endpoints with
+additive upserts, so any number of workers can flush concurrently.
+
+Rows also carry mergeable sketches: a HyperLogLog of client IPs,
+Space-Saving heavy hitters of endpoints, client IPs and user agents, and a
+DDSketch of latencies (per API and per endpoint). They are merged into the
+stored rows with one locked read and one batched write per flush.
+
+Rollups are complete only for buckets that start at or after the coverage
+start recorded in rollup_state (when aggregation was first enabled, or
+earlier after a backfill, which only adds the raw rows before it) and that end before the flush lag. Each column
+family (plain counters, each sketch) has its own coverage start, since
+sketches were added to existing rollups later. plan() splits a query
+range into whole rollup buckets - coarsest first - and the raw edges that
+must still be read from request_logs.
+
+Backfill history that predates the aggregator with:
+    python rollups.py backfill
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from database import InstrumentedStreamingCursor, get_db_connection
+from partitions import day_conditions
+from dictionaries import DIMENSIONS, id_column, value_sql
+from sketches import DDSketch, HyperLogLog, SpaceSaving, MIN_LATENCY_MS
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {'minute': 60, 'hour': 3600, 'day': 86400}
+BACKFILL_BATCH_ROWS = 5000
+COARSEST_FIRST = ['day', 'hour', 'minute']
+COVERAGE_KEYS = {
+    'counts': 'coverage_start',
+    'ip_sketch': 'ip_sketch_coverage_start',
+    'top_k': 'top_k_coverage_start',
+    'latency': 'latency_coverage_start',
+}
+
+# request_rollups heavy-hitter columns and the request dimension they summarize
+TOP_K_COLUMNS = {
+    'top_endpoints': 'endpoint',
+    'top_ips': 'client_ip',
+    'top_user_agents': 'user_agent',
+}
+
+SKETCH_COLUMNS = {
+    'ip_sketch': HyperLogLog,
+    'top_endpoints': SpaceSaving,
+    'top_ips': SpaceSaving,
+    'top_user_agents': SpaceSaving,
+    'latency_sketch': DDSketch,
+}
+
+ROLLUP_KEY = ('api_id', 'granularity', 'bucket_start')
+ROLLUP_ENDPOINT_KEY = ROLLUP_KEY + ('endpoint',)
+
+
+class _Bucket:
+    __slots__ = ("requests", "errors", "suspicious", "latency_count", "latency_sum", "latency", "values")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.suspicious = 0
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency: Optional[DDSketch] = None
+        self.values: Optional[Dict[str, Counter]] = None   # dimension -> exact counts until flushed
+
+    def add(self, status_code: Optional[int], latency_ms: Optional[float], is_suspicious: bool,
+            dimensions: Optional[Dict[str, Optional[str]]] = None):
+        self.requests += 1
+        if dimensions:
+            if self.values is None:
+                self.values = {name: Counter() for name in dimensions}
+            for name, value in dimensions.items():
+                if value is not None:
+                    self.values[name][value] += 1
+        if status_code is not None and status_code >= 400:
+            self.errors += 1
+        if is_suspicious:
+            self.suspicious += 1
+        if latency_ms is not None:
+            self.latency_count += 1
+            self.latency_sum += latency_ms
+            if self.latency is None:
+                self.latency = DDSketch()
+            self.latency.add(latency_ms)
+
+    def merge(self, other: "_Bucket"):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.suspicious += other.suspicious
+        self.latency_count += other.latency_count
+        self.latency_sum += other.latency_sum
+        if other.latency is not None:
+            if self.latency is None:
+                self.latency = DDSketch()
+            self.latency.merge(other.latency)
+        if other.values:
+            if self.values is None:
+                self.values = {name: Counter() for name in other.values}
+            for name, counts in other.values.items():
+                self.values[name].update(counts)
+
+    def row(self) -> tuple:
+        return (self.requests, self.errors, self.suspicious, self.latency_count, self.latency_sum)
+
+
+class RollupPlan:
+    """A query range split into whole rollup buckets and raw request_logs edges"""
+
+    def __init__(self):
+        self.rolled: List[Tuple[str, int, int]] = []   # (granularity, start, end) with end exclusive
+        self.raw: List[Tuple[Optional[float], Optional[float], bool]] = []  # (start, end, end_inclusive)
+
+    @property
+    def uses_rollups(self) -> bool:
+        return bool(self.rolled)
+
+    def rollup_condition(self) -> Tuple[str, list]:
+        """WHERE fragment selecting the planned rollup rows"""
+        parts, params = [], []
+        for granularity, start, end in self.rolled:
+            parts.append("(granularity = %s AND bucket_start >= %s AND bucket_start < %s)")
+            params.extend([granularity, start, end])
+        return "(" + " OR ".join(parts) + ")", params
+
+    def raw_condition(self) -> Tuple[Optional[str], list]:
+        """WHERE fragment selecting the raw edge rows, or None when there are none"""
+        parts, params = [], []
+        for start, end, inclusive in self.raw:
+            conds = []
+            if start is not None:
+                conds.append("timestamp >= %s")
+                params.append(start)
+            if end is not None:
+                conds.append("timestamp <= %s" if inclusive else "timestamp < %s")
+                params.append(end)
+            day_conds, day_params = day_conditions(start, end)
+            conds.extend(day_conds)
+            params.extend(day_params)
+            parts.append("(" + " AND ".join(conds) + ")" if conds else "TRUE")
+        if not parts:
+            return None, []
+        return "(" + " OR ".join(parts) + ")", params
+
+
+def plan(start_time: Optional[float], end_time: Optional[float], coverage_start: Optional[float],
+         safe_end: float, levels: List[str] = COARSEST_FIRST) -> RollupPlan:
+    """Split [start_time, end_time] into rollup buckets (coarsest first) and raw edges"""
+    result = RollupPlan()
+    if coverage_start is None:
+        result.raw.append((start_time, end_time, True))
+        return result
+
+    lo = coverage_start if start_time is None else max(start_time, coverage_start)
+    hi = safe_end if end_time is None else min(end_time, safe_end)
+    if lo >= hi:
+        result.raw.append((start_time, end_time, True))
+        return result
+
+    if start_time is None or start_time < lo:
+        result.raw.append((start_time, lo, False))
+
+    def cover(lo: float, hi: float, remaining: List[str]):
+        if lo >= hi:
+            return
+        if not remaining:
+            result.raw.append((lo, hi, False))
+            return
+        size = GRANULARITIES[remaining[0]]
+        first = int(math.ceil(lo / size) * size)
+        last = int(math.floor(hi / size) * size)
+        if first >= last:
+            cover(lo, hi, remaining[1:])
+            return
+        result.rolled.append((remaining[0], first, last))
+        cover(lo, first, remaining[1:])
+        cover(last, hi, remaining[1:])
+
+    cover(lo, hi, list(levels))
+
+    if end_time is None or hi < end_time:
+        result.raw.append((hi, end_time, True))
+    else:
+        # end_time is inclusive: close the last raw edge, or read rows exactly at it
+        last = next((i for i, piece in enumerate(result.raw) if piece[1] == end_time), None)
+        if last is None:
+            result.raw.append((end_time, end_time, True))
+        else:
+            result.raw[last] = (result.raw[last][0], end_time, True)
+    return result
+
+
+def raw_plan(start_time: Optional[float], end_time: Optional[float]) -> RollupPlan:
+    """A plan that reads the whole range from request_logs"""
+    return plan(start_time, end_time, None, 0)
+
+
+class RollupAggregator:
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[int, int], _Bucket] = {}
+        self._endpoints: Dict[Tuple[int, int, str], _Bucket] = {}
+        self._coverage: Dict[str, float] = {}
+        self._task = None
+
+    @property
+    def safe_end(self) -> float:
+        """Buckets ending after this may still have unflushed data in some worker"""
+        return time.time() - 2 * self.flush_interval
+
+    def record(self, api_id: int, timestamp: float, endpoint: str, status_code: Optional[int],
+               latency_ms: Optional[float], is_suspicious: bool, client_ip: Optional[str] = None,
+               user_agent: Optional[str] = None):
+        """Add one ingested request to the pending minute bucket (event loop only)"""
+        minute = int(timestamp // 60 * 60)
+        bucket = self._pending.get((api_id, minute))
+        if bucket is None:
+            bucket = self._pending[(api_id, minute)] = _Bucket()
+        bucket.add(status_code, latency_ms, is_suspicious, {
+            'endpoint': endpoint[:512],
+            'client_ip': client_ip,
+            'user_agent': user_agent[:512] if user_agent else None,
+        })
+
+        key = (api_id, minute, endpoint[:512])
+        bucket = self._endpoints.get(key)
+        if bucket is None:
+            bucket = self._endpoints[key] = _Bucket()
+        bucket.add(status_code, latency_ms, is_suspicious)
+
+    async def start(self):
+        await asyncio.to_thread(self._ensure_coverage)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Rollup aggregator started (coverage from {self.coverage_start})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            try:
+                # Picks up coverage extended by a backfill in another process
+                await asyncio.to_thread(self._load_coverage)
+            except Exception as e:
+                logger.error(f"Failed to refresh rollup coverage: {e}")
+
+    async def flush(self):
+        """Write pending buckets; on failure they are kept for the next flush"""
+        pending, self._pending = self._pending, {}
+        endpoints, self._endpoints = self._endpoints, {}
+        if not pending:
+            return
+        try:
+            await asyncio.to_thread(self._write, pending, endpoints)
+        except Exception as e:
+            logger.error(f"Failed to flush rollups: {e}")
+            for key, bucket in pending.items():
+                self._pending.setdefault(key, _Bucket()).merge(bucket)
+            for key, bucket in endpoints.items():
+                self._endpoints.setdefault(key, _Bucket()).merge(bucket)
+
+    @staticmethod
+    def _expand(buckets: Dict[tuple, _Bucket]) -> Dict[tuple, _Bucket]:
+        """Re-key minute buckets into (granularity, bucket_start, ...) for every granularity"""
+        rows: Dict[tuple, _Bucket] = {}
+        for key, bucket in buckets.items():
+            api_id, minute, rest = key[0], key[1], key[2:]
+            for granularity, size in GRANULARITIES.items():
+                row_key = (api_id, granularity, minute // size * size) + rest
+                rows.setdefault(row_key, _Bucket()).merge(bucket)
+        return rows
+
+    def _write(self, pending: Dict, endpoints: Dict):
+        rows = self._expand(pending)
+        endpoint_rows = self._expand(endpoints)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            # Rows are written (and so locked) in key order: concurrent flushes cannot deadlock
+            cursor.executemany("""
+                INSERT INTO request_rollups (
+                    api_id, granularity, bucket_start, request_count, error_count,
+                    suspicious_count, latency_count, latency_sum
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    request_count = request_count + VALUES(request_count),
+                    error_count = error_count + VALUES(error_count),
+                    suspicious_count = suspicious_count + VALUES(suspicious_count),
+                    latency_count = latency_count + VALUES(latency_count),
+                    latency_sum = latency_sum + VALUES(latency_sum)
+            """, [key + rows[key].row() for key in sorted(rows)])
+            cursor.executemany("""
+                INSERT INTO request_rollup_endpoints (
+                    api_id, granularity, bucket_start, endpoint, request_count, error_count,
+                    suspicious_count, latency_count, latency_sum
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    request_count = request_count + VALUES(request_count),
+                    error_count = error_count + VALUES(error_count),
+                    suspicious_count = suspicious_count + VALUES(suspicious_count),
+                    latency_count = latency_count + VALUES(latency_count),
+                    latency_sum = latency_sum + VALUES(latency_sum)
+            """, [key + endpoint_rows[key].row() for key in sorted(endpoint_rows)])
+
+            _merge_stored_sketches(cursor, "request_rollups", ROLLUP_KEY, {
+                key: _bucket_sketches(bucket) for key, bucket in rows.items() if bucket.values
+            })
+            _merge_stored_sketches(cursor, "request_rollup_endpoints", ROLLUP_ENDPOINT_KEY, {
+                key: {'latency_sketch': bucket.latency} for key, bucket in endpoint_rows.items() if bucket.latency
+            })
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _ensure_coverage(self):
+        """Record when aggregation started, unless an earlier worker already did"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            start = math.ceil(time.time() / 60) * 60
+            cursor.executemany("""
+                INSERT IGNORE INTO rollup_state (name, value) VALUES (%s, %s)
+            """, [(name, start) for name in COVERAGE_KEYS.values()])
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        self._load_coverage()
+
+    def _load_coverage(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT name, value FROM rollup_state")
+            values = {row['name']: row['value'] for row in cursor.fetchall()}
+            self._coverage = {
+                family: values[name] for family, name in COVERAGE_KEYS.items() if name in values
+            }
+        finally:
+            cursor.close()
+            conn.close()
+
+    @property
+    def coverage_start(self) -> Optional[float]:
+        return self._coverage.get('counts')
+
+    def plan(self, start_time: Optional[float], end_time: Optional[float],
+             levels: List[str] = COARSEST_FIRST, family: str = 'counts') -> RollupPlan:
+        """Plan a range against the rollups that are complete for a column family"""
+        coverage = self._coverage.get(family)
+        if coverage is not None and self.coverage_start is not None:
+            coverage = max(coverage, self.coverage_start)
+        return plan(start_time, end_time, coverage, self.safe_end, levels)
+
+
+def _bucket_sketches(bucket: _Bucket) -> Dict[str, object]:
+    """Sketch columns of a request_rollups row, built from a pending bucket"""
+    sketches = {'ip_sketch': HyperLogLog()}
+    sketches['ip_sketch'].update(bucket.values['client_ip'])
+    for column, dimension in TOP_K_COLUMNS.items():
+        sketches[column] = SpaceSaving()
+        sketches[column].update(bucket.values[dimension])
+    if bucket.latency is not None:
+        sketches['latency_sketch'] = bucket.latency
+    return sketches
+
+
+def _merge_stored_sketches(cursor, table: str, key_columns: Tuple[str, ...], rows: Dict[tuple, Dict[str, object]],
+                           batch_size: int = 500):
+    """Merge sketches into the stored BLOB columns: one locked read and one batched write"""
+    keys = sorted(rows)
+    key_list = ", ".join(key_columns)
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i:i + batch_size]
+        columns = sorted({column for key in batch for column in rows[key]})
+        row_placeholder = "(" + ", ".join(["%s"] * len(key_columns)) + ")"
+        cursor.execute(f"""
+            SELECT {key_list}, {', '.join(columns)} FROM {table}
+            WHERE ({key_list}) IN ({', '.join([row_placeholder] * len(batch))})
+            FOR UPDATE
+        """, [value for key in batch for value in key])
+        stored = {tuple(row[c] for c in key_columns): row for row in cursor.fetchall()}
+
+        values = []
+        for key in batch:
+            row = []
+            for column in columns:
+                sketch = rows[key].get(column)
+                blob = stored.get(key, {}).get(column)
+                if blob:
+                    previous = SKETCH_COLUMNS[column].from_bytes(blob)
+                    sketch = previous.merge(sketch) if sketch is not None else previous
+                row.append(sketch.to_bytes() if sketch is not None else None)
+            values.append(key + tuple(row))
+        cursor.executemany(f"""
+            INSERT INTO {table} ({key_list}, {', '.join(columns)})
+            VALUES ({', '.join(['%s'] * (len(key_columns) + len(columns)))})
+            ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in columns)}
+        """, values)
+
+
+def _stored_sketches(cursor, table: str, column: str, filters: list, params: list, group: str = None):
+    """Merge one sketch column over the selected rows, optionally grouped by another column"""
+    select = f"{group} as grp, {column}" if group else column
+    cursor.execute(f"SELECT {select} FROM {table} WHERE {' AND '.join(filters)}", params)
+    merged: Dict[object, object] = {}
+    for row in cursor.fetchall():
+        if row[column]:
+            sketch = SKETCH_COLUMNS[column].from_bytes(row[column])
+            key = row['grp'] if group else None
+            merged[key] = merged[key].merge(sketch) if key in merged else sketch
+    return merged
+
+
+def merged_ip_sketch(cursor, scope: list, scope_params: list, rollup_plan: RollupPlan) -> HyperLogLog:
+    """Merge the unique-IP sketches of the planned rollup rows and the raw edge IPs"""
+    sketch = HyperLogLog()
+    if rollup_plan.uses_rollups:
+        condition, params = rollup_plan.rollup_condition()
+        stored = _stored_sketches(cursor, "request_rollups", "ip_sketch", scope + [condition], scope_params + params)
+        if stored:
+            sketch.merge(stored[None])
+    condition, params = rollup_plan.raw_condition()
+    if condition:
+        cursor.execute(
+            f"SELECT DISTINCT client_ip FROM request_logs WHERE {' AND '.join(scope + [condition])}",
+            scope_params + params
+        )
+        sketch.update(row['client_ip'] for row in cursor.fetchall())
+    return sketch
+
+
+def merged_top_k(cursor, scope: list, scope_params: list, rollup_plan: RollupPlan,
+                 column: str) -> SpaceSaving:
+    """Merge one heavy-hitter column of the planned rollup rows with raw edge counts"""
+    dimension = TOP_K_COLUMNS[column]
+    top = SpaceSaving()
+    if rollup_plan.uses_rollups:
+        condition, params = rollup_plan.rollup_condition()
+        stored = _stored_sketches(cursor, "request_rollups", column, scope + [condition], scope_params + params)
+        if stored:
+            top.merge(stored[None])
+    condition, params = rollup_plan.raw_condition()
+    if condition:
+        cursor.execute(f"""
+            SELECT {value_sql(dimension)} as item, COUNT(*) as count FROM request_logs
+            WHERE {' AND '.join(scope + [condition, f'{id_column(dimension)} IS NOT NULL'])}
+            GROUP BY {id_column(dimension)}
+        """, scope_params + params)
+        edges = SpaceSaving()
+        edges.update({row['item']: int(row['count']) for row in cursor.fetchall()})
+        top.merge(edges)
+    return top
+
+
+def raw_latency_sketches(cursor, filters: list, params: list, group: str = None) -> Dict[object, DDSketch]:
+    """DDSketches of raw request latencies; the log bins are computed in SQL"""
+    probe = DDSketch()
+    select = (f"{value_sql(group)} as grp, " if group else "") + \
+        "CASE WHEN latency_ms > %s THEN CEIL(LN(latency_ms) / %s) END as bin"
+    # Dictionary-encoded dimensions group by their id column, expressions by value
+    group_by = (f"{id_column(group)}, " if group in DIMENSIONS else "grp, ") if group else ""
+    cursor.execute(f"""
+        SELECT {select}, COUNT(*) as count FROM request_logs
+        WHERE {' AND '.join(filters + ['latency_ms IS NOT NULL'])}
+        GROUP BY {group_by}bin
+    """, [MIN_LATENCY_MS, probe.log_gamma] + list(params))
+    sketches: Dict[object, DDSketch] = {}
+    for row in cursor.fetchall():
+        key = row['grp'] if group else None
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = DDSketch()
+        sketch.add_bin(int(row['bin']) if row['bin'] is not None else None, int(row['count']))
+    return sketches
+
+
+def merged_latency(cursor, scope: list, scope_params: list, rollup_plan: RollupPlan,
+                   table: str = "request_rollups", group: Tuple[str, str] = None) -> Dict[object, DDSketch]:
+    """Latency sketches of the planned rollup rows plus raw edges
+
+    group is an optional (rollup column, raw expression or dimension) pair, e.g.
+    ("endpoint", "endpoint") or ("bucket_start", "FLOOR(timestamp / 3600) * 3600").
+    """
+    merged: Dict[object, DDSketch] = {}
+    if rollup_plan.uses_rollups:
+        condition, params = rollup_plan.rollup_condition()
+        merged = _stored_sketches(
+            cursor, table, "latency_sketch", scope + [condition], scope_params + params,
+            group[0] if group else None
+        )
+    condition, params = rollup_plan.raw_condition()
+    if condition:
+        raw = raw_latency_sketches(cursor, scope + [condition], scope_params + params, group[1] if group else None)
+        for key, sketch in raw.items():
+            merged[key] = merged[key].merge(sketch) if key in merged else sketch
+    return merged
+
+
+def _stream(conn, sql: str, params: tuple) -> Iterator[dict]:
+    """Rows of a query, read from the server in batches; consume them before the next statement"""
+    cursor = conn.cursor(InstrumentedStreamingCursor)
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(BACKFILL_BATCH_ROWS)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def _backfill_counts(cursor, lo: int, hi: int):
+    for granularity, size in GRANULARITIES.items():
+        bucket = f"FLOOR(timestamp / {size}) * {size}"
+        cursor.execute(f"""
+            INSERT INTO request_rollups (
+                api_id, granularity, bucket_start, request_count, error_count,
+                suspicious_count, latency_count, latency_sum
+            )
+            SELECT api_id, %s, {bucket}, COUNT(*),
+                SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN is_suspicious THEN 1 ELSE 0 END),
+                COUNT(latency_ms), COALESCE(SUM(latency_ms), 0)
+            FROM request_logs
+            WHERE timestamp >= %s AND timestamp < %s
+            GROUP BY api_id, {bucket}
+            ON DUPLICATE KEY UPDATE
+                request_count = request_count + VALUES(request_count),
+                error_count = error_count + VALUES(error_count),
+                suspicious_count = suspicious_count + VALUES(suspicious_count),
+                latency_count = latency_count + VALUES(latency_count),
+                latency_sum = latency_sum + VALUES(latency_sum)
+        """, (granularity, lo, hi))
+        cursor.execute(f"""
+            INSERT INTO request_rollup_endpoints (
+                api_id, granularity, bucket_start, endpoint, request_count, error_count,
+                suspicious_count, latency_count, latency_sum
+            )
+            SELECT api_id, %s, {bucket}, {value_sql('endpoint')}, COUNT(*),
+                SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN is_suspicious THEN 1 ELSE 0 END),
+                COUNT(latency_ms), COALESCE(SUM(latency_ms), 0)
+            FROM request_logs
+            WHERE timestamp >= %s AND timestamp < %s
+            GROUP BY api_id, {bucket}, endpoint_id
+            ON DUPLICATE KEY UPDATE
+                request_count = request_count + VALUES(request_count),
+                error_count = error_count + VALUES(error_count),
+                suspicious_count = suspicious_count + VALUES(suspicious_count),
+                latency_count = latency_count + VALUES(latency_count),
+                latency_sum = latency_sum + VALUES(latency_sum)
+        """, (granularity, lo, hi))
+
+
+def _backfill_sketches(conn, cursor, ranges: Dict[str, Tuple[int, int]]):
+    """Merge sketches of the raw rows in each family's (lo, hi) range into the stored ones"""
+    columns = ([('ip_sketch', 'client_ip', 'ip_sketch')] if 'ip_sketch' in ranges else []) + \
+        ([(column, dimension, 'top_k') for column, dimension in TOP_K_COLUMNS.items()] if 'top_k' in ranges else [])
+    sketches: Dict[tuple, Dict[str, object]] = {}
+    for column, dimension, family in columns:
+        for row in _stream(conn, f"""
+            SELECT api_id, FLOOR(timestamp / 60) * 60 as minute, {value_sql(dimension)} as item, COUNT(*) as count
+            FROM request_logs
+            WHERE timestamp >= %s AND timestamp < %s AND {id_column(dimension)} IS NOT NULL
+            GROUP BY api_id, minute, {id_column(dimension)}
+        """, ranges[family]):
+            for granularity, size in GRANULARITIES.items():
+                row_sketches = sketches.setdefault((row['api_id'], granularity, int(row['minute']) // size * size), {})
+                sketch = row_sketches.get(column)
+                if sketch is None:
+                    sketch = row_sketches[column] = SKETCH_COLUMNS[column]()
+                if column == 'ip_sketch':
+                    sketch.add(row['item'])
+                else:
+                    sketch.add(row['item'], int(row['count']))
+    _merge_stored_sketches(cursor, "request_rollups", ROLLUP_KEY, sketches)
+
+    if 'latency' not in ranges:
+        return
+    # Latency sketches per API and per endpoint, from log bins computed in SQL
+    probe = DDSketch()
+    for table, select, group in (
+        ("request_rollups", "api_id", "api_id"),
+        ("request_rollup_endpoints", f"api_id, {value_sql('endpoint')} as endpoint", "api_id, endpoint_id"),
+    ):
+        for granularity, size in GRANULARITIES.items():
+            latency: Dict[tuple, DDSketch] = {}
+            for row in _stream(conn, f"""
+                SELECT {select}, FLOOR(timestamp / {size}) * {size} as bucket,
+                    CASE WHEN latency_ms > %s THEN CEIL(LN(latency_ms) / %s) END as bin,
+                    COUNT(*) as count
+                FROM request_logs
+                WHERE timestamp >= %s AND timestamp < %s AND latency_ms IS NOT NULL
+                GROUP BY {group}, bucket, bin
+            """, (MIN_LATENCY_MS, probe.log_gamma) + ranges['latency']):
+                key = (row['api_id'], granularity, int(row['bucket']))
+                if table == "request_rollup_endpoints":
+                    key += (row['endpoint'],)
+                sketch = latency.setdefault(key, DDSketch())
+                sketch.add_bin(int(row['bin']) if row['bin'] is not None else None, int(row['count']))
+            key_columns = ROLLUP_ENDPOINT_KEY if table == "request_rollup_endpoints" else ROLLUP_KEY
+            _merge_stored_sketches(cursor, table, key_columns, {
+                key: {'latency_sketch': sketch} for key, sketch in latency.items()
+            })
+
+
+def backfill(batch_days: int = 1):
+    """Add rollups from request_logs for the time before the coverage start
+
+    Each column family only reads raw rows older than its own coverage start
+    and adds them to the buckets, so buckets the aggregator covers are never
+    rewritten (rows deleted by retention since then cannot shrink them) and
+    pending ingest deltas are not counted twice. Chunks run newest first and
+    move the coverage start back in the same transaction, so an interrupted
+    backfill resumes where it stopped. Events that arrive long after their
+    timestamp, older than the coverage start, would be counted twice.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT name, value FROM rollup_state")
+        state = {row['name']: float(row['value']) for row in cursor.fetchall()}
+        cursor.execute("SELECT MIN(timestamp) as first FROM request_logs")
+        first = cursor.fetchone()['first']
+        if first is None:
+            logger.info("No request logs to backfill")
+            return
+        now = math.ceil(time.time() / 60) * 60
+        ends = {family: state.get(name, now) for family, name in COVERAGE_KEYS.items()}
+        start = int(math.floor(first / 86400) * 86400)
+        stop = int(max(ends.values()))
+
+        step = batch_days * 86400
+        for lo in reversed(range(start, stop, step)):
+            hi = min(lo + step, stop)
+            ranges = {family: (lo, int(min(hi, end))) for family, end in ends.items() if end > lo}
+            if not ranges:
+                continue
+            if 'counts' in ranges:
+                _backfill_counts(cursor, *ranges['counts'])
+            _backfill_sketches(conn, cursor, ranges)
+            cursor.executemany("""
+                INSERT INTO rollup_state (name, value) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE value = LEAST(value, VALUES(value))
+            """, [(COVERAGE_KEYS[family], lo) for family in ranges])
+            conn.commit()
+            logger.info(f"Backfilled rollups from {lo}")
+
+        logger.info(f"Rollup coverage now starts at {start}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+aggregator = RollupAggregator(flush_interval=settings.ROLLUP_FLUSH_SECONDS)
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        backfill()
+    else:
+        print("Usage: python rollups.py backfill")
@@ -8,6 +8,9 @@ import logging
 from models import IPListEntry, DetectorConfig, AuditLogResponse
 from database import get_db_connection
 from routes.auth import require_admin
+from loop_watchdog import watchdog
+from tracing import recent_spans
+from statements import stats as statement_stats
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -213,3 +216,31 @@ async def list_audit_logs(
     finally:
         cursor.close()
         conn.close()
+
+
+@router.get("/debug/event-loop")
+async def event_loop_debug(user: dict = Depends(require_admin)):
+    """Event loop lag and recent stalls captured by the watchdog"""
+    return watchdog.snapshot()
+
+
+@router.get("/debug/traces")
+async def recent_traces(limit: int = 20, user: dict = Depends(require_admin)):
+    """Recently sampled traces with per-stage timings"""
+    return {"traces": recent_spans.recent_traces(limit)}
+
+
+@router.get("/debug/statements")
+async def statement_statistics(limit: int = 50, sort: str = "total_ms", user: dict = Depends(require_admin)):
+    """Calls, rows and timings per SQL statement since start or the last reset"""
+    try:
+        return statement_stats.snapshot(limit, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/debug/statements")
+async def reset_statement_statistics(user: dict = Depends(require_admin)):
+    """Start the statement statistics afresh"""
+    statement_stats.reset()
+    return {"message": "Statement statistics reset"}
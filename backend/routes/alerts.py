@@ -1,13 +1,16 @@
 """
 Alert management routes
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from typing import List, Optional
+import asyncio
 import logging
 
 from models import AlertResponse, AlertAcknowledge, AlertMute, Severity
 from database import get_db_connection
 from routes.auth import get_current_user
+from cache import alert_stats_cache, invalidate_alerts
+from pagination import after_cursor, page
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -15,14 +18,20 @@ logger = logging.getLogger(__name__)
 
 @router.get("/alerts", response_model=List[AlertResponse])
 async def list_alerts(
+    response: Response,
     api_id: Optional[int] = None,
     severity: Optional[Severity] = None,
     acknowledged: Optional[bool] = None,
     limit: int = 100,
     offset: int = 0,
+    page_cursor: Optional[str] = Query(None, alias="cursor"),
     user: dict = Depends(get_current_user)
 ):
-    """List alerts with optional filters"""
+    """List alerts with optional filters
+    
+    The X-Next-Cursor response header holds the cursor of the next page, if
+    any; pass it back as cursor instead of raising offset.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -48,11 +57,22 @@ async def list_alerts(
             query += " AND is_acknowledged = %s"
             params.append(acknowledged)
         
-        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+        if page_cursor:
+            try:
+                condition, cursor_params = after_cursor(page_cursor, "created_at")
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            query += f" AND {condition}"
+            params.extend(cursor_params)
+            offset = 0
+        
+        query += " ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s"
+        params.extend([limit + 1, offset])
         
         cursor.execute(query, params)
-        alerts = cursor.fetchall()
+        alerts, next_cursor = page(cursor.fetchall(), limit, "created_at")
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
         return [
             AlertResponse(
@@ -147,6 +167,7 @@ async def acknowledge_alert(
         """, (ack_data.acknowledged, user['id'], alert_id))
         conn.commit()
         
+        invalidate_alerts(alert['api_id'])
         logger.info(f"Alert {alert_id} acknowledged by user {user['id']}")
         
         return {"message": "Alert acknowledged successfully"}
@@ -188,6 +209,7 @@ async def mute_alert(
         """, (mute_data.muted, alert_id))
         conn.commit()
         
+        invalidate_alerts(alert['api_id'])
         logger.info(f"Alert {alert_id} muted by user {user['id']}")
         
         return {"message": "Alert muted successfully"}
@@ -200,7 +222,13 @@ async def mute_alert(
 @router.get("/alerts/stats/summary")
 async def get_alert_stats(user: dict = Depends(get_current_user)):
     """Get alert statistics summary"""
-    conn = get_db_connection()
+    return await alert_stats_cache.get_or_compute(
+        alert_stats_cache.key(user), lambda: asyncio.to_thread(_alert_stats, user), tags=("alerts:all",)
+    )
+
+
+def _alert_stats(user: dict):
+    conn = get_db_connection(read_only=True)
     cursor = conn.cursor()
     
     try:
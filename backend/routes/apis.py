@@ -1,15 +1,21 @@
 """
 API management routes
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from typing import List
 import secrets
 import logging
 
-from models import APICreate, APIUpdate, APIResponse
+from models import (
+    APICreate, APIUpdate, APIResponse, RetentionPolicy, RetentionPolicyResponse, HeaderPolicy, HeaderPolicyResponse,
+    RouteDefinitions, RouteResponse
+)
 from database import get_db_connection
 from encryption import encrypt_secret
 from routes.auth import get_current_user
+from retention import TIERS, effective_policy, job as retention_job
+import header_policy
+from endpoint_templates import templater, openapi_templates, parse_template, MAX_LENGTH
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -183,7 +189,7 @@ async def update_api(api_id: int, api_data: APIUpdate, user: dict = Depends(get_
 
 
 @router.delete("/apis/{api_id}")
-async def delete_api(api_id: int, user: dict = Depends(get_current_user)):
+async def delete_api(api_id: int, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
     """Delete an API"""
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -199,10 +205,13 @@ async def delete_api(api_id: int, user: dict = Depends(get_current_user)):
         if user['role'] != 'admin' and api['user_id'] != user['id']:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # Delete API (cascade will handle related records)
+        # Delete API (cascade will handle related records, except the partitioned request_logs)
         cursor.execute("DELETE FROM apis WHERE id = %s", (api_id,))
         conn.commit()
         
+        # Its raw rows go in batches after the response, in a worker thread
+        background_tasks.add_task(retention_job.purge_api, api_id)
+        
         logger.info(f"API deleted: {api_id} by user {user['id']}")
         
         return {"message": "API deleted successfully"}
@@ -210,3 +219,186 @@ async def delete_api(api_id: int, user: dict = Depends(get_current_user)):
     finally:
         cursor.close()
         conn.close()
+
+
+def _owned_api(cursor, api_id: int, user: dict) -> dict:
+    cursor.execute("SELECT * FROM apis WHERE id = %s", (api_id,))
+    api = cursor.fetchone()
+    
+    if not api:
+        raise HTTPException(status_code=404, detail="API not found")
+    
+    if user['role'] != 'admin' and api['user_id'] != user['id']:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return api
+
+
+def _retention_response(cursor, api_id: int) -> RetentionPolicyResponse:
+    cursor.execute("SELECT * FROM retention_policies WHERE api_id = %s", (api_id,))
+    row = cursor.fetchone()
+    overrides = {tier: row[tier] for tier in TIERS} if row else {}
+    return RetentionPolicyResponse(
+        api_id=api_id,
+        overrides=RetentionPolicy(**overrides),
+        effective=effective_policy(row)
+    )
+
+
+@router.get("/apis/{api_id}/retention", response_model=RetentionPolicyResponse)
+async def get_retention(api_id: int, user: dict = Depends(get_current_user)):
+    """Get the raw log retention policy of an API"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        _owned_api(cursor, api_id, user)
+        return _retention_response(cursor, api_id)
+        
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.put("/apis/{api_id}/retention", response_model=RetentionPolicyResponse)
+async def update_retention(api_id: int, policy: RetentionPolicy, user: dict = Depends(get_current_user)):
+    """Override the retention tiers of an API (null fields use the server defaults)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        _owned_api(cursor, api_id, user)
+        
+        values = [getattr(policy, tier) for tier in TIERS]
+        cursor.execute(f"""
+            INSERT INTO retention_policies (api_id, {', '.join(TIERS)})
+            VALUES (%s, {', '.join(['%s'] * len(TIERS))})
+            ON DUPLICATE KEY UPDATE {', '.join(f"{tier} = VALUES({tier})" for tier in TIERS)}
+        """, [api_id] + values)
+        conn.commit()
+        
+        logger.info(f"Retention policy of API {api_id} updated by user {user['id']}")
+        
+        return _retention_response(cursor, api_id)
+        
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _header_policy_response(cursor, api_id: int) -> HeaderPolicyResponse:
+    cursor.execute("SELECT * FROM header_policies WHERE api_id = %s", (api_id,))
+    row = cursor.fetchone()
+    overrides = {}
+    for field in header_policy.FIELDS:
+        value = row[field] if row else None
+        if value is not None and field in header_policy.LIST_FIELDS:
+            value = header_policy.header_names(value)
+        overrides[field] = value
+    return HeaderPolicyResponse(
+        api_id=api_id,
+        overrides=HeaderPolicy(**overrides),
+        effective=header_policy.effective_policy(row)
+    )
+
+
+@router.get("/apis/{api_id}/header-policy", response_model=HeaderPolicyResponse)
+async def get_header_policy(api_id: int, user: dict = Depends(get_current_user)):
+    """Get the header capture policy of an API"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        _owned_api(cursor, api_id, user)
+        return _header_policy_response(cursor, api_id)
+        
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.put("/apis/{api_id}/header-policy", response_model=HeaderPolicyResponse)
+async def update_header_policy(api_id: int, policy: HeaderPolicy, user: dict = Depends(get_current_user)):
+    """Override the header capture policy of an API (null fields use the server defaults)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        _owned_api(cursor, api_id, user)
+        
+        fields = header_policy.FIELDS
+        values = []
+        for field in fields:
+            value = getattr(policy, field)
+            if value is not None and field in header_policy.LIST_FIELDS:
+                value = ",".join(header_policy.header_names(value))
+            values.append(value)
+        cursor.execute(f"""
+            INSERT INTO header_policies (api_id, {', '.join(fields)})
+            VALUES (%s, {', '.join(['%s'] * len(fields))})
+            ON DUPLICATE KEY UPDATE {', '.join(f"{field} = VALUES({field})" for field in fields)}
+        """, [api_id] + values)
+        conn.commit()
+        header_policy.policies.invalidate(api_id)
+        
+        logger.info(f"Header policy of API {api_id} updated by user {user['id']}")
+        
+        return _header_policy_response(cursor, api_id)
+        
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _routes(cursor, api_id: int) -> List[RouteResponse]:
+    cursor.execute("SELECT template, source FROM api_routes WHERE api_id = %s ORDER BY template", (api_id,))
+    return [RouteResponse(**row) for row in cursor.fetchall()]
+
+
+@router.get("/apis/{api_id}/routes", response_model=List[RouteResponse])
+async def list_routes(api_id: int, user: dict = Depends(get_current_user)):
+    """List the route templates of an API, uploaded and learned"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        _owned_api(cursor, api_id, user)
+        return _routes(cursor, api_id)
+        
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.put("/apis/{api_id}/routes", response_model=List[RouteResponse])
+async def update_routes(api_id: int, definitions: RouteDefinitions, user: dict = Depends(get_current_user)):
+    """Replace the uploaded route templates of an API (learned routes are kept)"""
+    templates = list(definitions.templates or [])
+    if definitions.openapi is not None:
+        try:
+            templates.extend(openapi_templates(definitions.openapi))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    templates = sorted({"/".join(parse_template(t)) for t in templates if t.startswith("/") and len(t) <= MAX_LENGTH})
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        _owned_api(cursor, api_id, user)
+        
+        cursor.execute("DELETE FROM api_routes WHERE api_id = %s AND source = 'openapi'", (api_id,))
+        cursor.executemany("""
+            INSERT INTO api_routes (api_id, template, source) VALUES (%s, %s, 'openapi')
+            ON DUPLICATE KEY UPDATE source = VALUES(source)
+        """, [(api_id, template) for template in templates])
+        conn.commit()
+        templater.invalidate(api_id)
+        
+        logger.info(f"{len(templates)} routes of API {api_id} uploaded by user {user['id']}")
+        
+        return _routes(cursor, api_id)
+        
+    finally:
+        cursor.close()
+        conn.close()
@@ -3,67 +3,113 @@ Ingestion routes - Receive API telemetry
 """
 from fastapi import APIRouter, HTTPException, Request
 import logging
-import json
+import time
 from datetime import datetime
 
 from models import RequestLog
 from database import get_db_connection
+from monitoring import INGEST_REQUESTS, INGEST_LATENCY, INGEST_IN_FLIGHT
+from tracing import tracer, current_span
+from rollups import aggregator
+from partitions import day_of
+from header_policy import policies as header_policies, capture, encode, normalize, scan_text
+from endpoint_templates import templater
+from dictionaries import endpoints, user_agents
+from telemetry_store import store as telemetry
+from statements import register
+from config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+API_KEY_LOOKUP = register("ingest.api_key_lookup", "SELECT id, is_active FROM apis WHERE api_key = %s")
+INSERT_REQUEST_LOG = register("ingest.insert_log", """
+    INSERT INTO request_logs (
+        api_id, timestamp, method, endpoint_id, endpoint_params, client_ip, status_code,
+        latency_ms, headers, headers_compressed, body_size, user_agent_id
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+""")
+MARK_SUSPICIOUS = register(
+    "ingest.mark_suspicious", "UPDATE request_logs SET is_suspicious = TRUE WHERE id = %s AND ts_day = %s"
+)
+
 
 @router.post("/ingest")
 async def ingest_request(log_data: RequestLog, request: Request):
     """Ingest API request telemetry"""
+    with tracer.start_trace("ingest", **{"http.method": "POST", "http.route": "/api/ingest"}):
+        return await _ingest(log_data, request)
+
+
+async def _ingest(log_data: RequestLog, request: Request):
+    started = time.perf_counter()
     conn = get_db_connection()
     cursor = conn.cursor()
+    INGEST_IN_FLIGHT.inc()
+    outcome = 'error'
     
     try:
         # Validate API key
-        cursor.execute("SELECT id, is_active FROM apis WHERE api_key = %s", (log_data.api_key,))
-        api = cursor.fetchone()
+        with tracer.span("ingest.api_key_lookup"):
+            cursor.execute(API_KEY_LOOKUP, (log_data.api_key,))
+            api = cursor.fetchone()
         
         if not api:
+            outcome = 'rejected'
             raise HTTPException(status_code=401, detail="Invalid API key")
         
         if not api['is_active']:
+            outcome = 'rejected'
             raise HTTPException(status_code=403, detail="API is inactive")
         
         api_id = api['id']
+        current_span().set_attribute("boing.api_id", api_id)
         
-        # Insert request log
-        cursor.execute("""
-            INSERT INTO request_logs (
-                api_id, timestamp, method, endpoint, client_ip,
-                status_code, latency_ms, headers, body_size, user_agent
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            api_id,
-            log_data.timestamp,
-            log_data.method,
-            log_data.endpoint,
-            log_data.client_ip,
-            log_data.status_code,
-            log_data.latency_ms,
-            json.dumps(log_data.headers) if log_data.headers else None,
-            log_data.body_size,
-            log_data.user_agent
-        ))
-        conn.commit()
-        log_id = cursor.lastrowid
+        headers = normalize(log_data.headers)
+        endpoint_template, endpoint_params = templater.template(api_id, log_data.endpoint)
+        user_agent = log_data.user_agent[:512] if log_data.user_agent else None
         
+        event_id = None
+        if settings.TELEMETRY_STORE_ENABLED:
+            # Columnar store: no headers, the store encodes its own strings
+            endpoint_id = log_id = None
+            with tracer.span("ingest.append_telemetry"):
+                event_id = telemetry.append({
+                    'timestamp': log_data.timestamp,
+                    'api_id': api_id,
+                    'method': log_data.method,
+                    'endpoint': endpoint_template,
+                    'client_ip': log_data.client_ip,
+                    'status_code': log_data.status_code,
+                    'latency_ms': log_data.latency_ms,
+                    'body_size': log_data.body_size,
+                    'user_agent': user_agent,
+                })
+        else:
+            # Apply the API's header capture policy
+            policy = header_policies.get(cursor, api_id)
+            headers_json, headers_compressed = encode(capture(headers, policy), policy)
+            
+            # Dictionary-encode the endpoint's route template and the user agent
+            endpoint_id = endpoints.id_for(endpoint_template)
+            user_agent_id = user_agents.id_for(user_agent) if user_agent else None
+            log_id = _insert_log(conn, cursor, api_id, log_data, endpoint_id, endpoint_params,
+                                 headers_json, headers_compressed, user_agent_id)
         # Prepare data for detection
         detection_data = {
             'log_id': log_id,
+            'event_id': event_id,
             'api_id': api_id,
             'timestamp': log_data.timestamp,
             'method': log_data.method,
             'endpoint': log_data.endpoint,
+            'endpoint_id': endpoint_id,
+            'endpoint_template': endpoint_template,
             'client_ip': log_data.client_ip,
             'status_code': log_data.status_code,
             'latency_ms': log_data.latency_ms,
-            'headers': log_data.headers,
+            'headers': headers,
+            'scan_text': scan_text(log_data.endpoint, headers),
             'body_size': log_data.body_size,
             'user_agent': log_data.user_agent
         }
@@ -71,38 +117,50 @@ async def ingest_request(log_data: RequestLog, request: Request):
         # Run detection analysis
         detection_engine = request.app.state.detection_engine
         if detection_engine:
-            result = await detection_engine.analyze_request(detection_data)
+            with tracer.span("detection.analyze") as span:
+                result = await detection_engine.analyze_request(detection_data)
+                span.set_attribute("boing.risk_score", result.risk_score)
             
             # Update log with detection results
             if result.is_suspicious:
-                cursor.execute("""
-                    UPDATE request_logs 
-                    SET is_suspicious = TRUE 
-                    WHERE id = %s
-                """, (log_id,))
-                conn.commit()
+                with tracer.span("ingest.mark_suspicious"):
+                    if settings.TELEMETRY_STORE_ENABLED:
+                        telemetry.mark_suspicious(event_id)
+                    else:
+                        cursor.execute(MARK_SUSPICIOUS, (log_id, day_of(log_data.timestamp)))
+                        conn.commit()
             
             # Broadcast to WebSocket clients
             broadcast = request.app.state.broadcast
             if broadcast:
-                await broadcast({
-                    'type': 'request_log',
-                    'data': {
-                        'id': log_id,
-                        'api_id': api_id,
-                        'timestamp': log_data.timestamp,
-                        'method': log_data.method,
-                        'endpoint': log_data.endpoint,
-                        'client_ip': log_data.client_ip,
-                        'status_code': log_data.status_code,
-                        'is_suspicious': result.is_suspicious,
-                        'risk_score': result.risk_score
-                    }
-                })
+                with tracer.span("ingest.broadcast"):
+                    await broadcast({
+                        'type': 'request_log',
+                        'data': {
+                            'id': log_id if log_id is not None else event_id,
+                            'api_id': api_id,
+                            'timestamp': log_data.timestamp,
+                            'method': log_data.method,
+                            'endpoint': log_data.endpoint,
+                            'client_ip': log_data.client_ip,
+                            'status_code': log_data.status_code,
+                            'is_suspicious': result.is_suspicious,
+                            'risk_score': result.risk_score
+                        }
+                    })
+        
+        if settings.ROLLUPS_ENABLED and not settings.TELEMETRY_STORE_ENABLED:
+            aggregator.record(
+                api_id, log_data.timestamp, endpoint_template, log_data.status_code,
+                log_data.latency_ms, result.is_suspicious if detection_engine else False,
+                log_data.client_ip, user_agent
+            )
         
+        outcome = 'success'
         return {
             "status": "success",
             "log_id": log_id,
+            "event_id": event_id,
             "is_suspicious": result.is_suspicious if detection_engine else False,
             "risk_score": result.risk_score if detection_engine else 0.0
         }
@@ -115,6 +173,30 @@ async def ingest_request(log_data: RequestLog, request: Request):
     finally:
         cursor.close()
         conn.close()
+        INGEST_IN_FLIGHT.dec()
+        INGEST_REQUESTS.labels(outcome).inc()
+        INGEST_LATENCY.observe(time.perf_counter() - started)
+
+
+def _insert_log(conn, cursor, api_id, log_data: RequestLog, endpoint_id, endpoint_params,
+                headers_json, headers_compressed, user_agent_id) -> int:
+    with tracer.span("ingest.insert_log"):
+        cursor.execute(INSERT_REQUEST_LOG, (
+            api_id,
+            log_data.timestamp,
+            log_data.method,
+            endpoint_id,
+            endpoint_params,
+            log_data.client_ip,
+            log_data.status_code,
+            log_data.latency_ms,
+            headers_json,
+            headers_compressed,
+            log_data.body_size,
+            user_agent_id
+        ))
+        conn.commit()
+        return cursor.lastrowid
 
 
 @router.get("/ingest/test")
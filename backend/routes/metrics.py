@@ -1,131 +1,382 @@
 """
 Metrics and analytics routes
 """
-from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from typing import Optional
+import asyncio
 import logging
+from collections import Counter, defaultdict
 from datetime import datetime
-import csv
-import io
+import time
 
-from models import MetricsQuery, MetricsResponse, LogQuery, ExportFormat
+import numpy as np
+
+from models import MetricsQuery, MetricsResponse, LogQuery, LogExportQuery, ExportFormat, TotalMode
 from database import get_db_connection
 from routes.auth import get_current_user
+from rollups import (
+    aggregator as rollup_aggregator, raw_plan, RollupPlan, COARSEST_FIRST,
+    TOP_K_COLUMNS, merged_ip_sketch, merged_top_k, merged_latency
+)
+from time_buckets import BucketSpec
+from cache import metrics_cache, alert_tags
+from pagination import after_cursor, page, estimated_count
+from partitions import day_conditions, day_of
+from exports import ENCODERS, COLUMNAR_FORMATS, columnar_available, stream_rows, gzip_stream
+from header_policy import inflate
+from dictionaries import decode_rows, id_column, value_sql
+from endpoint_templates import templater
+from sketches import DDSketch
+from telemetry_store import store as telemetry
+from config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def _scope_filters(user: dict, api_id: Optional[int], start_time: Optional[float],
+                   end_time: Optional[float], time_column: str = "timestamp"):
+    """WHERE conditions shared by every metrics query: ownership, API and time range"""
+    filters = []
+    params = []
+    
+    if user['role'] != 'admin':
+        filters.append("api_id IN (SELECT id FROM apis WHERE user_id = %s)")
+        params.append(user['id'])
+    
+    if api_id:
+        filters.append("api_id = %s")
+        params.append(api_id)
+    
+    # alerts only carry a DATETIME created_at, request_logs a unix timestamp
+    time_expr = "%s" if time_column == "timestamp" else "FROM_UNIXTIME(%s)"
+    
+    if start_time:
+        filters.append(f"{time_column} >= {time_expr}")
+        params.append(start_time)
+    
+    if end_time:
+        filters.append(f"{time_column} <= {time_expr}")
+        params.append(end_time)
+    
+    if time_column == "timestamp":
+        day_conds, day_params = day_conditions(start_time, end_time)
+        filters.extend(day_conds)
+        params.extend(day_params)
+    
+    return filters, params
+
+
+PERCENTILES = {'p50': 0.5, 'p95': 0.95, 'p99': 0.99}
+
+
+def _where(filters: list) -> str:
+    return "WHERE " + " AND ".join(filters) if filters else ""
+
+
+def _percentiles(sketch) -> dict:
+    """p50/p95/p99 in ms (within 1% relative error), None without latency data"""
+    if sketch is None or not sketch.count:
+        return {name: None for name in PERCENTILES}
+    return {name: round(sketch.quantile(q), 3) for name, q in PERCENTILES.items()}
+
+
+def _sources(scope: list, scope_params: list, plan: RollupPlan, rollup_table: str,
+             rollup_select: str, raw_select: str, raw_group_by: str = ""):
+    """UNION ALL of the planned rollup rows and the aggregated raw request_logs edges"""
+    branches, params = [], []
+    if plan.uses_rollups:
+        condition, condition_params = plan.rollup_condition()
+        branches.append(f"SELECT {rollup_select} FROM {rollup_table} {_where(scope + [condition])}")
+        params.extend(scope_params + condition_params)
+    condition, condition_params = plan.raw_condition()
+    if condition:
+        branches.append(f"SELECT {raw_select} FROM request_logs {_where(scope + [condition])} {raw_group_by}")
+        params.extend(scope_params + condition_params)
+    return " UNION ALL ".join(branches), params
+
+
+def _alerts_count(cursor, query: MetricsQuery, user: dict) -> int:
+    alert_filters, alert_params = _scope_filters(
+        user, query.api_id, query.start_time, query.end_time, time_column="created_at"
+    )
+    cursor.execute(f"SELECT COUNT(*) as alerts FROM alerts {_where(alert_filters)}", alert_params)
+    return cursor.fetchone()['alerts']
+
+
+def _store_metrics(cursor, query: MetricsQuery, user: dict, buckets: BucketSpec, series_end: float) -> MetricsResponse:
+    """Metrics from a scan of the telemetry store: exact counts, sketched percentiles"""
+    api_ids = None
+    if user['role'] != 'admin':
+        cursor.execute("SELECT id FROM apis WHERE user_id = %s", (user['id'],))
+        api_ids = {row['id'] for row in cursor.fetchall()}
+    if query.api_id:
+        api_ids = {query.api_id} & api_ids if api_ids is not None else {query.api_id}
+    
+    first, last = buckets.window(query.start_time, series_end)
+    total = errors = suspicious = latency_count = 0
+    latency_sum = 0.0
+    top = {'top_endpoints': Counter(), 'top_ips': Counter(), 'top_user_agents': Counter()}
+    overall, per_endpoint, per_bucket = DDSketch(), defaultdict(DDSketch), defaultdict(DDSketch)
+    counts = Counter()
+    
+    batches = telemetry.scan(
+        api_ids, query.start_time, query.end_time,
+        ['timestamp', 'status_code', 'latency_ms', 'is_suspicious', 'endpoint', 'client_ip', 'user_agent']
+    ) if api_ids is None or api_ids else []
+    for batch in batches:
+        latency = batch['latency_ms']
+        total += len(batch)
+        errors += int(np.count_nonzero(batch['status_code'] >= 400))
+        suspicious += int(np.count_nonzero(batch['is_suspicious']))
+        has_latency = ~np.isnan(latency)
+        latency_count += int(np.count_nonzero(has_latency))
+        latency_sum += float(latency[has_latency].sum(dtype=np.float64))
+        overall.add_values(latency)
+        
+        top['top_endpoints'].update(batch.counts('endpoint'))
+        top['top_ips'].update(batch.counts('client_ip'))
+        top['top_user_agents'].update(batch.counts('user_agent'))
+        endpoint_codes = batch['endpoint']
+        for code in np.unique(endpoint_codes).tolist():
+            if code >= 0:
+                per_endpoint[batch.dictionaries['endpoint'][code]].add_values(latency[endpoint_codes == code])
+        
+        bucket_starts = buckets.floor_array(batch['timestamp'])
+        in_series = (bucket_starts >= first) & (bucket_starts <= last)
+        bucket_starts, bucket_latency = bucket_starts[in_series], latency[in_series]
+        for bucket, count in zip(*(a.tolist() for a in np.unique(bucket_starts, return_counts=True))):
+            counts[bucket] += count
+            per_bucket[bucket].add_values(bucket_latency[bucket_starts == bucket])
+    
+    top_lists = {}
+    for column, dimension in TOP_K_COLUMNS.items():
+        top_lists[column] = [
+            {dimension: item, "count": count, "error": 0}
+            for item, count in sorted(top[column].items(), key=lambda kv: (-kv[1], kv[0]))[:10]
+        ]
+    for entry in top_lists['top_endpoints']:
+        entry.update(_percentiles(per_endpoint.get(entry['endpoint'])))
+    
+    series = buckets.fill(counts, first, last)
+    return MetricsResponse(
+        total_requests=total,
+        error_rate=errors / total if total else 0.0,
+        avg_latency_ms=latency_sum / latency_count if latency_count else 0.0,
+        unique_ips=len(top['top_ips']),
+        suspicious_requests=suspicious,
+        alerts_count=_alerts_count(cursor, query, user),
+        top_endpoints=top_lists['top_endpoints'],
+        top_client_ips=top_lists['top_ips'],
+        top_user_agents=top_lists['top_user_agents'],
+        requests_over_time=[{"time": buckets.label(bucket), "count": count} for bucket, count in series],
+        latency_percentiles=_percentiles(overall),
+        latency_over_time=[
+            {"time": buckets.label(bucket), **_percentiles(per_bucket.get(bucket))} for bucket, _ in series
+        ] if counts else []
+    )
+
+
 @router.post("/metrics", response_model=MetricsResponse)
 async def get_metrics(query: MetricsQuery, user: dict = Depends(get_current_user)):
     """Get aggregated metrics"""
-    conn = get_db_connection()
+    return await metrics_cache.get_or_compute(
+        metrics_cache.key(user, **query.model_dump()),
+        lambda: asyncio.to_thread(_compute_metrics, query, user),
+        tags=alert_tags(query.api_id)
+    )
+
+
+def _compute_metrics(query: MetricsQuery, user: dict) -> MetricsResponse:
+    series_end = query.end_time or time.time()
+    try:
+        buckets = BucketSpec(query.interval or 'hour', query.timezone, series_end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    conn = get_db_connection(read_only=True)
     cursor = conn.cursor()
     
     try:
-        # Build filters
-        filters = []
-        params = []
-        
-        if user['role'] != 'admin':
-            filters.append("api_id IN (SELECT id FROM apis WHERE user_id = %s)")
-            params.append(user['id'])
-        
-        if query.api_id:
-            filters.append("api_id = %s")
-            params.append(query.api_id)
-        
-        if query.start_time:
-            filters.append("timestamp >= %s")
-            params.append(query.start_time)
-        
-        if query.end_time:
-            filters.append("timestamp <= %s")
-            params.append(query.end_time)
-        
-        where_clause = "WHERE " + " AND ".join(filters) if filters else ""
-        
-        # Total requests
-        cursor.execute(f"SELECT COUNT(*) as total FROM request_logs {where_clause}", params)
-        total_requests = cursor.fetchone()['total']
-        
-        # Error rate
-        cursor.execute(f"""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) as errors
-            FROM request_logs {where_clause}
-        """, params)
-        result = cursor.fetchone()
-        error_rate = result['errors'] / result['total'] if result['total'] > 0 else 0.0
-        
-        # Average latency
-        cursor.execute(f"""
-            SELECT AVG(latency_ms) as avg_latency 
-            FROM request_logs {where_clause} AND latency_ms IS NOT NULL
-        """, params)
-        avg_latency = cursor.fetchone()['avg_latency'] or 0.0
-        
-        # Unique IPs
-        cursor.execute(f"""
-            SELECT COUNT(DISTINCT client_ip) as unique_ips 
-            FROM request_logs {where_clause}
-        """, params)
-        unique_ips = cursor.fetchone()['unique_ips']
-        
-        # Suspicious requests
-        cursor.execute(f"""
-            SELECT COUNT(*) as suspicious 
-            FROM request_logs {where_clause} {"AND" if where_clause else "WHERE"} is_suspicious = TRUE
-        """, params)
-        suspicious_requests = cursor.fetchone()['suspicious']
-        
-        # Alerts count
-        alert_filters = filters.copy()
-        alert_params = params.copy()
-        alert_where = "WHERE " + " AND ".join(alert_filters) if alert_filters else ""
-        
-        cursor.execute(f"SELECT COUNT(*) as alerts FROM alerts {alert_where}", alert_params)
-        alerts_count = cursor.fetchone()['alerts']
-        
-        # Top endpoints
-        cursor.execute(f"""
-            SELECT endpoint, COUNT(*) as count 
-            FROM request_logs {where_clause}
-            GROUP BY endpoint 
-            ORDER BY count DESC 
-            LIMIT 10
-        """, params)
-        top_endpoints = [{"endpoint": row['endpoint'], "count": row['count']} for row in cursor.fetchall()]
-        
-        # Requests over time
-        interval_map = {
-            'minute': 'DATE_FORMAT(FROM_UNIXTIME(timestamp), "%%Y-%%m-%%d %%H:%%i")',
-            'hour': 'DATE_FORMAT(FROM_UNIXTIME(timestamp), "%%Y-%%m-%%d %%H:00")',
-            'day': 'DATE_FORMAT(FROM_UNIXTIME(timestamp), "%%Y-%%m-%%d")'
-        }
-        interval_expr = interval_map.get(query.interval, interval_map['hour'])
-        
+        if settings.TELEMETRY_STORE_ENABLED:
+            return _store_metrics(cursor, query, user, buckets, series_end)
+        
+        filters, params = _scope_filters(user, query.api_id, query.start_time, query.end_time)
+        where_clause = _where(filters)
+        scope, scope_params = _scope_filters(user, query.api_id, None, None)
+        
+        # Whole buckets come from rollups, the partial edges from raw rows
+        plan = rollup_aggregator.plan(query.start_time, query.end_time)
+        unique_ips_error = 0.0
+        
+        if plan.uses_rollups:
+            sources, source_params = _sources(
+                scope, scope_params, plan, "request_rollups",
+                """SUM(request_count) as total, SUM(error_count) as errors,
+                   SUM(suspicious_count) as suspicious, SUM(latency_count) as latency_count,
+                   SUM(latency_sum) as latency_sum""",
+                """COUNT(*), SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN is_suspicious THEN 1 ELSE 0 END), COUNT(latency_ms),
+                   SUM(latency_ms)"""
+            )
+            cursor.execute(f"""
+                SELECT 
+                    SUM(total) as total,
+                    SUM(errors) as errors,
+                    SUM(suspicious) as suspicious,
+                    SUM(latency_count) as latency_count,
+                    SUM(latency_sum) as latency_sum
+                FROM ({sources}) as sources
+            """, source_params)
+            result = cursor.fetchone()
+            latency_count = int(result['latency_count'] or 0)
+            result['avg_latency'] = float(result['latency_sum']) / latency_count if latency_count else None
+            
+            # Distinct IPs do not add up across buckets: merge HyperLogLog sketches
+            ip_plan = rollup_aggregator.plan(query.start_time, query.end_time, family='ip_sketch')
+            if not query.exact and ip_plan.uses_rollups:
+                sketch = merged_ip_sketch(cursor, scope, scope_params, ip_plan)
+                result['unique_ips'] = sketch.count()
+                unique_ips_error = sketch.relative_error
+            else:
+                cursor.execute(f"SELECT COUNT(DISTINCT client_ip) as unique_ips FROM request_logs {where_clause}", params)
+                result['unique_ips'] = cursor.fetchone()['unique_ips']
+        else:
+            # Scalar metrics in a single pass over the matching rows
+            cursor.execute(f"""
+                SELECT 
+                    COUNT(*) as total,
+                    SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) as errors,
+                    AVG(latency_ms) as avg_latency,
+                    COUNT(DISTINCT client_ip) as unique_ips,
+                    SUM(CASE WHEN is_suspicious THEN 1 ELSE 0 END) as suspicious
+                FROM request_logs {where_clause}
+            """, params)
+            result = cursor.fetchone()
+        
+        total_requests = int(result['total'] or 0)
+        error_rate = float(result['errors']) / total_requests if total_requests > 0 else 0.0
+        avg_latency = float(result['avg_latency'] or 0.0)
+        unique_ips = result['unique_ips']
+        suspicious_requests = int(result['suspicious'] or 0)
+        
+        alerts_count = _alerts_count(cursor, query, user)
+        
+        # Heavy hitters: Space-Saving sketches from rollups unless exact counts are asked for
+        top_plan = rollup_aggregator.plan(query.start_time, query.end_time, family='top_k')
+        approximate = not query.exact and top_plan.uses_rollups
+        top = {}
+        for column, dimension in TOP_K_COLUMNS.items():
+            if approximate:
+                summary = merged_top_k(cursor, scope, scope_params, top_plan, column)
+                top[column] = [
+                    {dimension: item, "count": count, "error": error}
+                    for item, count, error in summary.top(10)
+                ]
+            elif column == 'top_endpoints':
+                sources, source_params = _sources(
+                    scope, scope_params, plan, "request_rollup_endpoints",
+                    "endpoint, request_count as count", f"{value_sql('endpoint')} as endpoint, COUNT(*) as count", "GROUP BY endpoint_id"
+                )
+                cursor.execute(f"""
+                    SELECT endpoint, SUM(count) as count 
+                    FROM ({sources}) as sources
+                    GROUP BY endpoint 
+                    ORDER BY count DESC 
+                    LIMIT 10
+                """, source_params)
+                top[column] = [
+                    {"endpoint": row['endpoint'], "count": int(row['count']), "error": 0}
+                    for row in cursor.fetchall()
+                ]
+            else:
+                cursor.execute(f"""
+                    SELECT {value_sql(dimension)} as {dimension}, COUNT(*) as count 
+                    FROM request_logs {_where(filters + [f"{id_column(dimension)} IS NOT NULL"])}
+                    GROUP BY {id_column(dimension)} 
+                    ORDER BY count DESC 
+                    LIMIT 10
+                """, params)
+                top[column] = [
+                    {dimension: row[dimension], "count": int(row['count']), "error": 0}
+                    for row in cursor.fetchall()
+                ]
+        
+        # Requests over time: integer buckets of the last MAX_BUCKETS widths, rolled up
+        # buckets are used when they nest inside the requested width
+        first, last = buckets.window(query.start_time, series_end)
+        series_start = max(query.start_time or first, first)
+        granularity = buckets.rollup_granularity
+        if granularity:
+            series_plan = rollup_aggregator.plan(series_start, query.end_time, levels=[granularity])
+        else:
+            series_plan = raw_plan(series_start, query.end_time)
+        sources, source_params = _sources(
+            scope, scope_params, series_plan, "request_rollups",
+            f"{buckets.sql('bucket_start')} as time_bucket, request_count as count",
+            f"{buckets.sql('timestamp')} as time_bucket, COUNT(*) as count",
+            "GROUP BY time_bucket"
+        )
         cursor.execute(f"""
             SELECT 
-                {interval_expr} as time_bucket,
-                COUNT(*) as count
-            FROM request_logs {where_clause}
+                time_bucket,
+                SUM(count) as count
+            FROM ({sources}) as sources
             GROUP BY time_bucket
             ORDER BY time_bucket DESC
-            LIMIT 100
-        """, params)
-        requests_over_time = [{"time": row['time_bucket'], "count": row['count']} for row in cursor.fetchall()]
+        """, source_params)
+        counts = {int(row['time_bucket']): int(row['count']) for row in cursor.fetchall()}
+        series = buckets.fill(counts, first, last)
+        requests_over_time = [
+            {"time": buckets.label(bucket), "count": count} for bucket, count in series
+        ]
+        
+        # Latency percentiles from DDSketches: overall, per top endpoint and per time bucket
+        def latency_plan(start_time, levels=COARSEST_FIRST):
+            if query.exact or not levels:
+                return raw_plan(start_time, query.end_time)
+            return rollup_aggregator.plan(start_time, query.end_time, levels=levels, family='latency')
+        
+        overall = merged_latency(cursor, scope, scope_params, latency_plan(query.start_time))
+        latency_percentiles = _percentiles(overall.get(None))
+        
+        if top['top_endpoints']:
+            # Grouped over every endpoint template: request_logs filters by id, rollups by name
+            per_endpoint = merged_latency(
+                cursor, scope, scope_params,
+                latency_plan(query.start_time), table="request_rollup_endpoints", group=("endpoint", "endpoint")
+            )
+            for entry in top['top_endpoints']:
+                entry.update(_percentiles(per_endpoint.get(entry['endpoint'])))
+        
+        latency_over_time = []
+        if counts:
+            per_bucket = merged_latency(
+                cursor, scope, scope_params,
+                latency_plan(series_start, levels=[granularity] if granularity else None),
+                group=(buckets.sql('bucket_start'), buckets.sql('timestamp'))
+            )
+            latency_over_time = [
+                {"time": buckets.label(bucket), **_percentiles(per_bucket.get(bucket))}
+                for bucket, _ in series
+            ]
         
         return MetricsResponse(
             total_requests=total_requests,
             error_rate=error_rate,
             avg_latency_ms=avg_latency,
             unique_ips=unique_ips,
+            unique_ips_exact=unique_ips_error == 0.0,
+            unique_ips_error=unique_ips_error,
             suspicious_requests=suspicious_requests,
             alerts_count=alerts_count,
-            top_endpoints=top_endpoints,
-            requests_over_time=requests_over_time
+            top_endpoints=top['top_endpoints'],
+            top_client_ips=top['top_ips'],
+            top_user_agents=top['top_user_agents'],
+            requests_over_time=requests_over_time,
+            latency_percentiles=latency_percentiles,
+            latency_over_time=latency_over_time
         )
         
     finally:
@@ -133,10 +384,56 @@ async def get_metrics(query: MetricsQuery, user: dict = Depends(get_current_user
         conn.close()
 
 
+def _endpoint_filter(cursor, user: dict, api_id: Optional[int], endpoint: str):
+    """Rows whose raw endpoint is the searched one, or whose template or parameters contain it
+
+    A raw path is stored as its route template and parameters, so it is split
+    the way ingest splits it, per API in scope; query strings of stored rows
+    are ignored unless the search has one.
+    """
+    if api_id:
+        api_ids = [api_id]
+    elif user['role'] != 'admin':
+        cursor.execute("SELECT id FROM apis WHERE user_id = %s", (user['id'],))
+        api_ids = [row['id'] for row in cursor.fetchall()]
+    else:
+        cursor.execute("SELECT id FROM apis")
+        api_ids = [row['id'] for row in cursor.fetchall()]
+    
+    conditions = ["endpoint_id IN (SELECT id FROM endpoints WHERE value LIKE %s)", "endpoint_params LIKE %s"]
+    params = [f"%{endpoint}%"] * 2
+    for template, template_params in sorted({templater.lookup(i, endpoint) for i in api_ids}, key=str):
+        if template_params is None:
+            conditions.append("endpoint_id = (SELECT id FROM endpoints WHERE value = %s)")
+            params.append(template)
+        else:
+            conditions.append(
+                "(endpoint_id = (SELECT id FROM endpoints WHERE value = %s)"
+                " AND (endpoint_params = %s OR SUBSTR(endpoint_params, 1, %s) = %s))"
+            )
+            params.extend([template, template_params, len(template_params) + 1, template_params + "?"])
+    return "(" + " OR ".join(conditions) + ")", params
+
+
+def _require_request_logs(end_time: Optional[float]):
+    """Refuse log searches reaching into the telemetry store, which only keeps metrics columns"""
+    if not settings.TELEMETRY_STORE_ENABLED:
+        return
+    first_window = telemetry.first_window()
+    if first_window is not None and (end_time is None or end_time >= first_window):
+        since = datetime.utcfromtimestamp(first_window).isoformat() + "Z"
+        raise HTTPException(
+            status_code=501,
+            detail=f"Requests since {since} are kept in the telemetry store, which log search and export "
+                   f"do not cover; set end_time before {first_window:.0f} to search older request logs"
+        )
+
+
 @router.post("/logs/query")
 async def query_logs(query: LogQuery, user: dict = Depends(get_current_user)):
     """Query request logs with filters"""
-    conn = get_db_connection()
+    _require_request_logs(query.end_time)
+    conn = get_db_connection(read_only=True)
     cursor = conn.cursor()
     
     try:
@@ -160,13 +457,22 @@ async def query_logs(query: LogQuery, user: dict = Depends(get_current_user)):
             filters.append("timestamp <= %s")
             params.append(query.end_time)
         
+        day_conds, day_params = day_conditions(query.start_time, query.end_time)
+        filters.extend(day_conds)
+        params.extend(day_params)
+        
         if query.client_ip:
             filters.append("client_ip = %s")
             params.append(query.client_ip)
         
         if query.endpoint:
-            filters.append("endpoint LIKE %s")
-            params.append(f"%{query.endpoint}%")
+            condition, condition_params = _endpoint_filter(cursor, user, query.api_id, query.endpoint)
+            filters.append(condition)
+            params.extend(condition_params)
+        
+        if query.route:
+            filters.append("endpoint_id = (SELECT id FROM endpoints WHERE value = %s)")
+            params.append(query.route)
         
         if query.min_status:
             filters.append("status_code >= %s")
@@ -181,23 +487,40 @@ async def query_logs(query: LogQuery, user: dict = Depends(get_current_user)):
         
         where_clause = "WHERE " + " AND ".join(filters) if filters else ""
         
-        # Get total count
-        cursor.execute(f"SELECT COUNT(*) as total FROM request_logs {where_clause}", params)
-        total = cursor.fetchone()['total']
-        
-        # Get logs
-        params.extend([query.limit, query.offset])
+        # Total count, unless the caller can do without it
+        total = None
+        if query.total == TotalMode.exact:
+            cursor.execute(f"SELECT COUNT(*) as total FROM request_logs {where_clause}", params)
+            total = cursor.fetchone()['total']
+        elif query.total == TotalMode.estimate:
+            total = estimated_count(cursor, "request_logs", where_clause, params)
+        
+        # Get logs: keyset pagination after a cursor, OFFSET otherwise
+        offset = query.offset
+        if query.cursor:
+            try:
+                condition, cursor_params = after_cursor(query.cursor, "timestamp")
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            filters.extend([condition, "ts_day <= %s"])
+            params.extend(cursor_params + [day_of(cursor_params[0])])
+            where_clause = "WHERE " + " AND ".join(filters)
+            offset = 0
+        
+        params.extend([query.limit + 1, offset])
         cursor.execute(f"""
             SELECT * FROM request_logs {where_clause}
-            ORDER BY timestamp DESC
+            ORDER BY timestamp DESC, id DESC
             LIMIT %s OFFSET %s
         """, params)
-        logs = cursor.fetchall()
+        logs, next_cursor = page(decode_rows([inflate(row) for row in cursor.fetchall()]), query.limit, "timestamp")
         
         return {
             "total": total,
+            "total_exact": query.total == TotalMode.exact,
             "limit": query.limit,
-            "offset": query.offset,
+            "offset": offset,
+            "next_cursor": next_cursor,
             "logs": logs
         }
         
@@ -208,66 +531,66 @@ async def query_logs(query: LogQuery, user: dict = Depends(get_current_user)):
 
 @router.post("/logs/export")
 async def export_logs(
-    query: LogQuery,
+    query: LogExportQuery,
     format: ExportFormat = ExportFormat.csv,
+    gzip: bool = False,
     user: dict = Depends(get_current_user)
 ):
-    """Export logs to CSV or JSON"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """Stream logs as CSV, NDJSON, JSON, Parquet or Arrow IPC, optionally gzip-compressed"""
+    if format.value in COLUMNAR_FORMATS and not columnar_available():
+        raise HTTPException(status_code=501, detail=f"{format.value} export requires pyarrow")
+    _require_request_logs(query.end_time)
     
-    try:
-        # Build filters (same as query_logs)
-        filters = []
-        params = []
-        
-        if user['role'] != 'admin':
-            filters.append("api_id IN (SELECT id FROM apis WHERE user_id = %s)")
-            params.append(user['id'])
-        
-        if query.api_id:
-            filters.append("api_id = %s")
-            params.append(query.api_id)
-        
-        if query.start_time:
-            filters.append("timestamp >= %s")
-            params.append(query.start_time)
-        
-        if query.end_time:
-            filters.append("timestamp <= %s")
-            params.append(query.end_time)
-        
-        if query.suspicious_only:
-            filters.append("is_suspicious = TRUE")
-        
-        where_clause = "WHERE " + " AND ".join(filters) if filters else ""
-        
-        # Get logs (limit to prevent huge exports)
-        params.append(min(query.limit, 10000))
-        cursor.execute(f"""
-            SELECT * FROM request_logs {where_clause}
-            ORDER BY timestamp DESC
-            LIMIT %s
-        """, params)
-        logs = cursor.fetchall()
-        
-        if format == ExportFormat.csv:
-            # Generate CSV
-            output = io.StringIO()
-            if logs:
-                writer = csv.DictWriter(output, fieldnames=logs[0].keys())
-                writer.writeheader()
-                writer.writerows(logs)
-            
-            return Response(
-                content=output.getvalue(),
-                media_type="text/csv",
-                headers={"Content-Disposition": f"attachment; filename=boing_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
-            )
-        else:
-            # Return JSON
-            return {"logs": logs}
-        
-    finally:
-        cursor.close()
-        conn.close()
+    # Build filters (same as query_logs)
+    filters = []
+    params = []
+    
+    if user['role'] != 'admin':
+        filters.append("api_id IN (SELECT id FROM apis WHERE user_id = %s)")
+        params.append(user['id'])
+    
+    if query.api_id:
+        filters.append("api_id = %s")
+        params.append(query.api_id)
+    
+    if query.start_time:
+        filters.append("timestamp >= %s")
+        params.append(query.start_time)
+    
+    if query.end_time:
+        filters.append("timestamp <= %s")
+        params.append(query.end_time)
+    
+    day_conds, day_params = day_conditions(query.start_time, query.end_time)
+    filters.extend(day_conds)
+    params.extend(day_params)
+    
+    if query.suspicious_only:
+        filters.append("is_suspicious = TRUE")
+    
+    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
+    
+    limit_clause = ""
+    if query.limit:
+        limit_clause = "LIMIT %s"
+        params.append(query.limit)
+    
+    encoder, media_type, extension = ENCODERS[format.value]
+    batches = stream_rows(f"""
+        SELECT * FROM request_logs {where_clause}
+        ORDER BY timestamp DESC
+        {limit_clause}
+    """, params)
+    body = encoder(decode_rows([inflate(row) for row in rows]) for rows in batches)
+    
+    filename = f"boing_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    if gzip:
+        body = gzip_stream(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
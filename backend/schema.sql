@@ -1,4 +1,6 @@
 -- Boing Database Schema
+-- Creates a new database at the latest schema; existing databases are
+-- upgraded with `python migrate.py` (see migrations/)
 
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
@@ -8,9 +10,9 @@ CREATE TABLE IF NOT EXISTS users (
     full_name VARCHAR(255),
     role ENUM('admin', 'user') DEFAULT 'user',
     is_active BOOLEAN DEFAULT TRUE,
+    last_login TIMESTAMP NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    INDEX idx_email (email),
     INDEX idx_role (role)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -28,40 +30,64 @@ CREATE TABLE IF NOT EXISTS apis (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_user_id (user_id),
-    INDEX idx_api_key (api_key),
     INDEX idx_is_active (is_active)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Dictionaries of request_logs dimensions (see dictionaries.py); values are
+-- compared case-sensitively
+CREATE TABLE IF NOT EXISTS endpoints (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(512) COLLATE utf8mb4_bin NOT NULL,
+    UNIQUE KEY uq_value (value)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS user_agents (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(512) COLLATE utf8mb4_bin NOT NULL,
+    UNIQUE KEY uq_value (value)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Request logs table
+-- Partitioned by day (partitions.py creates and drops them), so it cannot
+-- have foreign keys; rows of a deleted API are removed by the API route
 CREATE TABLE IF NOT EXISTS request_logs (
-    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    id BIGINT AUTO_INCREMENT,
     api_id INT NOT NULL,
     timestamp DOUBLE NOT NULL,
     method VARCHAR(10) NOT NULL,
-    endpoint VARCHAR(512) NOT NULL,
+    endpoint_id INT NOT NULL,  -- endpoints.id of the route template
+    endpoint_params VARCHAR(512),  -- template parameters and query string, NULL for static paths
     client_ip VARCHAR(45) NOT NULL,
     status_code INT,
     latency_ms FLOAT,
     headers JSON,
+    headers_compressed BLOB,  -- zlib-compressed headers JSON, when the API's header policy compresses
     body_size INT DEFAULT 0,
-    user_agent VARCHAR(512),
+    user_agent_id INT,  -- user_agents.id
     geo_country VARCHAR(2),
     geo_city VARCHAR(100),
     is_suspicious BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE,
-    INDEX idx_api_id (api_id),
+    ts_day INT GENERATED ALWAYS AS (FLOOR(timestamp / 86400)) STORED NOT NULL,
+    PRIMARY KEY (id, ts_day),
+    INDEX idx_api_timestamp (api_id, timestamp),
+    INDEX idx_api_suspicious_timestamp (api_id, is_suspicious, timestamp),
+    INDEX idx_api_id_latency (api_id, id, latency_ms),
+    INDEX idx_api_endpoint_id_latency (api_id, endpoint_id, id, latency_ms),
     INDEX idx_timestamp (timestamp),
     INDEX idx_client_ip (client_ip),
-    INDEX idx_is_suspicious (is_suspicious),
     INDEX idx_created_at (created_at)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+PARTITION BY RANGE (ts_day) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
 
 -- Alerts table
 CREATE TABLE IF NOT EXISTS alerts (
     id BIGINT AUTO_INCREMENT PRIMARY KEY,
     api_id INT NOT NULL,
-    log_id BIGINT,
+    log_id BIGINT,  -- request_logs.id (no foreign key: request_logs is partitioned)
+    event_id BIGINT NULL,  -- telemetry store event id, when the request is kept there
     alert_type VARCHAR(50) NOT NULL,
     severity ENUM('low', 'medium', 'high', 'critical') NOT NULL,
     score FLOAT NOT NULL,
@@ -74,9 +100,9 @@ CREATE TABLE IF NOT EXISTS alerts (
     acknowledged_at TIMESTAMP NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE,
-    FOREIGN KEY (log_id) REFERENCES request_logs(id) ON DELETE SET NULL,
     FOREIGN KEY (acknowledged_by) REFERENCES users(id) ON DELETE SET NULL,
-    INDEX idx_api_id (api_id),
+    INDEX idx_api_created (api_id, created_at),
+    INDEX idx_log_id (log_id),
     INDEX idx_severity (severity),
     INDEX idx_is_acknowledged (is_acknowledged),
     INDEX idx_created_at (created_at)
@@ -92,8 +118,7 @@ CREATE TABLE IF NOT EXISTS detector_configs (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE,
-    UNIQUE KEY unique_detector_per_api (api_id, detector_name),
-    INDEX idx_api_id (api_id)
+    UNIQUE KEY unique_detector_per_api (api_id, detector_name)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- IP Blacklist table
@@ -106,7 +131,6 @@ CREATE TABLE IF NOT EXISTS ip_blacklist (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (added_by) REFERENCES users(id) ON DELETE CASCADE,
     UNIQUE KEY unique_ip (ip_address),
-    INDEX idx_ip_address (ip_address),
     INDEX idx_expires_at (expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -118,8 +142,7 @@ CREATE TABLE IF NOT EXISTS ip_whitelist (
     added_by INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (added_by) REFERENCES users(id) ON DELETE CASCADE,
-    UNIQUE KEY unique_ip (ip_address),
-    INDEX idx_ip_address (ip_address)
+    UNIQUE KEY unique_ip (ip_address)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Audit logs table
@@ -166,3 +189,86 @@ CREATE TABLE IF NOT EXISTS alert_notifications (
     INDEX idx_alert_id (alert_id),
     INDEX idx_status (status)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Per-API request rollups (minute/hour/day buckets, maintained by rollups.py)
+CREATE TABLE IF NOT EXISTS request_rollups (
+    api_id INT NOT NULL,
+    granularity ENUM('minute', 'hour', 'day') NOT NULL,
+    bucket_start BIGINT NOT NULL,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    error_count BIGINT NOT NULL DEFAULT 0,
+    suspicious_count BIGINT NOT NULL DEFAULT 0,
+    latency_count BIGINT NOT NULL DEFAULT 0,
+    latency_sum DOUBLE NOT NULL DEFAULT 0,
+    ip_sketch BLOB,
+    top_endpoints BLOB,
+    top_ips BLOB,
+    top_user_agents BLOB,
+    latency_sketch BLOB,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (api_id, granularity, bucket_start),
+    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Per-endpoint request rollups
+CREATE TABLE IF NOT EXISTS request_rollup_endpoints (
+    api_id INT NOT NULL,
+    granularity ENUM('minute', 'hour', 'day') NOT NULL,
+    bucket_start BIGINT NOT NULL,
+    endpoint VARCHAR(512) NOT NULL,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    error_count BIGINT NOT NULL DEFAULT 0,
+    suspicious_count BIGINT NOT NULL DEFAULT 0,
+    latency_count BIGINT NOT NULL DEFAULT 0,
+    latency_sum DOUBLE NOT NULL DEFAULT 0,
+    latency_sketch BLOB,
+    PRIMARY KEY (api_id, granularity, bucket_start, endpoint),
+    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Rollup bookkeeping (coverage_start: rollups are complete from this unix time)
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    value DOUBLE NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Per-API raw log retention (NULL columns use the RETENTION_* defaults, 0 keeps forever)
+CREATE TABLE IF NOT EXISTS retention_policies (
+    api_id INT PRIMARY KEY,
+    headers_days INT,
+    raw_days INT,
+    suspicious_days INT,
+    alert_days INT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Route templates per API: uploaded OpenAPI paths and templates learned from traffic
+CREATE TABLE IF NOT EXISTS api_routes (
+    api_id INT NOT NULL,
+    template VARCHAR(512) COLLATE utf8mb4_bin NOT NULL,
+    source VARCHAR(10) NOT NULL,  -- openapi or learned
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (api_id, template),
+    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Per-API header capture (NULL columns use the HEADER_* defaults; lists are comma separated)
+CREATE TABLE IF NOT EXISTS header_policies (
+    api_id INT PRIMARY KEY,
+    allow_list TEXT,
+    sensitive TEXT,
+    max_value_bytes INT,
+    max_total_bytes INT,
+    compress BOOLEAN,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (api_id) REFERENCES apis(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Applied migrations (maintained by migrate.py)
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
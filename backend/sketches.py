@@ -0,0 +1,229 @@
+"""
+Sketches - Mergeable approximate summaries stored alongside rollups
+
+HyperLogLog estimates distinct counts (unique client IPs) in fixed memory.
+Sketches of adjacent buckets merge losslessly (register-wise max), so the
+distinct count of any range of rollup buckets is the estimate of the merged
+sketch. With 2^p registers the relative standard error is 1.04 / sqrt(2^p):
+about 1.6% at the default precision of 12 (4096 registers), i.e. estimates
+are within +/-3.3% of the exact value ~95% of the time.
+
+SpaceSaving keeps the heaviest hitters (endpoints, client IPs, user agents)
+in a fixed number of counters. Counts are never underestimated; each one
+carries the maximum overestimate, and any item more frequent than N/capacity
+is guaranteed to be tracked.
+
+DDSketch answers latency quantiles with a relative error guarantee: values
+are counted in logarithmic bins ceil(log_gamma(x)), so every quantile is
+within RELATIVE_ACCURACY (1%) of the true value, bins add up when sketches
+merge, and the same bins can be computed in SQL for raw rows.
+"""
+import hashlib
+import json
+import math
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_PRECISION = 12
+DEFAULT_CAPACITY = 64
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+MIN_LATENCY_MS = 0.001    # smaller values (and zero) share one bin
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[np.ndarray] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of count()"""
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value: str):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Compact form for BLOB columns; sparse sketches compress to a few bytes"""
+        return zlib.compress(bytes([self.precision]) + self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        raw = zlib.decompress(data)
+        registers = np.frombuffer(raw[1:], dtype=np.uint8).copy()
+        return cls(raw[0], registers)
+
+
+class SpaceSaving:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, counters: Optional[Dict[str, List[int]]] = None):
+        self.capacity = capacity
+        self.counters: Dict[str, List[int]] = counters if counters is not None else {}  # item -> [count, error]
+
+    def _floor(self) -> int:
+        """Largest count an untracked item can have"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def add(self, item: str, count: int = 1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+        else:
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def update(self, counts: Dict[str, int]):
+        # Heaviest first, so exact counts are kept for the items that matter
+        for item, count in sorted(counts.items(), key=lambda kv: kv[1], reverse=True):
+            self.add(item, count)
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """Combine two summaries; items missing from one side count as its floor"""
+        floor_a, floor_b = self._floor(), other._floor()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            count_a, error_a = self.counters.get(item, (floor_a, floor_a))
+            count_b, error_b = other.counters.get(item, (floor_b, floor_b))
+            merged[item] = [count_a + count_b, error_a + error_b]
+        keep = sorted(merged.items(), key=lambda kv: kv[1][0], reverse=True)[:self.capacity]
+        self.counters = dict(keep)
+        return self
+
+    def top(self, n: int = 10) -> List[Tuple[str, int, int]]:
+        """(item, count, max overestimate), most frequent first"""
+        ranked = sorted(self.counters.items(), key=lambda kv: (-kv[1][0], kv[0]))[:n]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps([self.capacity, self.counters], separators=(",", ":")).encode())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SpaceSaving":
+        capacity, counters = json.loads(zlib.decompress(data))
+        return cls(capacity, counters)
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, bins: Optional[Dict[int, int]] = None,
+                 zero_count: int = 0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = bins if bins is not None else {}
+        self.zero_count = zero_count
+
+    def bin_of(self, value: float) -> Optional[int]:
+        if value <= MIN_LATENCY_MS:
+            return None
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def add(self, value: float, count: int = 1):
+        index = self.bin_of(value)
+        if index is None:
+            self.zero_count += count
+        else:
+            self.bins[index] = self.bins.get(index, 0) + count
+            if len(self.bins) > MAX_BINS:
+                self._collapse()
+
+    def add_values(self, values: np.ndarray):
+        """Add an array of values at once (NaN is skipped)"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        small = values <= MIN_LATENCY_MS
+        self.zero_count += int(np.count_nonzero(small))
+        indexes, counts = np.unique(np.ceil(np.log(values[~small]) / self.log_gamma), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.bins[int(index)] = self.bins.get(int(index), 0) + count
+        if len(self.bins) > MAX_BINS:
+            self._collapse()
+
+    def add_bin(self, index: Optional[int], count: int):
+        """Add a pre-computed bin (e.g. from the SQL histogram of raw rows)"""
+        if index is None:
+            self.zero_count += count
+        else:
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def _collapse(self):
+        # Fold the lowest bins together; only the smallest quantiles lose accuracy
+        indexes = sorted(self.bins)
+        keep = indexes[-MAX_BINS:]
+        folded = sum(self.bins.pop(i) for i in indexes[:-MAX_BINS])
+        self.bins[keep[0]] += folded
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge DDSketches of different accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        if len(self.bins) > MAX_BINS:
+            self._collapse()
+        return self
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bins.values())
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_bytes(self) -> bytes:
+        payload = [self.relative_accuracy, self.zero_count, sorted(self.bins.items())]
+        return zlib.compress(json.dumps(payload, separators=(",", ":")).encode())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDSketch":
+        relative_accuracy, zero_count, bins = json.loads(zlib.decompress(data))
+        return cls(relative_accuracy, {int(k): v for k, v in bins}, zero_count)
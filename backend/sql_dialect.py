@@ -0,0 +1,158 @@
+"""
+SQL dialect - Run the MySQL statements of the codebase on SQLite
+
+Routes and jobs write MySQL SQL with pymysql placeholders. The SQLite backend
+(database.py, DB_BACKEND=sqlite) passes every statement through translate(),
+which rewrites the constructs used in this codebase:
+
+- %s / %(name)s placeholders to ? / :name, %% to %
+- INSERT IGNORE, ON DUPLICATE KEY UPDATE (VALUES(col) -> excluded.col,
+  col = LAST_INSERT_ID(col) -> RETURNING col), GREATEST/LEAST
+- NOW(), DATE_ADD/DATE_SUB(..., INTERVAL n UNIT), FROM_UNIXTIME(x)
+- DELETE/UPDATE ... LIMIT n, as a rowid subquery
+- FOR UPDATE is dropped: SQLite runs one write transaction at a time
+- CREATE TABLE: AUTO_INCREMENT keys become INTEGER PRIMARY KEY AUTOINCREMENT,
+  inline INDEX/KEY definitions separate CREATE INDEX statements (named
+  <table>_<index>: SQLite index names are global), and ENUM, collations,
+  ON UPDATE CURRENT_TIMESTAMP, table options and partitioning are dropped
+
+Anything else is passed through unchanged. Translations are cached per
+statement text, so the rewrite costs one dict lookup on hot paths.
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+INTERVAL_UNITS = {'SECOND': 'seconds', 'MINUTE': 'minutes', 'HOUR': 'hours', 'DAY': 'days'}
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+_DATE_ARITHMETIC = re.compile(
+    r"\bDATE_(ADD|SUB)\(\s*((?:[^,()]|\(\))+?)\s*,\s*INTERVAL\s+(\d+)\s+(SECOND|MINUTE|HOUR|DAY)\s*\)", re.IGNORECASE
+)
+_REWRITES = [
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE), "INSERT OR IGNORE"),
+    (re.compile(r"\bNOW\(\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bFROM_UNIXTIME\(([^()]*)\)", re.IGNORECASE), r"datetime(\1, 'unixepoch')"),
+    (re.compile(r"\bGREATEST\(", re.IGNORECASE), "MAX("),
+    (re.compile(r"\bLEAST\(", re.IGNORECASE), "MIN("),
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE), ""),
+]
+_UPSERT = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b(.*)$", re.IGNORECASE | re.DOTALL)
+_LIMITED_WRITE = re.compile(
+    r"^\s*(DELETE\s+FROM\s+(\w+)|UPDATE\s+(\w+)\s+SET\s+.*?)\s+WHERE\s+(.*)\s+LIMIT\s+(\S+)\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+_CREATE_TABLE = re.compile(r"^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\(", re.IGNORECASE)
+_INDEX = re.compile(r"^(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*(\(.*\))$", re.IGNORECASE | re.DOTALL)
+_UNIQUE_KEY = re.compile(r"^UNIQUE\s+(?:KEY|INDEX)\s+\w+\s*(\(.*\))$", re.IGNORECASE | re.DOTALL)
+_PRIMARY_KEY = re.compile(r"^PRIMARY\s+KEY\s*\(", re.IGNORECASE)
+_COLUMN_CLEANUP = [
+    (re.compile(r"\bENUM\s*\([^)]*\)", re.IGNORECASE), "TEXT"),
+    (re.compile(r"\s+COLLATE\s+\w+", re.IGNORECASE), ""),
+    (re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP", re.IGNORECASE), ""),
+    (re.compile(r"\s+UNSIGNED\b", re.IGNORECASE), ""),
+]
+
+
+def _placeholders(sql: str, named: bool) -> str:
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        return f":{match.group(1)}" if named and match.group(1) else "?"
+    return _PLACEHOLDER.sub(replace, sql)
+
+
+def _split_top_level(body: str) -> List[str]:
+    """Comma separated items of a definition list, ignoring commas inside parentheses"""
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(body):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(body[start:i].strip())
+            start = i + 1
+    items.append(body[start:].strip())
+    return [item for item in items if item]
+
+
+def _create_table(sql: str, match) -> Tuple[str, ...]:
+    if_not_exists, table = match.group(1) or "", match.group(2)
+    sql = re.sub(r"--[^\n]*", "", sql)
+    match = _CREATE_TABLE.match(sql)
+    depth = 0
+    for end in range(match.end() - 1, len(sql)):
+        depth += {"(": 1, ")": -1}.get(sql[end], 0)
+        if depth == 0:
+            break
+    items = _split_top_level(sql[match.end():end])
+
+    auto_increment = None
+    columns, indexes = [], []
+    for item in items:
+        index = _INDEX.match(item)
+        unique = _UNIQUE_KEY.match(item)
+        if unique:
+            columns.append(f"UNIQUE {unique.group(1)}")
+        elif index:
+            kind = "UNIQUE INDEX" if index.group(1) else "INDEX"
+            indexes.append(f"CREATE {kind} IF NOT EXISTS {table}_{index.group(2)} ON {table} {index.group(3)}")
+        elif _PRIMARY_KEY.match(item):
+            columns.append(item)
+        else:
+            for pattern, replacement in _COLUMN_CLEANUP:
+                item = pattern.sub(replacement, item)
+            if re.search(r"\bAUTO_INCREMENT\b", item, re.IGNORECASE):
+                auto_increment = item.split()[0]
+                item = f"{auto_increment} INTEGER PRIMARY KEY AUTOINCREMENT"
+            columns.append(item)
+
+    if auto_increment:
+        # The rowid alias is the key; a composite key around it (partitioning) has no use here
+        columns = [c for c in columns if not (_PRIMARY_KEY.match(c) and auto_increment in c)]
+    create = f"CREATE TABLE {if_not_exists}{table} (\n    " + ",\n    ".join(columns) + "\n)"
+    return (create, *indexes)
+
+
+def _limited_write(match) -> str:
+    statement, delete_table, update_table, condition, limit = match.groups()
+    table = delete_table or update_table
+    head = f"DELETE FROM {table}" if delete_table else statement
+    return f"{head} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT {limit})"
+
+
+def _upsert(match) -> str:
+    assignments = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", match.group(1), flags=re.IGNORECASE)
+    returning = re.search(r"\b(\w+)\s*=\s*LAST_INSERT_ID\(\1\)", assignments, re.IGNORECASE)
+    if returning:
+        # Conflicting inserts report the existing row's id, as LAST_INSERT_ID(id) does in MySQL
+        column = returning.group(1)
+        assignments = assignments.replace(returning.group(0), f"{column} = {column}")
+        return f"ON CONFLICT DO UPDATE SET {assignments.strip()} RETURNING {column}"
+    return f"ON CONFLICT DO UPDATE SET {assignments.strip()}"
+
+
+@lru_cache(maxsize=2048)
+def translate(sql: str, params: Optional[str] = "positional") -> Tuple[str, ...]:
+    """SQLite statements for a MySQL statement
+
+    params is "positional", "named" or None (no parameters: placeholders are
+    left alone, as pymysql does). CREATE TABLE can become several statements.
+    """
+    create = _CREATE_TABLE.match(sql)
+    if create:
+        return _create_table(sql, create)
+
+    if params is not None:
+        sql = _placeholders(sql, params == "named")
+    sql = _DATE_ARITHMETIC.sub(
+        lambda m: f"datetime({m.group(2)}, '{'+' if m.group(1).upper() == 'ADD' else '-'}"
+                  f"{m.group(3)} {INTERVAL_UNITS[m.group(4).upper()]}')",
+        sql
+    )
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    sql = _UPSERT.sub(_upsert, sql)
+    sql = _LIMITED_WRITE.sub(_limited_write, sql)
+    return (sql,)
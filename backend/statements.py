@@ -0,0 +1,109 @@
+"""
+Statements - Named hot statements and per-statement execution statistics
+
+register() gives the SQL of a hot path a name. The text is compacted once,
+at import, and every execution is counted under that name. Any other
+statement is counted under its fingerprint: whitespace collapsed, literals
+and placeholders replaced by ?, and IN lists and multi-row VALUES folded.
+The statistics (calls, errors, rows, total/avg/max time) feed
+/api/admin/debug/statements, to spot slow queries without MySQL's slow log.
+STATEMENT_STATS_MAX_ENTRIES bounds the table; later fingerprints are counted
+as "(other)".
+
+pymysql speaks MySQL's text protocol only, so there are no server-side
+prepared statements to cache per connection. SQL-level PREPARE/EXECUTE
+would add round trips to every call.
+"""
+import re
+import time
+from functools import lru_cache
+from typing import Dict
+
+from config import settings
+
+OTHER = "(other)"
+SORT_KEYS = ('calls', 'errors', 'rows', 'total_ms', 'avg_ms', 'max_ms')
+
+_VALUE = r"(?:\?|NULL)"
+_FINGERPRINT = [
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%\(\w+\)s|%s"), "?"),
+    (re.compile(rf"\({_VALUE}(?:, ?{_VALUE})*\)(?:, ?\({_VALUE}(?:, ?{_VALUE})*\))+"), "(...)"),
+    (re.compile(rf"\({_VALUE}(?:, ?{_VALUE})+\)"), "(?, ...)"),
+]
+
+
+class Statement(str):
+    """SQL text registered under a name; runs like any other query string"""
+
+    name: str
+
+
+REGISTRY: Dict[str, Statement] = {}
+
+
+def register(name: str, sql: str) -> Statement:
+    """Named statement; whitespace is collapsed, so the SQL must not contain literals"""
+    statement = Statement(" ".join(sql.split()))
+    statement.name = name
+    if REGISTRY.get(name, statement) != statement:
+        raise ValueError(f"Statement {name!r} is already registered with other SQL")
+    REGISTRY[name] = statement
+    return statement
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    for pattern, replacement in _FINGERPRINT:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class StatementStats:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._stats: Dict[str, list] = {}  # key -> [calls, errors, rows, total seconds, max seconds]
+        self.since = time.time()
+
+    def record(self, sql: str, seconds: float, rows: int = 0, ok: bool = True):
+        key = sql.name if isinstance(sql, Statement) else fingerprint(sql)
+        entry = self._stats.get(key)
+        if entry is None:
+            if len(self._stats) >= self.max_entries:
+                key = OTHER
+            entry = self._stats.setdefault(key, [0, 0, 0, 0.0, 0.0])
+        entry[0] += 1
+        if not ok:
+            entry[1] += 1
+        entry[2] += rows
+        entry[3] += seconds
+        if seconds > entry[4]:
+            entry[4] = seconds
+
+    def snapshot(self, limit: int = 50, sort: str = 'total_ms') -> dict:
+        """The top statements by a SORT_KEYS column, since start or the last reset"""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        statements = [
+            {
+                'statement': key,
+                'calls': calls,
+                'errors': errors,
+                'rows': rows,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total * 1000 / calls, 3),
+                'max_ms': round(longest * 1000, 3),
+            }
+            for key, (calls, errors, rows, total, longest) in list(self._stats.items())
+        ]
+        statements.sort(key=lambda entry: entry[sort], reverse=True)
+        return {'since': self.since, 'statements': statements[:limit]}
+
+    def reset(self):
+        self._stats = {}
+        self.since = time.time()
+
+
+stats = StatementStats(settings.STATEMENT_STATS_MAX_ENTRIES)
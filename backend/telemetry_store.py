@@ -0,0 +1,462 @@
+"""
+Telemetry store - Append-only columnar segments for request telemetry
+
+With TELEMETRY_STORE_ENABLED, ingest appends every request to this store
+instead of inserting a request_logs row, and MySQL keeps users, APIs, alerts
+and configuration. Metrics and the detectors' baselines (latency z-scores,
+error rates, ML training) scan the store.
+
+A segment holds requests of one TELEMETRY_SEGMENT_SECONDS window as one
+fixed-width array per column (see COLUMNS). String columns hold int32 codes
+into per-segment dictionaries; endpoint is the route template. Missing
+values are -1 codes and status codes, and NaN latencies.
+
+The open segment of a window is a directory of memory-mapped files
+preallocated to TELEMETRY_SEGMENT_ROWS rows, so an append is a few array
+stores. Its row count and dictionaries are written to meta.json every
+TELEMETRY_FLUSH_SECONDS; rows appended after the last flush are lost if the
+process dies. Once the window is over (plus TELEMETRY_SEAL_GRACE_SECONDS
+for late events), or the segment is full, the background task seals it into
+a compressed .npz file and a JSON sidecar (window and APIs), and sealed
+segments are never written again. Scans skip segments by window and API
+and decompress only the columns they read.
+
+Event ids (returned by append, stored as alerts.event_id) are the segment
+number << 32 | row. One process writes a store directory and holds a lock
+on it: run one ingest worker per node with the store enabled.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-writer lock is not enforced
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = {
+    'timestamp': np.float64,
+    'api_id': np.int32,
+    'status_code': np.int16,
+    'latency_ms': np.float32,
+    'body_size': np.int32,
+    'is_suspicious': np.int8,
+    'method': np.int32,
+    'endpoint': np.int32,
+    'client_ip': np.int32,
+    'user_agent': np.int32,
+}
+STRING_COLUMNS = ('method', 'endpoint', 'client_ip', 'user_agent')
+NULL_CODE = -1
+ROW_BITS = 32
+
+
+def event_id(segment: int, row: int) -> int:
+    return (segment << ROW_BITS) | row
+
+
+def split_event_id(value: int) -> tuple:
+    """(segment number, row) of an event id"""
+    return value >> ROW_BITS, value & ((1 << ROW_BITS) - 1)
+
+
+class Batch:
+    """Matching rows of one segment: column arrays and the segment's dictionaries"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, List[str]]):
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def counts(self, column: str, mask: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Occurrences of each value of a string column"""
+        codes = self.columns[column] if mask is None else self.columns[column][mask]
+        values = self.dictionaries[column]
+        unique, counts = np.unique(codes, return_counts=True)
+        return {values[code]: count for code, count in zip(unique.tolist(), counts.tolist()) if code != NULL_CODE}
+
+    def code_of(self, column: str, value: str) -> Optional[int]:
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return None
+
+    def rows(self) -> List[dict]:
+        """Rows as dicts: strings decoded, missing values None"""
+        decoded = {}
+        for column, array in self.columns.items():
+            if column in STRING_COLUMNS:
+                values = self.dictionaries[column]
+                decoded[column] = [values[code] if code != NULL_CODE else None for code in array.tolist()]
+            elif column == 'status_code':
+                decoded[column] = [code if code != NULL_CODE else None for code in array.tolist()]
+            elif column == 'latency_ms':
+                decoded[column] = [None if value != value else value for value in array.tolist()]
+            elif column == 'is_suspicious':
+                decoded[column] = [bool(value) for value in array.tolist()]
+            else:
+                decoded[column] = array.tolist()
+        return [dict(zip(decoded, values)) for values in zip(*decoded.values())]
+
+
+class _OpenSegment:
+    """Segment being appended to: memory-mapped columns and in-memory dictionaries"""
+
+    def __init__(self, path: Path, number: int, window_start: float, capacity: int):
+        self.path = path
+        self.number = number
+        self.window_start = window_start
+        self.capacity = capacity
+        self.count = 0
+        self.api_ids = set()
+        self.values: Dict[str, List[str]] = {column: [] for column in STRING_COLUMNS}
+        recovered = (path / "meta.json").exists()
+        if recovered:
+            meta = json.loads((path / "meta.json").read_text())
+            self.capacity, self.count = meta['capacity'], meta['count']
+            self.api_ids = set(meta['api_ids'])
+            self.values = meta['dictionaries']
+        self.codes = {column: {value: code for code, value in enumerate(self.values[column])} for column in STRING_COLUMNS}
+        path.mkdir(parents=True, exist_ok=True)
+        self.arrays = {
+            column: np.memmap(path / f"{column}.bin", dtype=dtype, mode="r+" if recovered else "w+",
+                              shape=(self.capacity,))
+            for column, dtype in COLUMNS.items()
+        }
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def _code(self, column: str, value: Optional[str]) -> int:
+        if value is None:
+            return NULL_CODE
+        code = self.codes[column].get(value)
+        if code is None:
+            code = self.codes[column][value] = len(self.values[column])
+            self.values[column].append(value)
+        return code
+
+    def append(self, event: dict) -> int:
+        row = self.count
+        arrays = self.arrays
+        arrays['timestamp'][row] = event['timestamp']
+        arrays['api_id'][row] = event['api_id']
+        status_code = event.get('status_code')
+        arrays['status_code'][row] = status_code if status_code is not None else NULL_CODE
+        latency = event.get('latency_ms')
+        arrays['latency_ms'][row] = latency if latency is not None else np.nan
+        arrays['body_size'][row] = event.get('body_size') or 0
+        arrays['is_suspicious'][row] = 1 if event.get('is_suspicious') else 0
+        for column in STRING_COLUMNS:
+            arrays[column][row] = self._code(column, event.get(column))
+        self.api_ids.add(event['api_id'])
+        self.count = row + 1
+        return row
+
+    def meta(self) -> dict:
+        return {
+            'number': self.number, 'window_start': self.window_start, 'count': self.count,
+            'api_ids': sorted(self.api_ids),
+        }
+
+    def flush(self):
+        for array in self.arrays.values():
+            array.flush()
+        meta = dict(self.meta(), capacity=self.capacity, dictionaries=self.values)
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta, separators=(",", ":")))
+        os.replace(tmp, self.path / "meta.json")
+
+    def seal(self, directory: Path) -> dict:
+        """Write the rows as a compressed segment; returns its sidecar"""
+        name = f"{self.number:010d}"
+        count = self.count
+        columns = {column: np.array(array[:count]) for column, array in self.arrays.items()}
+        dictionaries = np.frombuffer(json.dumps(self.values, separators=(",", ":")).encode(), dtype=np.uint8)
+        tmp = directory / f"{name}.npz.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, dictionaries=dictionaries, **columns)
+        os.replace(tmp, directory / f"{name}.npz")
+        meta = self.meta()
+        meta['count'] = count
+        # The sidecar makes the segment visible: written last
+        (directory / f"{name}.json").write_text(json.dumps(meta))
+        return meta
+
+    def remove(self):
+        self.arrays = {}
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class SegmentStore:
+    def __init__(self, directory: str, window_seconds: int, capacity: int, seal_grace: float,
+                 flush_interval: float, retention_days: int, cache_columns: int):
+        self.directory = Path(directory)
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.seal_grace = seal_grace
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.cache_columns = cache_columns
+        self._open: Dict[int, _OpenSegment] = {}  # number -> segment
+        self._appending: Dict[float, _OpenSegment] = {}  # window start -> segment taking new rows
+        self._sealed: Dict[int, dict] = {}  # number -> sidecar
+        self._cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._next_number = 0
+        self._lock = None
+        self._task = None
+
+    # Writing
+
+    def open(self):
+        """Take the directory lock and load the segment index (once)"""
+        if self._lock is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock = open(self.directory / "LOCK", "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                raise RuntimeError(f"Telemetry store {self.directory} is used by another process")
+        self._lock = lock
+
+        for sidecar in self.directory.glob("*.json"):
+            meta = json.loads(sidecar.read_text())
+            self._sealed[meta['number']] = meta
+        for path in sorted(self.directory.glob("*.open")):
+            number = int(path.stem)
+            if number in self._sealed or not (path / "meta.json").exists():
+                # Sealed before a crash, or never flushed: nothing to recover
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            meta = json.loads((path / "meta.json").read_text())
+            self._open[number] = _OpenSegment(path, number, meta['window_start'], meta['capacity'])
+        numbers = list(self._sealed) + list(self._open)
+        self._next_number = max(numbers) + 1 if numbers else 0
+        logger.info(f"Telemetry store {self.directory}: {len(self._sealed)} sealed, {len(self._open)} open segments")
+
+    def append(self, event: dict) -> int:
+        """Store one request (timestamp, api_id, status_code, latency_ms, body_size,
+        is_suspicious, method, endpoint, client_ip, user_agent); returns its event id"""
+        self.open()
+        window_start = event['timestamp'] // self.window_seconds * self.window_seconds
+        segment = self._appending.get(window_start)
+        if segment is None or segment.full:
+            # A full segment is left to the background task to seal
+            number = self._next_number
+            self._next_number += 1
+            segment = _OpenSegment(self.directory / f"{number:010d}.open", number, window_start, self.capacity)
+            self._open[number] = segment
+            self._appending[window_start] = segment
+        return event_id(segment.number, segment.append(event))
+
+    def mark_suspicious(self, value: int):
+        number, row = split_event_id(value)
+        segment = self._open.get(number)
+        if segment is None or row >= segment.count:
+            logger.warning(f"Telemetry event {value} is sealed or unknown; not marked suspicious")
+            return
+        segment.arrays['is_suspicious'][row] = 1
+
+    def flush(self):
+        for segment in list(self._open.values()):
+            segment.flush()
+
+    async def maintain(self, now: Optional[float] = None):
+        """Flush open segments, seal finished ones and drop expired ones"""
+        now = now if now is not None else time.time()
+        due = [
+            segment for segment in self._open.values()
+            if segment.full or segment.window_start + self.window_seconds + self.seal_grace <= now
+        ]
+        for segment in due:
+            if self._appending.get(segment.window_start) is segment:
+                del self._appending[segment.window_start]
+        await asyncio.to_thread(self.flush)
+        for segment in due:
+            if segment.count:
+                meta = await asyncio.to_thread(segment.seal, self.directory)
+                self._sealed[segment.number] = meta
+            del self._open[segment.number]
+            await asyncio.to_thread(segment.remove)
+        if due:
+            logger.info(f"Sealed {len(due)} telemetry segments")
+        if self.retention_days > 0:
+            await asyncio.to_thread(self.expire, now)
+
+    def expire(self, now: float):
+        cutoff = now - self.retention_days * 86400
+        for number, meta in list(self._sealed.items()):
+            if meta['window_start'] + self.window_seconds <= cutoff:
+                del self._sealed[number]
+                for suffix in (".json", ".npz"):
+                    (self.directory / f"{number:010d}{suffix}").unlink(missing_ok=True)
+
+    async def start(self):
+        self.open()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self.close()
+
+    def close(self):
+        """Flush open segments and release the directory"""
+        if self._lock is None:
+            return
+        self.flush()
+        self._lock.close()
+        self._lock = None
+        self._open, self._appending, self._sealed = {}, {}, {}
+        self._cache.clear()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.error(f"Telemetry store maintenance failed: {e}")
+
+    # Reading
+
+    def _segments(self, api_ids: Optional[set], start: Optional[float], end: Optional[float]) -> List[tuple]:
+        """(window start, number, open segment or None) of the segments a scan must read, oldest first"""
+        found = []
+        for number, meta in self._sealed.items():
+            found.append((meta['window_start'], number, None, meta['api_ids']))
+        for number, segment in self._open.items():
+            found.append((segment.window_start, number, segment, segment.api_ids))
+        return sorted(
+            (window_start, number, segment) for window_start, number, segment, segment_apis in found
+            if (start is None or window_start + self.window_seconds > start)
+            and (end is None or window_start <= end)
+            and (api_ids is None or not api_ids.isdisjoint(segment_apis))
+        )
+
+    def _sealed_column(self, number: int, column: str):
+        key = (number, column)
+        value = self._cache.get(key)
+        if value is None:
+            with np.load(self.directory / f"{number:010d}.npz") as data:
+                value = data[column]
+            if column == 'dictionaries':
+                value = json.loads(value.tobytes())
+            self._cache[key] = value
+            if len(self._cache) > self.cache_columns:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return value
+
+    def _read(self, number: int, segment: Optional[_OpenSegment], columns: Iterable[str]) -> tuple:
+        if segment is not None:
+            count = segment.count
+            return {column: segment.arrays[column][:count] for column in columns}, segment.values
+        return (
+            {column: self._sealed_column(number, column) for column in columns},
+            self._sealed_column(number, 'dictionaries')
+        )
+
+    def scan(self, api_ids: Optional[Iterable[int]] = None, start: Optional[float] = None,
+             end: Optional[float] = None, columns: Optional[Iterable[str]] = None) -> Iterator[Batch]:
+        """Batches of the rows of some APIs (None: all) within [start, end], oldest segment first"""
+        self.open()
+        api_ids = set(api_ids) if api_ids is not None else None
+        columns = list(columns or COLUMNS)
+        for window_start, number, segment in self._segments(api_ids, start, end):
+            filter_time = (start is not None and window_start < start) or \
+                          (end is not None and window_start + self.window_seconds > end)
+            filter_api = api_ids is not None and not (segment.api_ids if segment else
+                                                      set(self._sealed[number]['api_ids'])) <= api_ids
+            read = set(columns) | ({'timestamp'} if filter_time else set()) | ({'api_id'} if filter_api else set())
+            arrays, dictionaries = self._read(number, segment, read)
+            mask = None
+            if filter_api:
+                mask = np.isin(arrays['api_id'], list(api_ids))
+            if filter_time:
+                timestamps = arrays['timestamp']
+                in_range = np.ones(len(timestamps), dtype=bool)
+                if start is not None:
+                    in_range &= timestamps >= start
+                if end is not None:
+                    in_range &= timestamps <= end
+                mask = in_range if mask is None else mask & in_range
+            if mask is not None:
+                if not mask.any():
+                    continue
+                arrays = {column: arrays[column][mask] for column in columns}
+            else:
+                arrays = {column: arrays[column] for column in columns}
+            if len(arrays[columns[0]]):
+                yield Batch(arrays, dictionaries)
+
+    def recent(self, api_id: int, limit: int, columns: Iterable[str], endpoint: Optional[str] = None,
+               suspicious: Optional[bool] = None) -> List[Batch]:
+        """The last `limit` stored rows of an API, newest segment first, optionally of one
+        endpoint template or suspicious flag"""
+        self.open()
+        columns = list(columns)
+        batches, remaining = [], limit
+        for window_start, number, segment in reversed(self._segments({api_id}, None, None)):
+            read = set(columns) | {'api_id'} | ({'endpoint'} if endpoint else set()) | \
+                   ({'is_suspicious'} if suspicious is not None else set())
+            arrays, dictionaries = self._read(number, segment, read)
+            mask = arrays['api_id'] == api_id
+            if endpoint is not None:
+                code = dictionaries['endpoint'].index(endpoint) if endpoint in dictionaries['endpoint'] else None
+                if code is None:
+                    continue
+                mask &= arrays['endpoint'] == code
+            if suspicious is not None:
+                mask &= arrays['is_suspicious'] == (1 if suspicious else 0)
+            rows = np.flatnonzero(mask)[-remaining:]
+            if len(rows):
+                batches.append(Batch({column: arrays[column][rows] for column in columns}, dictionaries))
+                remaining -= len(rows)
+            if remaining <= 0:
+                break
+        return batches
+
+    def first_window(self) -> Optional[float]:
+        """Start of the oldest stored window, None while the store is empty"""
+        self.open()
+        segments = self._segments(None, None, None)
+        return segments[0][0] if segments else None
+
+    def api_ids(self) -> set:
+        self.open()
+        found = set()
+        for meta in self._sealed.values():
+            found.update(meta['api_ids'])
+        for segment in self._open.values():
+            found.update(segment.api_ids)
+        return found
+
+
+store = SegmentStore(
+    settings.TELEMETRY_DIR, settings.TELEMETRY_SEGMENT_SECONDS, settings.TELEMETRY_SEGMENT_ROWS,
+    settings.TELEMETRY_SEAL_GRACE_SECONDS, settings.TELEMETRY_FLUSH_SECONDS,
+    settings.TELEMETRY_RETENTION_DAYS, settings.TELEMETRY_CACHE_COLUMNS
+)
@@ -0,0 +1,41 @@
+"""
+Shared pytest configuration
+"""
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--update-benchmark-baseline",
+        action="store_true",
+        default=False,
+        help="Rewrite tests/benchmark_baseline.json with the timings from this run"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: detector microbenchmarks compared against a checked-in baseline")
+    config.addinivalue_line("markers", "mysql: needs a reachable MySQL server, skipped otherwise")
+
+
+@pytest.fixture(autouse=True)
+def clear_result_caches():
+    """Cached dashboard results must not leak between tests"""
+    from cache import metrics_cache, alert_stats_cache
+    metrics_cache.invalidate()
+    alert_stats_cache.invalidate()
+    yield
+
+
+@pytest.fixture(scope="module")
+def sqlite_db(tmp_path_factory):
+    """An embedded SQLite database at the current schema, in place of the configured one"""
+    from config import settings
+    from database import init_db
+
+    saved = settings.DB_BACKEND, settings.SQLITE_PATH
+    settings.DB_BACKEND = "sqlite"
+    settings.SQLITE_PATH = str(tmp_path_factory.mktemp("db") / "boing.db")
+    init_db()
+    yield settings.SQLITE_PATH
+    settings.DB_BACKEND, settings.SQLITE_PATH = saved
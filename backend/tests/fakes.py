@@ -0,0 +1,134 @@
+"""
+In-memory stand-ins for the database and alert service used by the tests
+"""
+
+
+class FakeCursor:
+    """Answers the detection engine's queries from fixed in-memory data"""
+
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        sql = " ".join(query.split())
+        if "FROM ip_blacklist" in sql:
+            ip = params[0]
+            self._rows = [{'ip_address': ip, 'reason': 'benchmark'}] if ip in self.db.blacklist else []
+        elif "SUM(CASE WHEN status_code >= 400" in sql:
+            self._rows = [{'total': 200, 'errors': 120}]
+        elif sql.startswith("SELECT latency_ms FROM request_logs"):
+            self._rows = self.db.latency_history
+        elif sql.startswith("SELECT * FROM request_logs"):
+            self._rows = self.db.training_rows
+        elif sql.startswith("INSERT"):
+            self.db.next_id += 1
+            self.lastrowid = self.db.next_id
+            self._rows = []
+        else:
+            self._rows = []
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self, latency_history=(), training_rows=(), blacklist=("203.0.113.5", "203.0.113.6")):
+        self.latency_history = list(latency_history)
+        self.training_rows = list(training_rows)
+        self.blacklist = set(blacklist)
+        self.next_id = 0
+
+    def connect(self, **options):
+        return FakeConnection(self)
+
+
+class FakeAlertService:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_alert(self, alert_id, alert_data):
+        self.sent += 1
+
+
+class ScriptedCursor:
+    """Records every statement and answers from (substring, rows) rules"""
+
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+        self.lastrowid = None
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        sql = " ".join(query.split())
+        self.db.executed.append((sql, tuple(params or ())))
+        self._rows = []
+        for fragment, rows in self.db.rules:
+            if fragment in sql:
+                self._rows = rows(sql, params) if callable(rows) else list(rows)
+                break
+        self.rowcount = len(self._rows)
+
+    def executemany(self, query, seq_params):
+        for params in seq_params:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class ScriptedDatabase:
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.executed = []
+        self.closed = 0
+
+    def connect(self, **options):
+        db = self
+
+        class _Connection(FakeConnection):
+            def cursor(self, cursorclass=None):
+                return ScriptedCursor(db)
+
+            def close(self):
+                db.closed += 1
+
+        return _Connection(self)
+
+    def statements(self, fragment: str) -> list:
+        return [sql for sql, _ in self.executed if fragment in sql]
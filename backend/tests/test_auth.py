@@ -1,5 +1,5 @@
 """
-Tests for authentication endpoints
+Tests for authentication endpoints (against an embedded SQLite database)
 """
 import pytest
 from fastapi.testclient import TestClient
@@ -7,6 +7,8 @@ from main import app
 
 client = TestClient(app)
 
+pytestmark = pytest.mark.usefixtures("sqlite_db")
+
 
 def test_register_user():
     """Test user registration"""
@@ -0,0 +1,155 @@
+"""
+Tests for the dashboard result cache
+"""
+import asyncio
+
+import pytest
+
+from cache import ResultCache, alert_tags
+
+ADMIN = {'id': 1, 'role': 'admin'}
+USER = {'id': 7, 'role': 'user'}
+
+
+def _counting(value="result", delay=0.0):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return value
+
+    return compute, calls
+
+
+def test_hits_within_ttl():
+    """Test a cached result is reused until it expires"""
+    cache = ResultCache("test", ttl=60)
+    compute, calls = _counting()
+
+    async def run():
+        key = cache.key(ADMIN, api_id=1)
+        await cache.get_or_compute(key, compute)
+        return await cache.get_or_compute(key, compute)
+
+    assert asyncio.run(run()) == "result"
+    assert len(calls) == 1
+
+
+def test_concurrent_requests_are_coalesced():
+    """Test identical queries in flight share one execution"""
+    cache = ResultCache("test", ttl=60)
+    compute, calls = _counting(delay=0.01)
+
+    async def run():
+        key = cache.key(ADMIN, api_id=1)
+        return await asyncio.gather(*(cache.get_or_compute(key, compute) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_errors_are_shared_but_not_cached():
+    """Test a failed execution fails its waiters and is retried next time"""
+    cache = ResultCache("test", ttl=60)
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    async def run():
+        key = cache.key(ADMIN)
+        results = await asyncio.gather(*(cache.get_or_compute(key, failing) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(key, failing)
+
+    asyncio.run(run())
+    assert len(attempts) == 2
+
+
+def test_keys_separate_user_scopes_and_round_time_windows():
+    """Test users never share entries, while nearby polls of a sliding window do"""
+    cache = ResultCache("test", ttl=10)
+    assert cache.key(ADMIN, api_id=1) != cache.key(USER, api_id=1)
+    assert cache.key(USER, start_time=1700000001.5) == cache.key(USER, start_time=1700000008.0)
+    assert cache.key(USER, start_time=1700000001.5) != cache.key(USER, start_time=1700000011.0)
+
+
+def test_size_bound_evicts_least_recently_used():
+    """Test the oldest untouched entry is evicted first"""
+    cache = ResultCache("test", ttl=60, max_entries=2)
+    compute, calls = _counting()
+
+    async def run():
+        await cache.get_or_compute("a", compute)
+        await cache.get_or_compute("b", compute)
+        await cache.get_or_compute("a", compute)
+        await cache.get_or_compute("c", compute)
+        await cache.get_or_compute("a", compute)
+        await cache.get_or_compute("b", compute)
+
+    asyncio.run(run())
+    assert len(cache) == 2
+    assert len(calls) == 4
+
+
+def test_invalidate_by_tag():
+    """Test invalidating an API drops its entries and API-wide ones only"""
+    cache = ResultCache("test", ttl=60)
+    compute, calls = _counting()
+
+    async def run():
+        await cache.get_or_compute("api1", compute, tags=alert_tags(1))
+        await cache.get_or_compute("api2", compute, tags=alert_tags(2))
+        await cache.get_or_compute("all", compute, tags=alert_tags(None))
+        cache.invalidate(*alert_tags(1), *alert_tags(None))
+
+    asyncio.run(run())
+    assert len(cache) == 1
+
+
+def test_cancelled_first_caller_does_not_cancel_waiters():
+    """Test cancelling the caller that started an execution leaves it running for the others"""
+    cache = ResultCache("test", ttl=60)
+    compute, calls = _counting(delay=0.01)
+
+    async def run():
+        key = cache.key(ADMIN, api_id=1)
+        first = asyncio.create_task(cache.get_or_compute(key, compute))
+        second = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, await cache.get_or_compute(key, compute)
+
+    assert asyncio.run(run()) == ("result", "result")
+    assert len(calls) == 1
+
+
+def test_invalidation_during_a_computation_is_not_undone():
+    """Test a result computed across an invalidation of its tags is returned but not cached"""
+    cache = ResultCache("test", ttl=60)
+    results = iter(["stale", "fresh"])
+
+    async def compute():
+        value = next(results)
+        await asyncio.sleep(0.01 if value == "stale" else 0.02)
+        return value
+
+    async def run():
+        first = asyncio.create_task(cache.get_or_compute("api1", compute, tags=alert_tags(1)))
+        await asyncio.sleep(0)
+        cache.invalidate(*alert_tags(1))
+        # Starts a fresh computation instead of joining the stale one
+        second = asyncio.create_task(cache.get_or_compute("api1", compute, tags=alert_tags(1)))
+        assert await first == "stale"
+        assert len(cache) == 0
+        assert await second == "fresh"
+        return await cache.get_or_compute("api1", compute, tags=alert_tags(1))
+
+    assert asyncio.run(run()) == "fresh"
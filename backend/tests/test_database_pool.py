@@ -0,0 +1,113 @@
+"""
+Tests for connection pools and read replica routing
+"""
+import pymysql
+import pytest
+
+import database
+from database import ConnectionPool, InstrumentedConnection, ReplicaRouter
+
+
+class _Cursor:
+    def __init__(self, status):
+        self.status = status
+
+    def execute(self, query, args=None):
+        if self.status is Exception:
+            raise pymysql.err.OperationalError(2013, "Lost connection")
+
+    def fetchone(self):
+        return self.status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _Connection(InstrumentedConnection):
+    """Connection object without a server: liveness and replication status are set by the test"""
+
+    def __init__(self, status=None):
+        super().__init__(defer_connect=True)
+        self.alive = True
+        self.status = status
+        self.discarded = False
+
+    @property
+    def open(self):
+        return self.alive and not self.discarded
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=True):
+        if not self.alive:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def cursor(self, cursorclass=None):
+        return _Cursor(self.status)
+
+    def discard(self):
+        self.discarded = True
+        super().discard()
+
+
+def _pool(name="primary", size=2, ping_after=30.0, status=None, opened=None):
+    opened = opened if opened is not None else []
+
+    def connect():
+        if status is ConnectionRefusedError:
+            raise pymysql.err.OperationalError(2003, "Can't connect")
+        opened.append(_Connection(status))
+        return opened[-1]
+    return ConnectionPool(name, connect, size, ping_after)
+
+
+def test_pool_reuses_connections_and_replaces_dead_ones():
+    """Test close() returns a connection once, and idle ones that fail a ping are dropped"""
+    opened = []
+    pool = _pool(size=1, ping_after=0.0, opened=opened)
+
+    first = pool.acquire()
+    first.close()
+    first.close()
+    assert pool.acquire() is first
+    second = pool.acquire()
+    first.close()
+    second.close()  # over the pool size
+    assert second.discarded and not first.discarded
+
+    first.alive = False
+    third = pool.acquire()
+    assert first.discarded and third is opened[-1] and len(opened) == 3
+
+
+def test_reads_go_to_fresh_replicas_and_fall_back_to_the_primary(monkeypatch):
+    """Test only replicas within the lag tolerance serve reads, writes always use the primary"""
+    primary = _pool()
+    fresh = _pool("fresh", status={'Seconds_Behind_Source': 2})
+    lagging = _pool("lagging", status={'Seconds_Behind_Source': 120})
+    stopped = _pool("stopped", status={'Seconds_Behind_Source': None})
+    down = _pool("down", status=ConnectionRefusedError)
+    router = ReplicaRouter([fresh, lagging, stopped, down], interval=5.0)
+    monkeypatch.setattr(database, "primary", primary)
+    monkeypatch.setattr(database, "replicas", router)
+
+    assert database.get_db_connection(read_only=True)._pool is primary  # not checked yet
+    router.check()
+    assert router.lag == {'fresh': 2.0, 'lagging': 120.0, 'stopped': None, 'down': None}
+
+    assert database.get_db_connection(read_only=True)._pool is fresh
+    assert database.get_db_connection(read_only=True, max_lag=300)._pool in (fresh, lagging)
+    assert database.get_db_connection()._pool is primary
+    assert database.get_db_connection(read_only=True, max_lag=1)._pool is primary
+
+
+@pytest.mark.parametrize("status", [None, Exception])
+def test_replicas_without_status_are_unusable(status):
+    """Test a server that is not replicating, or fails the status query, counts as down"""
+    router = ReplicaRouter([_pool("replica", status=status)], interval=5.0)
+    router.check()
+    assert router.select(max_lag=60) is None
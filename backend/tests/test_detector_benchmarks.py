@@ -0,0 +1,225 @@
+"""
+Detector microbenchmarks
+
+Times each DetectionEngine detector, and analyze_request end-to-end, against
+an in-memory fake of the database using fixed benign and attack datasets.
+Timings are normalised by a pure-Python calibration loop so the checked-in
+baseline (tests/benchmark_baseline.json) is comparable across machines.
+A benchmark fails when it is more than BOING_BENCH_TOLERANCE percent slower
+than its baseline (default 50).
+
+Refresh the baseline after an intentional change with:
+    pytest tests/test_detector_benchmarks.py --update-benchmark-baseline
+"""
+import asyncio
+import json
+import os
+import random
+import time
+
+import pytest
+
+import detection_engine
+from detection_engine import DetectionEngine
+from tests.fakes import FakeDatabase, FakeAlertService
+
+API_ID = 1
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+TOLERANCE_PCT = float(os.environ.get("BOING_BENCH_TOLERANCE", "50"))
+REPEAT = 5
+
+pytestmark = pytest.mark.benchmark
+
+
+def _benign_traffic(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    endpoints = ["/posts", "/posts/1", "/users", "/users/2", "/comments", "/todos/1", "/albums"]
+    return [
+        {
+            'log_id': i + 1,
+            'api_id': API_ID,
+            'timestamp': 1700000000.0 + i,
+            'method': rng.choice(["GET", "GET", "GET", "POST"]),
+            'endpoint': rng.choice(endpoints),
+            'client_ip': f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            'status_code': rng.choice([200, 200, 200, 201, 404]),
+            'latency_ms': rng.gauss(120, 15),
+            'headers': {'accept': 'application/json', 'user-agent': 'Mozilla/5.0 (X11; Linux x86_64)'},
+            'body_size': rng.randint(100, 5000),
+            'user_agent': 'Mozilla/5.0 (X11; Linux x86_64)'
+        }
+        for i in range(count)
+    ]
+
+
+def _attack_traffic(count: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    endpoints = [
+        "/posts?id=' OR 1=1--",
+        "/users?search=<script>alert('xss')</script>",
+        "/posts/../../../etc/passwd",
+        "/users?id=1 UNION SELECT * FROM users--",
+        "/search?q=$(cat /etc/passwd)",
+        "/posts?search=<img src=x onerror=alert(1)>"
+    ]
+    return [
+        {
+            'log_id': 10000 + i,
+            'api_id': API_ID,
+            'timestamp': 1700000000.0 + i,
+            'method': "GET",
+            'endpoint': rng.choice(endpoints),
+            'client_ip': f"203.0.113.{rng.randint(1, 20)}",
+            'status_code': rng.choice([200, 403, 500]),
+            'latency_ms': rng.choice([rng.gauss(120, 15), rng.uniform(900, 2000)]),
+            'headers': {'user-agent': 'sqlmap/1.7', 'x-forwarded-for': "1.2.3.4; rm -rf /"},
+            'body_size': rng.randint(0, 50000),
+            'user_agent': 'sqlmap/1.7'
+        }
+        for i in range(count)
+    ]
+
+
+BENIGN = _benign_traffic(300)
+ATTACKS = _attack_traffic(100)
+MIXED = BENIGN[:200] + ATTACKS[:50]
+LATENCY_HISTORY = [{'latency_ms': r['latency_ms']} for r in _benign_traffic(100, seed=3)]
+TRAINING_ROWS = _benign_traffic(1000, seed=5)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    patch = pytest.MonkeyPatch()
+    patch.setattr(detection_engine, "get_db_connection", FakeDatabase(LATENCY_HISTORY, TRAINING_ROWS).connect)
+    engine = DetectionEngine(FakeAlertService())
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(engine._train_ml_model(API_ID))
+    assert API_ID in engine.ml_models
+    engine.loop = loop
+    yield engine
+    loop.close()
+    patch.undo()
+
+
+def _calibration_seconds() -> float:
+    """Time a fixed pure-Python workload used to normalise detector timings"""
+    def workload():
+        total = 0
+        words = {}
+        for i in range(20000):
+            total += i * i
+            words[str(i % 97)] = total
+        return total, len(words)
+
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        workload()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _time_per_record(engine, fn, records, setup=None) -> float:
+    """Best-of-REPEAT wall time per record for an async or sync detector"""
+    is_async = asyncio.iscoroutinefunction(fn)
+
+    async def run_all():
+        for record in records:
+            await fn(record)
+
+    best = float("inf")
+    for _ in range(REPEAT):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        if is_async:
+            engine.loop.run_until_complete(run_all())
+        else:
+            for record in records:
+                fn(record)
+        best = min(best, time.perf_counter() - start)
+    return best / len(records)
+
+
+def _benchmarks(engine):
+    reset_windows = engine.request_windows.clear
+    return {
+        'rate_limit': (engine._check_rate_limit, BENIGN + ATTACKS, reset_windows),
+        'ip_blacklist': (engine._check_ip_blacklist, BENIGN + ATTACKS, None),
+        'attack_signature_benign': (engine._check_attack_signatures, BENIGN, None),
+        'attack_signature_attack': (engine._check_attack_signatures, ATTACKS, None),
+        'error_rate': (engine._check_error_rate, ATTACKS, None),
+        'latency_zscore': (engine._statistical_detection, BENIGN + ATTACKS, None),
+        'ml_scoring': (engine._ml_detection, BENIGN[:100] + ATTACKS[:50], None),
+        'feature_extraction': (engine._extract_features, BENIGN + ATTACKS, None),
+        'analyze_request': (engine.analyze_request, MIXED, reset_windows),
+    }
+
+
+def _load_baseline() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as f:
+        return json.load(f).get('results', {})
+
+
+_measured = {}
+
+
+@pytest.fixture(scope="module")
+def calibration():
+    return _calibration_seconds()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def baseline_writer(request):
+    yield
+    if request.config.getoption("--update-benchmark-baseline") and _measured:
+        results = _load_baseline()
+        results.update({name: round(value, 6) for name, value in _measured.items()})
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({
+                'description': "Detector cost per record relative to the calibration workload "
+                               "in test_detector_benchmarks.py (lower is faster)",
+                'results': dict(sorted(results.items()))
+            }, f, indent=2)
+            f.write("\n")
+
+
+@pytest.mark.parametrize("name", [
+    'rate_limit',
+    'ip_blacklist',
+    'attack_signature_benign',
+    'attack_signature_attack',
+    'error_rate',
+    'latency_zscore',
+    'ml_scoring',
+    'feature_extraction',
+    'analyze_request',
+])
+def test_detector_benchmark(name, engine, calibration, request):
+    fn, records, setup = _benchmarks(engine)[name]
+    relative = _time_per_record(engine, fn, records, setup) / calibration
+    _measured[name] = relative
+
+    if request.config.getoption("--update-benchmark-baseline"):
+        return
+
+    baseline = _load_baseline().get(name)
+    if baseline is None:
+        pytest.skip(f"No baseline for '{name}'; run with --update-benchmark-baseline")
+
+    slowdown_pct = (relative - baseline) / baseline * 100
+    assert slowdown_pct <= TOLERANCE_PCT, (
+        f"{name} is {slowdown_pct:.0f}% slower than baseline "
+        f"({relative:.4f} vs {baseline:.4f}, tolerance {TOLERANCE_PCT:.0f}%)"
+    )
+
+
+def test_datasets_trigger_expected_detectors(engine):
+    """Sanity check that the attack dataset exercises the detection paths being timed"""
+    async def detect():
+        return [await engine._check_attack_signatures(r) for r in ATTACKS]
+
+    attacks = engine.loop.run_until_complete(detect())
+    assert all(attacks)
@@ -0,0 +1,119 @@
+"""
+Tests for endpoint templating and dictionary-encoded log dimensions
+"""
+import asyncio
+from types import SimpleNamespace
+
+import dictionaries
+from database import get_db_connection
+from dictionaries import Dictionary, decode_rows
+from endpoint_templates import EndpointTemplater, expand, template_endpoint
+from models import LogQuery, RequestLog
+from rollups import RollupPlan, merged_top_k
+from routes import ingest, metrics
+from tests.fakes import ScriptedDatabase
+
+
+def test_template_collapses_identifiers_and_expands_back():
+    """Test identifier segments become placeholders and the raw endpoint is recoverable"""
+    cases = {
+        "/posts/17": ("/posts/{id}", "17"),
+        "/users/6f1c2b0e-8a8e-4c8e-9b1a-2f0c1d2e3f40/keys/42": ("/users/{uuid}/keys/{id}", None),
+        "/search?q=a/b?c": ("/search", "?q=a/b?c"),
+        "/health": ("/health", None),
+        "/files/{name}/7": ("/files/{param}/{id}", "{name}/7"),
+    }
+    for endpoint, (template, params) in cases.items():
+        got_template, got_params = template_endpoint(endpoint)
+        assert got_template == template
+        if params is not None:
+            assert got_params == params
+        assert expand(got_template, got_params) == endpoint
+
+
+def test_dictionary_assigns_ids_once_and_caches(monkeypatch):
+    """Test a value is looked up once and then served from the in-process cache"""
+    known = {'/users': 5}
+    db = ScriptedDatabase([
+        ("SELECT id FROM endpoints", lambda sql, params: [{'id': known[params[0]]}] if params[0] in known else []),
+    ])
+    monkeypatch.setattr(dictionaries, "get_db_connection", db.connect)
+    dictionary = Dictionary("endpoints", max_entries=10)
+
+    assert dictionary.id_for("/users") == 5
+    assert dictionary.id_for("/users") == 5
+    assert dictionary.values([5]) == {5: "/users"}
+    assert len(db.executed) == 1
+
+    dictionary.id_for("/posts/{id}")
+    assert "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)" in db.statements("INSERT INTO endpoints")[0]
+
+
+def test_decode_rows_restores_raw_endpoint_and_user_agent(monkeypatch):
+    """Test log rows read back with their endpoint, template and user agent"""
+    db = ScriptedDatabase([
+        ("FROM endpoints", [{'id': 3, 'value': '/posts/{id}'}]),
+        ("FROM user_agents", [{'id': 9, 'value': 'curl/8.0'}]),
+    ])
+    monkeypatch.setattr(dictionaries, "get_db_connection", db.connect)
+    monkeypatch.setattr(dictionaries, "endpoints", Dictionary("endpoints", 10))
+    monkeypatch.setattr(dictionaries, "user_agents", Dictionary("user_agents", 10))
+
+    rows = decode_rows([
+        {'id': 1, 'endpoint_id': 3, 'endpoint_params': '17?full=1', 'user_agent_id': 9},
+        {'id': 2, 'endpoint_id': 3, 'endpoint_params': '18', 'user_agent_id': None},
+    ])
+
+    assert rows[0] == {'id': 1, 'endpoint': '/posts/17?full=1', 'endpoint_template': '/posts/{id}',
+                       'user_agent': 'curl/8.0'}
+    assert rows[1]['endpoint'] == '/posts/18' and rows[1]['user_agent'] is None
+    assert len(db.executed) == 2
+
+
+def test_raw_edges_group_by_dictionary_ids():
+    """Test heavy hitters of raw rows group by the id column and select the value once per group"""
+    db = ScriptedDatabase([("as item", [{'item': '/posts/{id}', 'count': 4}])])
+    plan = RollupPlan()
+    plan.raw.append((1704153600.0, 1704153660.0, True))
+
+    top = merged_top_k(db.connect().cursor(), ["api_id = %s"], [2], plan, 'top_endpoints')
+
+    sql = db.statements("as item")[0]
+    assert "GROUP BY endpoint_id" in sql and "endpoint_id IS NOT NULL" in sql
+    assert "(SELECT value FROM endpoints WHERE endpoints.id = request_logs.endpoint_id) as item" in sql
+    assert top.top(1)[0][:2] == ('/posts/{id}', 4)
+
+
+def test_log_search_finds_raw_paths_of_templated_rows(sqlite_db, monkeypatch):
+    """Test searching an ingested raw path matches its template and parameters, not neighbours"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("INSERT INTO users (email, password_hash) VALUES ('search@boing.local', 'x')")
+        cursor.execute("INSERT INTO apis (user_id, name, api_key, api_secret_encrypted) VALUES (%s, 'Search', 'search-key', 'x')",
+                       (cursor.lastrowid,))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    templater = EndpointTemplater(60, 50, 100)
+    monkeypatch.setattr(ingest, "templater", templater)
+    monkeypatch.setattr(metrics, "templater", templater)
+    for name in ("endpoints", "user_agents"):
+        fresh = Dictionary(name, max_entries=10)
+        monkeypatch.setattr(ingest, name, fresh)
+        monkeypatch.setattr(dictionaries, name, fresh)
+    monkeypatch.setattr(ingest.settings, "ROLLUPS_ENABLED", False)
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(detection_engine=None)))
+    for i, endpoint in enumerate(["/posts/1", "/posts/1?page=2", "/posts/11", "/users/1"]):
+        asyncio.run(ingest._ingest(RequestLog(
+            api_key='search-key', timestamp=1704153600.0 + i, method='GET', endpoint=endpoint, client_ip='10.0.0.1'
+        ), request))
+
+    def search(term):
+        result = asyncio.run(metrics.query_logs(LogQuery(endpoint=term), user={'id': 1, 'role': 'admin'}))
+        return sorted(row['endpoint'] for row in result['logs'])
+
+    assert search("/posts/1") == ["/posts/1", "/posts/1?page=2"]
+    assert search("/posts/1?page=2") == ["/posts/1?page=2"]
+    assert search("posts") == ["/posts/1", "/posts/11", "/posts/1?page=2"]
@@ -0,0 +1,70 @@
+"""
+Tests for per-API route templates
+"""
+import pytest
+
+import endpoint_templates
+from endpoint_templates import (
+    EndpointTemplater, RouteLearner, RouteMatcher, expand, openapi_templates, placeholder_count, template_path
+)
+from tests.fakes import ScriptedDatabase
+
+
+def test_matcher_prefers_literal_segments_and_backtracks():
+    """Test a literal route wins over a placeholder, and a dead end falls back to the placeholder"""
+    matcher = RouteMatcher(["/users/me", "/users/{userId}", "/users/{userId}/repos", "/users/me/settings"])
+
+    assert matcher.match("/users/me".split("/")) == ("/users/me", [])
+    assert matcher.match("/users/octocat".split("/")) == ("/users/{userId}", ["octocat"])
+    assert matcher.match("/users/me/repos".split("/")) == ("/users/{userId}/repos", ["me"])
+    assert matcher.match("/users//repos".split("/")) is None
+    assert matcher.match("/posts".split("/")) is None
+
+
+def test_openapi_templates_use_base_path_and_whole_segment_params():
+    """Test OpenAPI paths are prefixed with the server path and partial params cover the segment"""
+    document = {
+        'servers': [{'url': "https://api.example.com/v2/"}],
+        'paths': {"/files/{name}.json": {}, "/users/{id}": {}},
+    }
+
+    assert openapi_templates(document) == ["/v2/files/{name}", "/v2/users/{id}"]
+    assert openapi_templates({'basePath': "/api", 'paths': {"/health": {}}}) == ["/api/health"]
+    with pytest.raises(ValueError):
+        openapi_templates({'openapi': "3.0.0"})
+
+
+def test_learner_promotes_position_after_threshold():
+    """Test a position turns into {param} once enough distinct values followed its prefix"""
+    learner = RouteLearner(threshold=3, max_nodes=100)
+
+    for name in ("alice", "bob", "carol"):
+        assert learner.observe(["", "profiles", name]) == (["", "profiles", name], False)
+    assert learner.observe(["", "profiles", "dave"]) == (["", "profiles", "{param}"], True)
+    assert learner.observe(["", "profiles", "alice"]) == (["", "profiles", "{param}"], True)
+    assert learner.observe(["", "about"]) == (["", "about"], False)
+
+
+def test_templater_matches_uploaded_routes_and_stores_learned_ones(monkeypatch):
+    """Test known routes are matched losslessly and learned templates persisted once"""
+    db = ScriptedDatabase([("SELECT template FROM api_routes", [{'template': "/repos/{owner}/{repo}"}])])
+    monkeypatch.setattr(endpoint_templates, "get_db_connection", db.connect)
+    templater = EndpointTemplater(ttl=60, learn_threshold=2, max_nodes=100)
+
+    template, params = templater.template(3, "/repos/boing/api?page=2")
+    assert (template, params) == ("/repos/{owner}/{repo}", "boing/api?page=2")
+    assert expand(template, params) == "/repos/boing/api?page=2"
+
+    for tag in ("a", "b", "c", "d"):
+        template, params = templater.template(3, f"/tags/{tag}/42")
+    assert (template, params) == ("/tags/{param}/{id}", "d/42")
+    assert len(db.statements("INSERT IGNORE INTO api_routes")) == 1
+    assert len(db.statements("SELECT template FROM api_routes")) == 1
+
+
+def test_placeholder_count_ignores_braces_inside_literal_segments():
+    """Test only whole {...} segments count as placeholders"""
+    template = template_path("/files/a{b/12")
+    assert template == "/files/a{b/{id}"
+    assert placeholder_count(template) == 1
+    assert placeholder_count("/orders/{param}/items/{id}") == 2
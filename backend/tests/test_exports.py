@@ -0,0 +1,138 @@
+"""
+Tests for streaming log exports
+"""
+import asyncio
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import exports
+from models import ExportFormat, LogExportQuery
+from routes import metrics
+from tests.fakes import ScriptedDatabase
+
+ADMIN = {'id': 1, 'role': 'admin'}
+
+ROWS = [
+    {'id': i, 'timestamp': 1704153600.0 + i, 'endpoint': '/users', 'status_code': 200,
+     'created_at': datetime(2024, 1, 2, 0, 0, i)}
+    for i in range(5)
+]
+
+
+def _export(monkeypatch, query, **kwargs):
+    db = ScriptedDatabase([("SELECT * FROM request_logs", ROWS)])
+    monkeypatch.setattr(exports, "get_db_connection", db.connect)
+    monkeypatch.setattr(exports.settings, "EXPORT_BATCH_ROWS", 2)
+
+    async def run():
+        response = await metrics.export_logs(query, user=ADMIN, **kwargs)
+        chunks = [chunk async for chunk in response.body_iterator]
+        return response, chunks
+
+    response, chunks = asyncio.run(run())
+    return db, response, chunks
+
+
+def test_csv_export_streams_in_batches_without_row_cap(monkeypatch):
+    """Test CSV is written batch by batch and exports are not capped"""
+    db, response, chunks = _export(monkeypatch, LogExportQuery(), format=ExportFormat.csv, gzip=False)
+
+    assert response.media_type == "text/csv"
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert lines[0] == "id,timestamp,endpoint,status_code,created_at"
+    assert len(lines) == 6
+    sql, params = db.executed[0]
+    assert "LIMIT" not in sql and params == ()
+    assert db.closed == 1
+
+
+def test_ndjson_export_with_gzip(monkeypatch):
+    """Test NDJSON rows are compressed on the fly and honor an explicit limit"""
+    db, response, chunks = _export(
+        monkeypatch, LogExportQuery(limit=50000, api_id=3), format=ExportFormat.ndjson, gzip=True
+    )
+
+    assert response.media_type == "application/gzip"
+    assert ".ndjson.gz" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in gzip.decompress(b"".join(chunks)).decode().splitlines()]
+    assert [row['id'] for row in rows] == [0, 1, 2, 3, 4]
+    assert rows[0]['created_at'] == "2024-01-02T00:00:00"
+    assert db.executed[0][1] == (3, 50000)
+
+
+def test_json_export_keeps_logs_envelope(monkeypatch):
+    """Test the streamed JSON document has the former {"logs": [...]} shape"""
+    _, _, chunks = _export(monkeypatch, LogExportQuery(), format=ExportFormat.json, gzip=False)
+
+    document = json.loads(b"".join(chunks))
+    assert [row['id'] for row in document['logs']] == [0, 1, 2, 3, 4]
+
+
+def test_empty_export(monkeypatch):
+    """Test an export without matching rows is still a valid document"""
+    db = ScriptedDatabase()
+    monkeypatch.setattr(exports, "get_db_connection", db.connect)
+    assert b"".join(exports.encode_json(exports.stream_rows("SELECT 1", []))) == b'{"logs":[]}'
+    assert b"".join(exports.encode_csv(exports.stream_rows("SELECT 1", []))) == b""
+
+
+LOG_ROWS = [
+    {'id': i, 'api_id': 1, 'timestamp': 1704153600.0 + i, 'method': 'GET', 'endpoint': f'/users/{i % 2}',
+     'client_ip': '10.0.0.1', 'status_code': 200 if i % 3 else 500, 'latency_ms': 12.5, 'headers': '{}',
+     'body_size': 0, 'user_agent': None, 'geo_country': None, 'geo_city': None, 'is_suspicious': i % 2,
+     'created_at': datetime(2024, 1, 2, 0, 0, i)}
+    for i in range(5)
+]
+
+
+def _columnar_export(monkeypatch, export_format):
+    db = ScriptedDatabase([("SELECT * FROM request_logs", LOG_ROWS)])
+    monkeypatch.setattr(exports, "get_db_connection", db.connect)
+    monkeypatch.setattr(exports.settings, "EXPORT_BATCH_ROWS", 2)
+
+    async def run():
+        response = await metrics.export_logs(LogExportQuery(), format=export_format, gzip=False, user=ADMIN)
+        return response, b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(run())
+
+
+def test_parquet_export_dictionary_encodes_low_cardinality_columns(monkeypatch):
+    """Test Parquet exports write one row group per batch with dictionary columns"""
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    response, data = _columnar_export(monkeypatch, ExportFormat.parquet)
+
+    assert response.media_type == "application/vnd.apache.parquet"
+    parquet = pq.ParquetFile(pa.BufferReader(data))
+    assert parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.num_rows == 5
+    assert pa.types.is_dictionary(table.schema.field('endpoint').type)
+    status_code = table.schema.get_field_index('status_code')
+    assert 'RLE_DICTIONARY' in parquet.metadata.row_group(0).column(status_code).encodings
+    assert table.column('is_suspicious').to_pylist() == [False, True, False, True, False]
+
+
+def test_arrow_export_is_an_ipc_stream(monkeypatch):
+    """Test Arrow exports can be read batch by batch as an IPC stream"""
+    pa = pytest.importorskip("pyarrow")
+    response, data = _columnar_export(monkeypatch, ExportFormat.arrow)
+
+    reader = pa.ipc.open_stream(data)
+    table = reader.read_all()
+    assert table.column('id').to_pylist() == [0, 1, 2, 3, 4]
+    assert table.column('method').to_pylist() == ['GET'] * 5
+
+
+def test_columnar_export_without_pyarrow(monkeypatch):
+    """Test Parquet is refused with 501 when pyarrow is not installed"""
+    monkeypatch.setattr(exports, "pa", None)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(metrics.export_logs(LogExportQuery(), format=ExportFormat.parquet, gzip=False, user=ADMIN))
+    assert exc.value.status_code == 501
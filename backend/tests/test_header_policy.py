@@ -0,0 +1,114 @@
+"""
+Tests for selective header capture
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import dictionaries
+import endpoint_templates
+import header_policy
+from detection_engine import DetectionEngine
+from endpoint_templates import EndpointTemplater
+from header_policy import PolicyCache, capture, effective_policy, encode, inflate, normalize, scan_text
+from models import RequestLog
+from routes import ingest
+from tests.fakes import FakeAlertService, ScriptedDatabase
+
+BROWSER_HEADERS = {
+    'Host': 'api.example.com',
+    'Cookie': 'session=abc123; theme=dark',
+    'Authorization': 'Bearer secret-token',
+    'User-Agent': 'Mozilla/5.0',
+    'X-Request-Id': 'r-1',
+    'X-Trace': 't' * 100,
+}
+
+
+def _policy(**overrides):
+    policy = effective_policy(None)
+    policy.update(overrides)
+    return policy
+
+
+def test_capture_applies_allow_list_hashing_and_caps():
+    """Test only allowed headers are kept, secrets hashed and long values cut"""
+    headers = normalize(BROWSER_HEADERS)
+    captured = capture(headers, _policy(allow_list=['cookie', 'x-*'], max_value_bytes=10, max_total_bytes=0))
+
+    assert list(captured) == ['cookie', 'x-request-id', 'x-trace']
+    assert captured['cookie'].startswith("hmac:") and 'abc123' not in captured['cookie']
+    assert captured['cookie'] == capture({'cookie': headers['cookie']}, _policy())['cookie']
+    assert captured['x-trace'] == 't' * 10
+
+    budgeted = capture(headers, _policy(allow_list=[], max_total_bytes=60))
+    assert list(budgeted) == ['authorization', 'host']
+
+
+def test_compressed_headers_round_trip(monkeypatch):
+    """Test large documents are stored compressed and read back as the same JSON"""
+    monkeypatch.setattr(header_policy.settings, "HEADER_COMPRESS_MIN_BYTES", 16)
+    headers = {'accept': 'application/json', 'x-trace': 'abc' * 50}
+
+    document, compressed = encode(headers, _policy(compress=True))
+    assert document is None and len(compressed) < len(json.dumps(headers))
+    row = inflate({'id': 1, 'headers': None, 'headers_compressed': compressed})
+    assert json.loads(row['headers']) == headers and 'headers_compressed' not in row
+
+    assert encode({'a': 'b'}, _policy(compress=True)) == ('{"a":"b"}', None)
+    assert encode({}, _policy()) == (None, None)
+
+
+def test_policy_cache_reads_each_api_once():
+    """Test ingest does not query the policy table for every request"""
+    db = ScriptedDatabase([("FROM header_policies", [{'api_id': 4, 'allow_list': 'host', 'compress': 1}])])
+    cache = PolicyCache(ttl=60)
+    cursor = db.connect().cursor()
+
+    for _ in range(3):
+        policy = cache.get(cursor, 4)
+    assert policy['allow_list'] == ['host'] and policy['compress'] is True
+    assert len(db.statements("FROM header_policies")) == 1
+    cache.invalidate(4)
+    cache.get(cursor, 4)
+    assert len(db.statements("FROM header_policies")) == 2
+
+
+def test_signatures_scan_normalized_headers():
+    """Test attacks in header values are found in the prepared scan text"""
+    engine = DetectionEngine(FakeAlertService())
+    headers = normalize({'X-Forwarded-For': '1.2.3.4', 'Referer': '../../etc/passwd'})
+
+    detections = asyncio.run(engine._check_attack_signatures(
+        {'endpoint': '/users', 'scan_text': scan_text('/users', headers)}
+    ))
+
+    assert {d['metadata']['attack_type'] for d in detections} == {'path_traversal'}
+    assert asyncio.run(engine._check_attack_signatures({'endpoint': '/users', 'headers': headers})) == detections
+
+
+def test_ingest_stores_captured_headers(monkeypatch):
+    """Test ingest writes the policy's view of the headers, not the raw dict"""
+    db = ScriptedDatabase([
+        ("FROM apis WHERE api_key", [{'id': 4, 'is_active': True}]),
+        ("FROM header_policies", [{'api_id': 4, 'allow_list': 'host,user-agent,cookie', 'compress': None}]),
+        ("SELECT id FROM", [{'id': 7}]),
+    ])
+    monkeypatch.setattr(ingest, "get_db_connection", db.connect)
+    monkeypatch.setattr(dictionaries, "get_db_connection", db.connect)
+    monkeypatch.setattr(endpoint_templates, "get_db_connection", db.connect)
+    monkeypatch.setattr(ingest, "templater", EndpointTemplater(60, 50, 100))
+    monkeypatch.setattr(ingest, "header_policies", PolicyCache(ttl=60))
+    monkeypatch.setattr(ingest.settings, "ROLLUPS_ENABLED", False)
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(detection_engine=None)))
+    log = RequestLog(
+        api_key='k', timestamp=1704153600.0, method='GET', endpoint='/users',
+        client_ip='10.0.0.1', status_code=200, headers=BROWSER_HEADERS
+    )
+
+    asyncio.run(ingest._ingest(log, request))
+
+    sql, params = next(e for e in db.executed if e[0].startswith("INSERT INTO request_logs"))
+    stored = json.loads(params[8])
+    assert list(stored) == ['cookie', 'host', 'user-agent']
+    assert 'abc123' not in params[8] and params[9] is None
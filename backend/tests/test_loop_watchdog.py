@@ -0,0 +1,37 @@
+"""
+Tests for the event loop watchdog
+"""
+import asyncio
+import time
+
+from loop_watchdog import LoopWatchdog
+
+
+def test_blocking_call_is_captured_with_activity():
+    """Test a blocking call inside a tagged coroutine is reported"""
+    watchdog = LoopWatchdog(interval=0.05, threshold=0.1)
+
+    async def slow_detector():
+        watchdog_activity = "detector:slow"  # noqa: F841
+        time.sleep(0.4)
+
+    async def route():
+        watchdog_activity = "route:POST /api/ingest"  # noqa: F841
+        await slow_detector()
+
+    async def scenario():
+        watchdog.start()
+        await asyncio.sleep(0.2)
+        await route()
+        await asyncio.sleep(0.3)
+        watchdog.stop()
+        return watchdog.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert len(snapshot['stalls']) == 1
+    stall = snapshot['stalls'][0]
+    assert stall['activity'] == ["route:POST /api/ingest", "detector:slow"]
+    assert stall['resolved'] is True
+    assert stall['duration_ms'] >= 300
+    assert any("slow_detector" in line for line in stall['stack'])
+    assert snapshot['max_lag_ms'] >= 300
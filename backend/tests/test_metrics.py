@@ -0,0 +1,81 @@
+"""
+Tests for the metrics routes
+"""
+import asyncio
+import threading
+
+from models import MetricsQuery
+from routes import metrics
+from tests.fakes import ScriptedDatabase
+
+ADMIN = {'id': 1, 'role': 'admin'}
+USER = {'id': 7, 'role': 'user'}
+
+
+def _metrics_db():
+    return ScriptedDatabase([
+        ("COUNT(DISTINCT client_ip)", [{
+            'total': 10, 'errors': 4, 'avg_latency': 120.5, 'unique_ips': 3, 'suspicious': 2
+        }]),
+        ("FROM alerts", [{'alerts': 1}]),
+        ("GROUP BY endpoint ORDER BY", [{'endpoint': '/users', 'count': 6}, {'endpoint': '/posts', 'count': 4}]),
+        ("GROUP BY time_bucket", [{'time_bucket': 1704103200, 'count': 10}]),
+    ])
+
+
+def test_scalar_metrics_use_one_scan(monkeypatch):
+    """Test the scalar metrics come from a single aggregate query"""
+    db = _metrics_db()
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+
+    result = asyncio.run(metrics.get_metrics(MetricsQuery(api_id=5), user=ADMIN))
+
+    assert result.total_requests == 10
+    assert result.error_rate == 0.4
+    assert result.avg_latency_ms == 120.5
+    assert result.unique_ips == 3
+    assert result.suspicious_requests == 2
+    assert result.alerts_count == 1
+    assert len(db.statements("COUNT(*) as total")) == 1
+    assert not db.statements("AVG(latency_ms) as avg_latency FROM")
+
+
+def test_alert_count_filters_on_created_at(monkeypatch):
+    """Test time filters are translated for the alerts table"""
+    db = _metrics_db()
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+
+    asyncio.run(metrics.get_metrics(MetricsQuery(start_time=1700000000.0), user=USER))
+
+    alert_sql = db.statements("FROM alerts")[0]
+    assert "created_at >= FROM_UNIXTIME(%s)" in alert_sql
+    assert "timestamp" not in alert_sql
+
+
+def test_concurrent_metrics_requests_share_one_computation(monkeypatch):
+    """Test the metrics queries run off the event loop, so identical requests coalesce"""
+    db = _metrics_db()
+    started, release = threading.Event(), threading.Event()
+    released = []
+
+    def slow_connect(**options):
+        started.set()
+        released.append(release.wait(2))
+        return db.connect(**options)
+
+    monkeypatch.setattr(metrics, "get_db_connection", slow_connect)
+
+    async def run():
+        query = MetricsQuery(api_id=5, start_time=1700000000.0)
+        first = asyncio.create_task(metrics.get_metrics(query, user=ADMIN))
+        second = asyncio.create_task(metrics.get_metrics(query, user=ADMIN))
+        # Only reachable while the first computation waits on the database
+        await asyncio.to_thread(started.wait, 2)
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    first, second = asyncio.run(run())
+    assert released == [True]
+    assert first.total_requests == second.total_requests == 10
+    assert len(db.statements("COUNT(*) as total")) == 1
@@ -0,0 +1,55 @@
+"""
+Tests for the schema migration runner
+"""
+import pymysql
+import pytest
+
+import migrate
+from migrate import Migration, load_migrations, split_statements
+from tests.fakes import ScriptedDatabase
+
+
+def test_split_statements_drops_comments():
+    """Test migration files split into statements without comment lines"""
+    sql = "-- add an index\nALTER TABLE a ADD INDEX i (x);\n\n-- drop\nALTER TABLE a\n    DROP INDEX j;\n"
+    assert split_statements(sql) == ["ALTER TABLE a ADD INDEX i (x)", "ALTER TABLE a\n    DROP INDEX j"]
+
+
+def test_shipped_migrations_load_in_order():
+    """Test the migrations directory parses and versions are unique"""
+    migrations = load_migrations()
+    assert [m.version for m in migrations] == sorted(m.version for m in migrations)
+    composite = next(m for m in migrations if m.name == "composite_indexes")
+    assert "ALTER TABLE request_logs ADD INDEX idx_api_timestamp (api_id, timestamp)" in composite.statements
+    # New indexes come before the drops of the indexes they replace
+    statements = composite.statements
+    assert statements.index("ALTER TABLE alerts ADD INDEX idx_api_created (api_id, created_at)") < \
+        statements.index("ALTER TABLE alerts DROP INDEX idx_api_id")
+
+
+def _raise(code):
+    def rule(sql, params):
+        raise pymysql.err.OperationalError(code, "error")
+    return rule
+
+
+def test_migrate_skips_changes_already_in_place(monkeypatch):
+    """Test duplicate or missing indexes do not fail a migration, other errors do"""
+    db = ScriptedDatabase([
+        ("SELECT version FROM schema_migrations", [{'version': 1}]),
+        ("ADD INDEX exists_already", _raise(1061)),
+        ("DROP INDEX gone", _raise(1091)),
+    ])
+    monkeypatch.setattr(migrate, "get_db_connection", db.connect)
+    migrations = [
+        Migration(1, "done", ["ALTER TABLE t ADD INDEX never_run (x)"]),
+        Migration(2, "indexes", ["ALTER TABLE t ADD INDEX exists_already (x)", "ALTER TABLE t DROP INDEX gone"]),
+    ]
+
+    assert migrate.migrate(migrations) == [2]
+    assert not db.statements("never_run")
+    assert db.executed[-1] == ("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (2, "indexes"))
+
+    db.rules.append(("ADD INDEX broken", _raise(1146)))
+    with pytest.raises(pymysql.MySQLError):
+        migrate.migrate([Migration(3, "broken", ["ALTER TABLE missing ADD INDEX broken (x)"])])
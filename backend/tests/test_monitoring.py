@@ -0,0 +1,64 @@
+"""
+Tests for the Prometheus /metrics endpoint
+"""
+import asyncio
+
+from fastapi.testclient import TestClient
+import main
+from main import app
+from monitoring import Counter, Histogram, INGEST_REQUESTS, DETECTOR_DURATION
+
+client = TestClient(app)
+
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    """Test the endpoint returns registered metrics in text format"""
+    INGEST_REQUESTS.labels('success').inc()
+    DETECTOR_DURATION.labels('rate_limit').observe(0.002)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE boing_ingest_requests_total counter" in body
+    assert 'boing_ingest_requests_total{outcome="success"}' in body
+    assert 'boing_detector_duration_seconds_bucket{detector="rate_limit",le="+Inf"}' in body
+    assert "boing_websocket_clients 0" in body
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test histogram rendering"""
+    histogram = Histogram("test_histogram_seconds", "Test histogram", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    lines = histogram.render().splitlines()
+    assert 'test_histogram_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_histogram_seconds_bucket{le="1"} 2' in lines
+    assert 'test_histogram_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_histogram_seconds_count 3" in lines
+
+
+def test_counter_labels_are_escaped():
+    """Test label values are escaped"""
+    counter = Counter("test_escaped_total", "Test counter", ["path"])
+    counter.labels('/a"b').inc(2)
+    assert 'test_escaped_total{path="/a\\"b"} 2' in counter.render()
+
+
+def test_health_check_pings_the_database_off_the_event_loop(monkeypatch):
+    """Test the blocking database check runs in a worker thread"""
+    on_loop = []
+
+    def check_db():
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return True
+
+    monkeypatch.setattr(main, "check_db", check_db)
+    response = client.get("/health")
+    assert response.json()['database'] == "connected"
+    assert on_loop == [False]
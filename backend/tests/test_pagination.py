@@ -0,0 +1,123 @@
+"""
+Tests for keyset pagination of logs and alerts
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+from config import settings
+from models import LogQuery, TotalMode
+from pagination import decode_cursor, encode_cursor
+from routes import alerts, metrics
+from tests.fakes import ScriptedDatabase
+
+ADMIN = {'id': 1, 'role': 'admin'}
+
+
+def _log_rows(count, newest=1704153600.0):
+    return [{'id': 100 - i, 'timestamp': newest - i, 'endpoint': '/users'} for i in range(count)]
+
+
+def test_cursor_round_trip():
+    """Test cursors encode numeric and datetime positions opaquely"""
+    assert decode_cursor(encode_cursor(1704153600.25, 42)) == (1704153600.25, 42)
+    created = datetime(2024, 1, 2, 3, 4, 5)
+    assert decode_cursor(encode_cursor(created, 7)) == (created, 7)
+    for bad in ("not-a-cursor", encode_cursor("x", 1)):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_query_logs_pages_after_cursor(monkeypatch):
+    """Test a cursor page seeks past the last row instead of using OFFSET"""
+    db = ScriptedDatabase([("SELECT * FROM request_logs", _log_rows(3))])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    position = encode_cursor(1704160000.0, 500)
+
+    result = asyncio.run(metrics.query_logs(
+        LogQuery(api_id=2, limit=2, offset=40, cursor=position, total=TotalMode.none), user=ADMIN
+    ))
+
+    assert [log['id'] for log in result['logs']] == [100, 99]
+    assert decode_cursor(result['next_cursor']) == (1704153599.0, 99)
+    assert result['total'] is None and result['offset'] == 0
+    assert not db.statements("COUNT(*)")
+    sql, params = next(e for e in db.executed if "SELECT * FROM request_logs" in e[0])
+    assert "(timestamp < %s OR (timestamp = %s AND id < %s))" in sql
+    assert "ORDER BY timestamp DESC, id DESC" in sql
+    assert "ts_day <= %s" in sql
+    assert params == (2, 1704160000.0, 1704160000.0, 500, 19724, 3, 0)
+
+
+def test_query_logs_keeps_offset_contract(monkeypatch):
+    """Test requests without a cursor still get an exact total and OFFSET paging"""
+    db = ScriptedDatabase([
+        ("COUNT(*) as total", [{'total': 2}]),
+        ("SELECT * FROM request_logs", _log_rows(2)),
+    ])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+
+    result = asyncio.run(metrics.query_logs(LogQuery(limit=100, offset=0), user=ADMIN))
+
+    assert result['total'] == 2 and result['total_exact']
+    assert len(result['logs']) == 2 and result['next_cursor'] is None
+
+
+def test_query_logs_estimates_total(monkeypatch):
+    """Test the estimated total comes from the optimizer, not COUNT(*)"""
+    db = ScriptedDatabase([
+        ("EXPLAIN SELECT", [{'table': 'request_logs', 'rows': 120000}]),
+        ("SELECT * FROM request_logs", _log_rows(1)),
+    ])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+
+    result = asyncio.run(metrics.query_logs(LogQuery(total=TotalMode.estimate), user=ADMIN))
+
+    assert result['total'] == 120000 and not result['total_exact']
+    assert not db.statements("COUNT(*)")
+
+
+def test_query_logs_has_no_estimated_total_on_sqlite(monkeypatch):
+    """Test SQLite, which keeps no row estimates, answers no total instead of running EXPLAIN"""
+    db = ScriptedDatabase([("SELECT * FROM request_logs", _log_rows(1))])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    monkeypatch.setattr(settings, "DB_BACKEND", "sqlite")
+
+    result = asyncio.run(metrics.query_logs(LogQuery(total=TotalMode.estimate), user=ADMIN))
+
+    assert result['total'] is None and not result['total_exact']
+    assert not db.statements("EXPLAIN") and not db.statements("COUNT(*)")
+
+
+def test_list_alerts_returns_next_cursor_header(monkeypatch):
+    """Test alert pages keep the list body and put the next cursor in a header"""
+    created = datetime(2024, 1, 2, 3, 4, 5)
+    rows = [{
+        'id': 10 - i, 'api_id': 1, 'alert_type': 'rate_limit', 'severity': 'high', 'score': 0.9,
+        'title': 'Spike', 'description': None, 'metadata': None, 'is_acknowledged': False,
+        'is_muted': False, 'created_at': created
+    } for i in range(3)]
+    db = ScriptedDatabase([("SELECT * FROM alerts", rows)])
+    monkeypatch.setattr(alerts, "get_db_connection", db.connect)
+    response = Response()
+
+    result = asyncio.run(alerts.list_alerts(
+        response, limit=2, page_cursor=encode_cursor(created, 11), user=ADMIN
+    ))
+
+    assert [alert.id for alert in result] == [10, 9]
+    assert decode_cursor(response.headers["X-Next-Cursor"]) == (created, 9)
+    sql, params = db.executed[0]
+    assert "(created_at < %s OR (created_at = %s AND id < %s))" in sql
+    assert params[-2:] == (3, 0)
+
+
+def test_invalid_cursor_is_a_bad_request(monkeypatch):
+    """Test a tampered cursor is rejected with 400"""
+    db = ScriptedDatabase()
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(metrics.query_logs(LogQuery(cursor="garbage", total=TotalMode.none), user=ADMIN))
+    assert exc.value.status_code == 400
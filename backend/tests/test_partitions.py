@@ -0,0 +1,77 @@
+"""
+Tests for request_logs partition management
+"""
+import partitions
+from partitions import PartitionManager, day_conditions, partition_name
+from tests.fakes import ScriptedDatabase
+
+JAN_10 = 19732    # ts_day of 2024-01-10
+
+
+def _partitions(*bounds):
+    rows = [{'name': partition_name(bound - 1), 'bound': str(bound)} for bound in bounds]
+    return rows + [{'name': 'p_future', 'bound': 'MAXVALUE'}]
+
+
+def test_day_conditions_prune_by_ts_day():
+    """Test timestamp ranges become ts_day bounds"""
+    conditions, params = day_conditions(JAN_10 * 86400 + 5, JAN_10 * 86400 + 90000)
+    assert conditions == ["ts_day >= %s", "ts_day <= %s"]
+    assert params == [JAN_10, JAN_10 + 1]
+    assert day_conditions(None, None) == ([], [])
+
+
+def test_maintain_creates_days_ahead_and_drops_expired(monkeypatch):
+    """Test p_future is split for the coming days and old day partitions are dropped"""
+    db = ScriptedDatabase([
+        ("information_schema.PARTITIONS", _partitions(JAN_10 - 30, JAN_10 - 29, JAN_10 + 1)),
+    ])
+    monkeypatch.setattr(partitions, "get_db_connection", db.connect)
+    manager = PartitionManager(interval=3600, days_ahead=2, retention_days=30)
+
+    result = manager.maintain(now=JAN_10 * 86400 + 100)
+
+    assert result['created'] == ['p20240111', 'p20240112']
+    assert result['dropped'] == [partition_name(JAN_10 - 31)]
+    reorganize = db.statements("REORGANIZE PARTITION p_future")[0]
+    assert "PARTITION p20240112 VALUES LESS THAN (19735)" in reorganize
+    assert reorganize.endswith("PARTITION p_future VALUES LESS THAN MAXVALUE)")
+    assert db.statements("DROP PARTITION")[0].endswith(f"DROP PARTITION {partition_name(JAN_10 - 31)}")
+
+
+def test_maintain_is_a_no_op_when_up_to_date_or_unpartitioned(monkeypatch):
+    """Test nothing is altered when partitions exist already or the table is not partitioned"""
+    db = ScriptedDatabase([("information_schema.PARTITIONS", _partitions(JAN_10 + 3))])
+    monkeypatch.setattr(partitions, "get_db_connection", db.connect)
+    manager = PartitionManager(interval=3600, days_ahead=2, retention_days=0)
+    assert manager.maintain(now=JAN_10 * 86400) == {'created': [], 'dropped': []}
+    assert not db.statements("ALTER TABLE")
+
+    db = ScriptedDatabase()
+    monkeypatch.setattr(partitions, "get_db_connection", db.connect)
+    assert manager.maintain(now=JAN_10 * 86400) == {'created': [], 'dropped': []}
+    assert not db.statements("ALTER TABLE")
+
+
+def test_maintain_keeps_expired_partitions_holding_rows_tiers_keep(monkeypatch):
+    """Test a partition with suspicious or alerted rows the retention tiers keep is not dropped"""
+    held = partition_name(JAN_10 - 32)
+    db = ScriptedDatabase([
+        ("information_schema.PARTITIONS", _partitions(JAN_10 - 31, JAN_10 - 30, JAN_10 + 3)),
+        ("FROM apis a LEFT JOIN retention_policies", [
+            {'api_id': 1, 'headers_days': None, 'raw_days': 7, 'suspicious_days': 60, 'alert_days': 90},
+            {'api_id': 2, 'headers_days': None, 'raw_days': 7, 'suspicious_days': 45, 'alert_days': 30},
+        ]),
+        (f"PARTITION ({held})", [{'1': 1}]),
+    ])
+    monkeypatch.setattr(partitions, "get_db_connection", db.connect)
+    manager = PartitionManager(interval=3600, days_ahead=2, retention_days=30)
+
+    result = manager.maintain(now=JAN_10 * 86400 + 100)
+
+    assert result['dropped'] == [partition_name(JAN_10 - 31)]
+    check = db.statements(f"PARTITION ({held})")[0]
+    assert "is_suspicious = TRUE AND timestamp >= %s" in check
+    assert "alerts.log_id = request_logs.id) AND timestamp >= %s" in check
+    params = [p for sql, p in db.executed if f"PARTITION ({held})" in sql][0]
+    assert params == (JAN_10 * 86400 + 100 - 60 * 86400, JAN_10 * 86400 + 100 - 90 * 86400)
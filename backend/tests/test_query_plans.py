@@ -0,0 +1,171 @@
+"""
+Query plan checks for the statements the routes run
+
+Each case calls the route (or detector) code against a real database, keeps
+the statement it executed and EXPLAINs that exact text, so a change to how a
+route builds its query is checked here too. Runs on MySQL when one is
+reachable (skipped otherwise) and always on the embedded SQLite backend,
+whose indexes carry the table name as prefix.
+"""
+import asyncio
+import re
+import time
+
+import pytest
+from fastapi import Response
+
+import detection_engine
+import dictionaries
+from database import get_db_connection
+from detection_engine import DetectionEngine
+from dictionaries import endpoints
+from models import LogQuery, MetricsQuery
+from routes import alerts, metrics
+from tests.fakes import FakeAlertService
+
+ADMIN = {'id': 0, 'role': 'admin'}
+
+
+class RecordingCursor:
+    def __init__(self, cursor, executed):
+        self._cursor = cursor
+        self._executed = executed
+
+    def execute(self, query, params=None):
+        self._executed.append((query, params))
+        return self._cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RecordingConnection:
+    """Connection whose cursors keep every statement executed through them"""
+
+    def __init__(self, conn, executed):
+        self._conn = conn
+        self._executed = executed
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self._conn.cursor(*args, **kwargs), self._executed)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _metrics_series(api):
+    metrics._compute_metrics(MetricsQuery(api_id=api['api_id'], start_time=api['since'], exact=True), ADMIN)
+
+
+def _suspicious_logs(api):
+    asyncio.run(metrics.query_logs(
+        LogQuery(api_id=api['api_id'], start_time=api['since'], suspicious_only=True, total="none"), ADMIN
+    ))
+
+
+def _recent_latencies(api):
+    DetectionEngine(FakeAlertService())._recent_latencies(api['api_id'], None, None)
+
+
+def _route_latencies(api):
+    DetectionEngine(FakeAlertService())._recent_latencies(api['api_id'], api['endpoint_id'], '/plans')
+
+
+def _alert_listing(api):
+    asyncio.run(alerts.list_alerts(
+        Response(), api_id=api['api_id'], severity=None, acknowledged=None,
+        limit=100, offset=0, page_cursor=None, user=ADMIN
+    ))
+
+
+# (case, code run, fragment identifying its statement, table, intended index)
+QUERY_PLANS = [
+    ("metrics series", _metrics_series, "as time_bucket, COUNT(*)", "request_logs", "idx_api_timestamp"),
+    ("suspicious logs", _suspicious_logs, "ORDER BY timestamp DESC", "request_logs", "idx_api_suspicious_timestamp"),
+    ("recent latencies", _recent_latencies, "latency_ms IS NOT NULL", "request_logs", "idx_api_id_latency"),
+    ("route latencies", _route_latencies, "endpoint_id = %s", "request_logs", "idx_api_endpoint_id_latency"),
+    ("alert listing", _alert_listing, "FROM alerts", "alerts", "idx_api_created"),
+]
+
+
+def _mysql_index(cursor, sql, params, table):
+    cursor.execute(f"EXPLAIN {sql}", params)
+    plan = {row['table']: row for row in cursor.fetchall()}
+    return plan.get(table, {}).get('key'), plan
+
+
+def _sqlite_index(cursor, sql, params, table):
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    plan = [row['detail'] for row in cursor.fetchall()]
+    for detail in plan:
+        match = re.match(rf"(?:SEARCH|SCAN) {table} USING (?:COVERING )?INDEX {table}_(\w+)", detail)
+        if match:
+            return match.group(1), plan
+    return None, plan
+
+
+@pytest.fixture(scope="module", params=[pytest.param("mysql", marks=pytest.mark.mysql), "sqlite"])
+def plan_api(request):
+    if request.param == "sqlite":
+        request.getfixturevalue("sqlite_db")
+    try:
+        conn = get_db_connection()
+    except Exception as e:
+        pytest.skip(f"MySQL not reachable: {e}")
+
+    with pytest.MonkeyPatch.context() as patch:
+        # Ids cached from another database would not match this one
+        patch.setattr(dictionaries, "get_db_connection", get_db_connection)
+        endpoints.clear()
+
+        cursor = conn.cursor()
+        suffix = int(time.time() * 1000)
+        cursor.execute(
+            "INSERT INTO users (email, password_hash) VALUES (%s, 'x')", (f"plans-{suffix}@example.com",)
+        )
+        user_id = cursor.lastrowid
+        cursor.execute(
+            "INSERT INTO apis (user_id, name, api_key, api_secret_encrypted) VALUES (%s, 'plans', %s, 'x')",
+            (user_id, f"plans-{suffix}")
+        )
+        api_id = cursor.lastrowid
+        conn.commit()
+        endpoint_id = endpoints.id_for('/plans')
+        now = time.time()
+        cursor.executemany("""
+            INSERT INTO request_logs (api_id, timestamp, method, endpoint_id, client_ip, status_code, latency_ms, is_suspicious)
+            VALUES (%s, %s, 'GET', %s, '10.0.0.1', 200, %s, %s)
+        """, [(api_id, now - i, endpoint_id, float(i % 50), i % 10 == 0) for i in range(500)])
+        cursor.executemany("""
+            INSERT INTO alerts (api_id, alert_type, severity, score, title)
+            VALUES (%s, 'latency_spike', 'low', 0.5, 'plans')
+        """, [(api_id,)] * 20)
+        conn.commit()
+
+        explain = _sqlite_index if request.param == "sqlite" else _mysql_index
+        yield explain, cursor, {'api_id': api_id, 'endpoint_id': endpoint_id, 'since': now - 3600}
+
+        cursor.execute("DELETE FROM request_logs WHERE api_id = %s", (api_id,))
+        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        endpoints.clear()
+
+
+@pytest.mark.parametrize("name,run,fragment,table,index", QUERY_PLANS, ids=[plan[0] for plan in QUERY_PLANS])
+def test_route_query_uses_intended_index(plan_api, monkeypatch, name, run, fragment, table, index):
+    """Test EXPLAIN of the statement the route executed picks the composite index"""
+    explain, cursor, api = plan_api
+    executed = []
+    record = lambda **options: RecordingConnection(get_db_connection(**options), executed)
+    for module in (metrics, alerts, detection_engine):
+        monkeypatch.setattr(module, "get_db_connection", record)
+
+    run(api)
+
+    statements = [(sql, params) for sql, params in executed if fragment in sql and table in sql]
+    assert statements, f"{name}: no statement with {fragment!r} was run"
+    sql, params = statements[0]
+    used, plan = explain(cursor, sql, params, table)
+    assert used == index, f"{name}: {plan}"
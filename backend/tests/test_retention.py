@@ -0,0 +1,96 @@
+"""
+Tests for raw log retention
+"""
+import retention
+from retention import RetentionJob, delete_condition, effective_policy
+from tests.fakes import ScriptedDatabase
+
+DAY = 86400
+NOW = 19732 * DAY    # 2024-01-10
+COVERAGE = NOW - 60 * DAY
+
+
+def _policy(**overrides):
+    policy = {'headers_days': 0, 'raw_days': 30, 'suspicious_days': 90, 'alert_days': 0}
+    policy.update(overrides)
+    return policy
+
+
+def test_effective_policy_uses_defaults_for_null_overrides(monkeypatch):
+    """Test per-API values win over the settings defaults, NULLs do not"""
+    monkeypatch.setattr(retention.settings, "RETENTION_RAW_DAYS", 14)
+    monkeypatch.setattr(retention.settings, "RETENTION_SUSPICIOUS_DAYS", 60)
+    policy = effective_policy({'raw_days': 7, 'suspicious_days': None, 'headers_days': None, 'alert_days': None})
+    assert policy['raw_days'] == 7 and policy['suspicious_days'] == 60
+
+
+def test_delete_condition_keeps_suspicious_and_alerted_rows_longer():
+    """Test suspicious rows get their own cutoff and alert-referenced rows are kept"""
+    where, params = delete_condition(_policy(), NOW)
+    assert "(is_suspicious = FALSE OR timestamp < %s)" in where
+    assert "NOT EXISTS (SELECT 1 FROM alerts WHERE alerts.log_id = request_logs.id)" in where
+    assert params == [NOW - 30 * DAY, 19702, NOW - 90 * DAY]
+
+    where, params = delete_condition(_policy(suspicious_days=0, alert_days=365), NOW)
+    assert "is_suspicious = FALSE" in where and "(timestamp < %s OR NOT EXISTS" in where
+    assert params[-1] == NOW - 365 * DAY
+
+    assert delete_condition(_policy(raw_days=0), NOW) is None
+
+
+def _retention_db(batches, coverage=COVERAGE):
+    remaining = list(batches)
+
+    def delete(sql, params):
+        return [{}] * (remaining.pop(0) if remaining else 0)
+
+    return ScriptedDatabase([
+        ("FROM rollup_state", [{'value': coverage}] if coverage is not None else []),
+        ("LEFT JOIN retention_policies", [
+            {'api_id': 3, 'headers_days': 7, 'raw_days': 30, 'suspicious_days': None, 'alert_days': None},
+        ]),
+        ("UPDATE request_logs SET headers = NULL", []),
+        ("DELETE FROM request_logs", delete),
+    ])
+
+
+def test_run_once_deletes_in_batches_after_rollup_coverage(monkeypatch):
+    """Test deletes run in LIMITed batches and never touch rows before rollup coverage"""
+    db = _retention_db([2, 2, 1])
+    monkeypatch.setattr(retention, "get_db_connection", db.connect)
+    monkeypatch.setattr(retention.time, "sleep", lambda seconds: None)
+    job = RetentionJob(interval=3600, batch_rows=2, pause=0.1)
+
+    result = job.run_once(now=NOW)
+
+    assert result == {'stripped': 0, 'deleted': 5}
+    deletes = [(sql, params) for sql, params in db.executed if sql.startswith("DELETE")]
+    assert len(deletes) == 3
+    sql, params = deletes[0]
+    assert sql.endswith("LIMIT %s") and "timestamp >= %s" in sql
+    assert params[:2] == (3, COVERAGE) and params[-1] == 2
+    strip_sql, strip_params = next(e for e in db.executed if e[0].startswith("UPDATE"))
+    assert "headers IS NOT NULL" in strip_sql and strip_params[1] == NOW - 7 * DAY
+
+
+def test_run_once_skips_deletes_without_rollup_coverage(monkeypatch):
+    """Test raw rows are kept while rollups cannot replace them"""
+    db = _retention_db([5], coverage=None)
+    monkeypatch.setattr(retention, "get_db_connection", db.connect)
+
+    result = RetentionJob(interval=3600, batch_rows=2, pause=0).run_once(now=NOW)
+
+    assert result['deleted'] == 0
+    assert not db.statements("DELETE FROM request_logs")
+
+
+def test_purge_api_deletes_a_deleted_apis_rows_in_batches(monkeypatch):
+    """Test the rows of a deleted API go in LIMITed batches"""
+    counts = iter([2, 2, 0])
+    db = ScriptedDatabase([("DELETE FROM request_logs", lambda sql, params: [{}] * next(counts))])
+    monkeypatch.setattr(retention, "get_db_connection", db.connect)
+    monkeypatch.setattr(retention.time, "sleep", lambda seconds: None)
+
+    assert RetentionJob(interval=3600, batch_rows=2, pause=0.1).purge_api(9) == 4
+    assert [params for _, params in db.executed] == [(9, 2)] * 3
+    assert db.statements("DELETE FROM request_logs WHERE api_id = %s LIMIT %s")
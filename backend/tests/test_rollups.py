@@ -0,0 +1,283 @@
+"""
+Tests for metrics rollups
+"""
+import asyncio
+
+import pytest
+
+import dictionaries
+import rollups
+from database import get_db_connection
+from dictionaries import Dictionary
+from models import MetricsQuery
+from routes import metrics
+from rollups import RollupAggregator, plan
+from sketches import DDSketch, HyperLogLog, SpaceSaving
+from tests.fakes import ScriptedDatabase
+
+ADMIN = {'id': 1, 'role': 'admin'}
+DAY = 86400
+COVERAGE = 100 * DAY + 3600 + 120    # day 100, 01:02
+
+
+def test_plan_without_coverage_is_all_raw():
+    """Test ranges are read from raw rows until rollups have coverage"""
+    result = plan(1000.0, 5000.0, None, 10 ** 9)
+    assert not result.uses_rollups
+    assert result.raw == [(1000.0, 5000.0, True)]
+
+
+def test_plan_uses_coarsest_buckets_and_raw_edges():
+    """Test a range splits into day, hour and minute buckets plus partial edges"""
+    start = COVERAGE + 30                   # 01:02:30
+    end = 103 * DAY + 2 * 3600 + 150        # day 103, 02:02:30
+    result = plan(start, end, COVERAGE, 10 ** 9)
+
+    assert ('day', 101 * DAY, 103 * DAY) in result.rolled
+    assert ('hour', 100 * DAY + 2 * 3600, 101 * DAY) in result.rolled
+    assert ('minute', COVERAGE + 60, 100 * DAY + 2 * 3600) in result.rolled
+    assert ('hour', 103 * DAY, 103 * DAY + 2 * 3600) in result.rolled
+    assert ('minute', 103 * DAY + 2 * 3600, 103 * DAY + 2 * 3600 + 120) in result.rolled
+    assert (start, COVERAGE + 60, False) in result.raw
+    assert (103 * DAY + 2 * 3600 + 120, end, True) in result.raw
+
+    # Rolled segments and raw edges tile the range exactly once
+    pieces = sorted([(a, b) for _, a, b in result.rolled] + [(a, b) for a, b, _ in result.raw])
+    assert pieces[0][0] == start and pieces[-1][1] == end
+    assert all(prev[1] == nxt[0] for prev, nxt in zip(pieces, pieces[1:]))
+
+
+def test_plan_reads_history_before_coverage_raw():
+    """Test rows older than the coverage start and newer than the flush lag stay raw"""
+    safe_end = COVERAGE + 3 * 3600 + 45
+    result = plan(None, None, COVERAGE, safe_end)
+
+    assert result.raw[0] == (None, COVERAGE, False)
+    assert result.raw[-1] == (safe_end, None, True)
+    condition, params = result.raw_condition()
+    assert "timestamp < %s" in condition and "timestamp >= %s" in condition
+    assert params[0] == COVERAGE and safe_end in params
+    # Each raw edge also prunes day partitions
+    assert "ts_day <= %s" in condition and "ts_day >= %s" in condition
+    assert params[-1] == safe_end // DAY
+
+
+def test_aggregator_flushes_every_granularity(monkeypatch):
+    """Test recorded requests are upserted as minute, hour and day rows"""
+    db = ScriptedDatabase()
+    monkeypatch.setattr(rollups, "get_db_connection", db.connect)
+    aggregator = RollupAggregator(flush_interval=10)
+
+    aggregator.record(1, COVERAGE + 5, "/users", 200, 100.0, False, "10.0.0.1", "curl/8")
+    aggregator.record(1, COVERAGE + 65, "/users", 500, 300.0, True, "10.0.0.2", None)
+    asyncio.run(aggregator.flush())
+
+    rows = {}
+    for sql, params in db.executed:
+        if "INSERT INTO request_rollups ( api_id, granularity, bucket_start, request_count" in sql:
+            rows.setdefault((params[1], params[2]), [0, 0, 0, 0, 0.0])
+            for i, value in enumerate(params[3:]):
+                rows[(params[1], params[2])][i] += value
+    assert rows[('minute', COVERAGE)] == [1, 0, 0, 1, 100.0]
+    assert rows[('minute', COVERAGE + 60)] == [1, 1, 1, 1, 300.0]
+    assert rows[('hour', 100 * DAY + 3600)] == [2, 1, 1, 2, 400.0]
+    assert rows[('day', 100 * DAY)] == [2, 1, 1, 2, 400.0]
+    assert len(db.statements("INSERT INTO request_rollup_endpoints ( api_id")) == 4
+    sketch_writes = [
+        params for sql, params in db.executed
+        if "INSERT INTO request_rollups (api_id, granularity, bucket_start, ip_sketch" in sql
+    ]
+    assert len(sketch_writes) == 4
+    assert len(db.statements("FROM request_rollups WHERE (api_id, granularity, bucket_start) IN")) == 1
+    assert len(db.statements("INSERT INTO request_rollup_endpoints (api_id, granularity, bucket_start, endpoint, latency_sketch)")) == 4
+
+
+def test_get_metrics_combines_rollups_and_raw_edges(monkeypatch):
+    """Test dashboard totals add rollup buckets and raw edges"""
+    db = ScriptedDatabase([
+        ("SUM(latency_sum)", [{
+            'total': 100, 'errors': 10, 'suspicious': 5, 'latency_count': 50, 'latency_sum': 5000.0
+        }]),
+        ("COUNT(DISTINCT client_ip)", [{'unique_ips': 12}]),
+        ("FROM alerts", [{'alerts': 2}]),
+        ("GROUP BY endpoint ORDER BY", [{'endpoint': '/users', 'count': 100}]),
+        ("GROUP BY time_bucket", [{'time_bucket': COVERAGE + 3600, 'count': 60}]),
+    ])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    monkeypatch.setattr(metrics.rollup_aggregator, "_coverage", {'counts': COVERAGE})
+
+    result = asyncio.run(metrics.get_metrics(
+        MetricsQuery(api_id=3, start_time=COVERAGE - 600, end_time=COVERAGE + 3630, interval='minute'),
+        user=ADMIN
+    ))
+
+    assert result.total_requests == 100
+    assert result.error_rate == pytest.approx(0.1)
+    assert result.avg_latency_ms == 100.0
+    assert result.unique_ips == 12
+    assert result.requests_over_time[0] == {'time': '1970-04-11 02:02', 'count': 60}
+    assert len(result.requests_over_time) == 71
+    assert all(point['count'] == 0 for point in result.requests_over_time[1:])
+
+    scalar_sql = db.statements("SUM(latency_sum)")[0]
+    assert "FROM request_rollups" in scalar_sql and "UNION ALL" in scalar_sql
+    series_sql = db.statements("GROUP BY time_bucket")[0]
+    assert "granularity = %s" in series_sql
+    _, series_params = next(e for e in db.executed if "GROUP BY time_bucket" in e[0])
+    assert 'minute' in series_params and 'day' not in series_params
+
+
+def _sketch_db(sketch):
+    return ScriptedDatabase([
+        ("SUM(latency_sum)", [{
+            'total': 100, 'errors': 0, 'suspicious': 0, 'latency_count': 0, 'latency_sum': None
+        }]),
+        ("SELECT ip_sketch", [{'ip_sketch': sketch.to_bytes()}]),
+        ("SELECT DISTINCT client_ip", [{'client_ip': '10.0.0.1'}, {'client_ip': '192.168.1.1'}]),
+        ("COUNT(DISTINCT client_ip)", [{'unique_ips': 42}]),
+        ("FROM alerts", [{'alerts': 0}]),
+    ])
+
+
+def test_unique_ips_estimated_from_sketches(monkeypatch):
+    """Test unique IPs merge rollup sketches with the raw edge IPs by default"""
+    sketch = HyperLogLog()
+    sketch.update(f"10.0.0.{i}" for i in range(1, 101))
+    db = _sketch_db(sketch)
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    monkeypatch.setattr(metrics.rollup_aggregator, "_coverage", {'counts': COVERAGE, 'ip_sketch': COVERAGE})
+
+    result = asyncio.run(metrics.get_metrics(MetricsQuery(start_time=COVERAGE - 600), user=ADMIN))
+
+    assert abs(result.unique_ips - 101) <= 3
+    assert not result.unique_ips_exact
+    assert result.unique_ips_error == pytest.approx(0.01625)
+    assert not db.statements("COUNT(DISTINCT client_ip)")
+
+
+def test_unique_ips_exact_on_request_or_without_sketch_coverage(monkeypatch):
+    """Test exact=true, or rollups that predate sketches, count distinct raw IPs"""
+    db = _sketch_db(HyperLogLog())
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    monkeypatch.setattr(metrics.rollup_aggregator, "_coverage", {'counts': COVERAGE, 'ip_sketch': COVERAGE})
+
+    result = asyncio.run(metrics.get_metrics(MetricsQuery(start_time=COVERAGE, exact=True), user=ADMIN))
+    assert result.unique_ips == 42 and result.unique_ips_exact
+
+    monkeypatch.setattr(metrics.rollup_aggregator, "_coverage", {'counts': COVERAGE})
+    result = asyncio.run(metrics.get_metrics(MetricsQuery(start_time=COVERAGE), user=ADMIN))
+    assert result.unique_ips == 42 and result.unique_ips_exact
+
+
+def test_top_lists_come_from_heavy_hitter_sketches(monkeypatch):
+    """Test top endpoints, IPs and user agents merge rollup sketches with raw edge counts"""
+    stored = SpaceSaving()
+    stored.update({'10.0.0.9': 500, '10.0.0.1': 20})
+    db = ScriptedDatabase([
+        ("SUM(latency_sum)", [{
+            'total': 520, 'errors': 0, 'suspicious': 0, 'latency_count': 0, 'latency_sum': None
+        }]),
+        ("SELECT top_ips FROM", [{'top_ips': stored.to_bytes()}]),
+        ("SELECT client_ip as item", [{'item': '10.0.0.1', 'count': 490}]),
+        ("COUNT(DISTINCT client_ip)", [{'unique_ips': 2}]),
+        ("FROM alerts", [{'alerts': 0}]),
+    ])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    monkeypatch.setattr(metrics.rollup_aggregator, "_coverage", {'counts': COVERAGE, 'top_k': COVERAGE})
+
+    result = asyncio.run(metrics.get_metrics(MetricsQuery(start_time=COVERAGE - 600), user=ADMIN))
+
+    assert result.top_client_ips == [
+        {'client_ip': '10.0.0.1', 'count': 510, 'error': 0},
+        {'client_ip': '10.0.0.9', 'count': 500, 'error': 0},
+    ]
+    assert db.statements("SELECT top_endpoints FROM") and db.statements("SELECT top_user_agents FROM")
+    assert not db.statements("GROUP BY endpoint ORDER BY")
+
+
+def test_latency_percentiles_merge_rollup_and_raw_bins(monkeypatch):
+    """Test percentiles combine stored latency sketches with SQL-binned raw edges"""
+    stored = DDSketch()
+    for value in range(1, 101):
+        stored.add(float(value))
+    edge_bin = stored.bin_of(1000.0)
+    db = ScriptedDatabase([
+        ("SUM(latency_sum)", [{
+            'total': 101, 'errors': 0, 'suspicious': 0, 'latency_count': 101, 'latency_sum': 6050.0
+        }]),
+        ("SELECT latency_sketch FROM", [{'latency_sketch': stored.to_bytes()}]),
+        ("CEIL(LN(latency_ms)", [{'bin': edge_bin, 'count': 1}]),
+        ("COUNT(DISTINCT client_ip)", [{'unique_ips': 1}]),
+        ("FROM alerts", [{'alerts': 0}]),
+    ])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    monkeypatch.setattr(metrics.rollup_aggregator, "_coverage", {'counts': COVERAGE, 'latency': COVERAGE})
+
+    result = asyncio.run(metrics.get_metrics(MetricsQuery(start_time=COVERAGE - 600), user=ADMIN))
+
+    assert result.latency_percentiles['p50'] == pytest.approx(51, rel=0.01)
+    assert result.latency_percentiles['p99'] == pytest.approx(100, rel=0.01)
+    _, bin_params = next(e for e in db.executed if "CEIL(LN(latency_ms)" in e[0])
+    assert bin_params[1] == pytest.approx(DDSketch().log_gamma)
+
+
+def test_backfill_adds_history_before_coverage_without_rewriting_covered_buckets(sqlite_db, monkeypatch):
+    """Test backfill only adds pre-coverage raw rows, moves coverage back, and is idempotent"""
+    day = 19700
+    coverage = day * DAY + 12 * 3600
+    monkeypatch.setattr(dictionaries, "get_db_connection", get_db_connection)
+    endpoint = Dictionary("endpoints", max_entries=10).id_for("/posts/{id}")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("INSERT INTO users (email, password_hash) VALUES ('backfill@boing.local', 'x')")
+        cursor.execute(
+            "INSERT INTO apis (user_id, name, api_key, api_secret_encrypted) VALUES (%s, 'Backfill', 'backfill-key', 'x')",
+            (cursor.lastrowid,)
+        )
+        api_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO request_logs (api_id, timestamp, method, endpoint_id, client_ip, status_code, latency_ms)"
+            " VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            [(api_id, (day - 1) * DAY + 60 * i, "GET", endpoint, f"10.0.0.{i}", 200, 10.0) for i in range(3)]
+            + [(api_id, day * DAY + 60 * i, "GET", endpoint, "10.0.0.9", 500, 30.0) for i in range(2)]
+            # The aggregator counted 4 after the coverage start; retention deleted 3 of them since
+            + [(api_id, coverage + 3600, "GET", endpoint, "10.0.0.9", 200, 10.0)]
+        )
+        live = SpaceSaving()
+        live.update({"/live": 4})
+        cursor.executemany(
+            "INSERT INTO request_rollups (api_id, granularity, bucket_start, request_count, top_endpoints)"
+            " VALUES (%s, %s, %s, %s, %s)",
+            [(api_id, 'day', day * DAY, 4, live.to_bytes()), (api_id, 'hour', coverage + 3600, 4, None)]
+        )
+        cursor.executemany(
+            "INSERT INTO rollup_state (name, value) VALUES (%s, %s)",
+            [(name, coverage) for name in rollups.COVERAGE_KEYS.values()]
+        )
+        conn.commit()
+
+        def rollup(granularity, bucket_start):
+            cursor.execute(
+                "SELECT * FROM request_rollups WHERE api_id = %s AND granularity = %s AND bucket_start = %s",
+                (api_id, granularity, bucket_start)
+            )
+            return cursor.fetchone()
+
+        for _ in range(2):
+            rollups.backfill()
+            today = rollup('day', day * DAY)
+            assert (today['request_count'], today['error_count']) == (6, 2)
+            assert dict((item, count) for item, count, _ in SpaceSaving.from_bytes(today['top_endpoints']).top()) == {
+                "/live": 4, "/posts/{id}": 2
+            }
+            yesterday = rollup('day', (day - 1) * DAY)
+            assert yesterday['request_count'] == 3
+            assert HyperLogLog.from_bytes(yesterday['ip_sketch']).count() == 3
+            assert DDSketch.from_bytes(yesterday['latency_sketch']).count == 3
+            assert rollup('hour', coverage + 3600)['request_count'] == 4
+            cursor.execute("SELECT DISTINCT value FROM rollup_state")
+            assert [row['value'] for row in cursor.fetchall()] == [(day - 1) * DAY]
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,98 @@
+"""
+Tests for the approximate sketches
+"""
+import random
+
+import pytest
+
+from sketches import DDSketch, HyperLogLog, SpaceSaving
+
+
+def _ips(start, count):
+    return (f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(start, start + count))
+
+
+@pytest.mark.parametrize("distinct", [10, 1000, 50000])
+def test_hyperloglog_estimate_within_error_bound(distinct):
+    """Test estimates stay within three standard errors of the true count"""
+    sketch = HyperLogLog()
+    sketch.update(_ips(0, distinct))
+    sketch.update(_ips(0, distinct))    # duplicates do not count twice
+    assert abs(sketch.count() - distinct) <= 3 * sketch.relative_error * distinct + 1
+
+
+def test_hyperloglog_merge_is_union():
+    """Test merging sketches of overlapping sets estimates the union"""
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(_ips(0, 20000))
+    b.update(_ips(10000, 20000))
+    union = HyperLogLog()
+    union.update(_ips(0, 30000))
+
+    assert a.merge(b).count() == union.count()
+
+
+def test_hyperloglog_round_trips_through_bytes():
+    """Test serialized sketches are compact when sparse and decode losslessly"""
+    sketch = HyperLogLog()
+    sketch.update(_ips(0, 5))
+    data = sketch.to_bytes()
+    assert len(data) < 200
+    assert HyperLogLog.from_bytes(data).count() == sketch.count() == 5
+    assert HyperLogLog().relative_error == pytest.approx(1.04 / 64)
+
+
+def test_space_saving_finds_heavy_hitters():
+    """Test frequent items are tracked with counts that never underestimate"""
+    counts = {f"/endpoint/{i}": 1 for i in range(500)}
+    counts.update({"/login": 400, "/search": 250, "/users": 120})
+    stream = [item for item, n in counts.items() for _ in range(n)]
+    random.Random(3).shuffle(stream)
+
+    summary = SpaceSaving(capacity=32)
+    for item in stream:
+        summary.add(item)
+    top = summary.top(3)
+
+    assert [item for item, _, _ in top] == ["/login", "/search", "/users"]
+    for item, count, error in top:
+        assert counts[item] <= count <= counts[item] + error
+
+
+def test_space_saving_merge_and_round_trip():
+    """Test merged summaries add counts and survive serialization"""
+    a, b = SpaceSaving(capacity=4), SpaceSaving(capacity=4)
+    a.update({"10.0.0.1": 50, "10.0.0.2": 5})
+    b.update({"10.0.0.1": 20, "10.0.0.3": 30})
+    merged = SpaceSaving.from_bytes(a.merge(b).to_bytes())
+
+    assert merged.top(2) == [("10.0.0.1", 70, 0), ("10.0.0.3", 30, 0)]
+
+
+def test_ddsketch_quantiles_within_relative_accuracy():
+    """Test quantiles of a long-tailed latency sample are within 1% of exact"""
+    rng = random.Random(5)
+    values = sorted(rng.lognormvariate(4.5, 0.8) for _ in range(20000))
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.011)
+
+
+def test_ddsketch_merge_matches_single_sketch_and_round_trips():
+    """Test merged sketches answer like one sketch over all values"""
+    a, b, whole = DDSketch(), DDSketch(), DDSketch()
+    for i in range(1, 1001):
+        (a if i % 2 else b).add(float(i))
+        whole.add(float(i))
+    a.add(0.0)
+    whole.add(0.0)
+
+    merged = DDSketch.from_bytes(a.merge(b).to_bytes())
+    assert merged.count == whole.count == 1001
+    assert merged.quantile(0.99) == whole.quantile(0.99)
+    assert merged.quantile(0.0) == 0.0
+    assert DDSketch().quantile(0.5) is None
@@ -0,0 +1,103 @@
+"""
+Tests for the SQLite backend and its MySQL statement translation
+"""
+import dictionaries
+from database import get_db_connection
+from dictionaries import Dictionary
+from retention import RetentionJob
+from rollups import raw_latency_sketches
+from sketches import DDSketch
+from sql_dialect import translate
+
+
+def test_translate_rewrites_mysql_constructs():
+    """Test placeholders, upserts, date arithmetic and limited writes become SQLite SQL"""
+    assert translate("SELECT * FROM t WHERE a = %s AND b LIKE 'x%%'") == ("SELECT * FROM t WHERE a = ? AND b LIKE 'x%'",)
+    assert translate("SELECT %(api_id)s", "named") == ("SELECT :api_id",)
+    assert translate("SELECT '100%%'", None) == ("SELECT '100%%'",)
+
+    upsert, = translate("INSERT INTO r (k, n) VALUES (%s, %s) ON DUPLICATE KEY UPDATE n = n + VALUES(n)")
+    assert upsert.endswith("ON CONFLICT DO UPDATE SET n = n + excluded.n")
+    ids, = translate("INSERT INTO e (value) VALUES (%s) ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)")
+    assert ids.endswith("ON CONFLICT DO UPDATE SET id = id RETURNING id")
+
+    assert translate("SELECT 1 WHERE created_at > DATE_SUB(NOW(), INTERVAL 24 HOUR)") == (
+        "SELECT 1 WHERE created_at > datetime(CURRENT_TIMESTAMP, '-24 hours')",
+    )
+    assert translate("DELETE FROM logs WHERE api_id = %s LIMIT %s") == (
+        "DELETE FROM logs WHERE rowid IN (SELECT rowid FROM logs WHERE api_id = ? LIMIT ?)",
+    )
+
+
+def test_translate_create_table_moves_indexes_out():
+    """Test MySQL table definitions become a table and per-table index names"""
+    statements = translate("""
+        CREATE TABLE IF NOT EXISTS logs (
+            id BIGINT AUTO_INCREMENT,
+            kind ENUM('a', 'b') NOT NULL,  -- a comment, with a comma
+            value VARCHAR(10) COLLATE utf8mb4_bin NOT NULL,
+            PRIMARY KEY (id, kind),
+            UNIQUE KEY uq_value (value),
+            INDEX idx_kind (kind, id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        PARTITION BY RANGE (id) (PARTITION p_future VALUES LESS THAN MAXVALUE)
+    """)
+
+    assert statements[0] == (
+        "CREATE TABLE IF NOT EXISTS logs (\n    id INTEGER PRIMARY KEY AUTOINCREMENT,\n"
+        "    kind TEXT NOT NULL,\n    value VARCHAR(10) NOT NULL,\n    UNIQUE (value)\n)"
+    )
+    assert statements[1:] == ("CREATE INDEX IF NOT EXISTS logs_idx_kind ON logs (kind, id)",)
+
+
+def test_sqlite_backend_runs_dictionary_and_retention_sql(sqlite_db, monkeypatch):
+    """Test id assignment and batched deletes behave as on MySQL"""
+    monkeypatch.setattr(dictionaries, "get_db_connection", get_db_connection)
+    endpoints = Dictionary("endpoints", max_entries=10)
+    first = endpoints.id_for("/users")
+    endpoints.clear()
+    assert endpoints.id_for("/users") == first
+    assert endpoints.id_for("/posts") != first
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "INSERT INTO request_logs (api_id, timestamp, method, endpoint_id, client_ip) VALUES (%s, %s, %s, %s, %s)",
+            [(1, 1704153600.0 + i, "GET", first, "10.0.0.1") for i in range(5)]
+        )
+        conn.commit()
+        job = RetentionJob(interval=60, batch_rows=2, pause=0)
+        assert job._batches(conn, cursor, "DELETE FROM request_logs WHERE api_id = %s", [1]) == 5
+
+        cursor.execute("SELECT COUNT(*) as count FROM request_logs")
+        assert cursor.fetchone() == {'count': 0}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def test_sqlite_backend_computes_latency_sketch_bins(sqlite_db):
+    """Test the CEIL(LN()) bins of raw latency sketches match the Python sketch"""
+    latencies = [0.0, 0.5, 1.2, 18.0, 250.0, 250.0, 4000.0]
+    expected = DDSketch()
+    for latency in latencies:
+        expected.add(latency)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "INSERT INTO request_logs (api_id, timestamp, method, endpoint_id, client_ip, latency_ms) VALUES (%s, %s, %s, %s, %s, %s)",
+            [(2, 1704153600.0 + i, "GET", 1, "10.0.0.1", latency) for i, latency in enumerate(latencies)]
+        )
+        conn.commit()
+
+        sketch = raw_latency_sketches(cursor, ["api_id = %s"], [2])[None]
+        assert sketch.bins == expected.bins and sketch.zero_count == expected.zero_count
+
+        cursor.execute("SELECT LN(0) as ln_zero, CEIL(NULL) as ceil_null")
+        assert cursor.fetchone() == {'ln_zero': None, 'ceil_null': None}
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,63 @@
+"""
+Tests for the statement registry and per-statement statistics
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import database
+from database import get_db_connection
+from routes import admin
+from statements import OTHER, StatementStats, fingerprint, register
+
+
+def test_fingerprint_folds_literals_and_value_lists():
+    """Test statements differing only in values share one fingerprint"""
+    assert fingerprint("SELECT * FROM apis\n  WHERE id IN (%s, %s, %s) AND name = 'it''s'") == (
+        "SELECT * FROM apis WHERE id IN (?, ...) AND name = ?"
+    )
+    assert fingerprint("INSERT INTO t (a, b) VALUES (1, 'x'), (2, NULL)") == "INSERT INTO t (a, b) VALUES (...)"
+
+
+def test_stats_key_registered_statements_by_name_and_cap_entries():
+    """Test named statements keep their name, and fingerprints beyond the cap count as other"""
+    lookup = register("test.lookup", """
+        SELECT id FROM apis
+        WHERE api_key = %s
+    """)
+    assert lookup == "SELECT id FROM apis WHERE api_key = %s"
+    stats = StatementStats(max_entries=2)
+
+    stats.record(lookup, 0.002, rows=1)
+    stats.record(lookup, 0.004, rows=0)
+    stats.record("SELECT 1", 0.001)
+    stats.record("SELECT * FROM users", 0.010, ok=False)
+
+    entries = {entry['statement']: entry for entry in stats.snapshot(sort='calls')['statements']}
+    assert entries['test.lookup'] == {
+        'statement': 'test.lookup', 'calls': 2, 'errors': 0, 'rows': 1,
+        'total_ms': 6.0, 'avg_ms': 3.0, 'max_ms': 4.0,
+    }
+    assert entries['SELECT ?']['calls'] == 1
+    assert entries[OTHER]['calls'] == 1 and entries[OTHER]['errors'] == 1
+    with pytest.raises(ValueError):
+        stats.snapshot(sort='name')
+
+
+def test_cursor_executions_are_recorded_and_served_to_admins(sqlite_db, monkeypatch):
+    """Test instrumented cursors feed the stats the admin endpoint returns"""
+    stats = StatementStats(max_entries=100)
+    monkeypatch.setattr(database, "statement_stats", stats)
+    monkeypatch.setattr(admin, "statement_stats", stats)
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE users SET full_name = %s WHERE id > %s", ("x", 0))
+    finally:
+        conn.close()
+
+    result = asyncio.run(admin.statement_statistics(user={'role': 'admin'}))
+    assert [entry['statement'] for entry in result['statements']] == ["UPDATE users SET full_name = ? WHERE id > ?"]
+    with pytest.raises(HTTPException):
+        asyncio.run(admin.statement_statistics(sort='bogus', user={'role': 'admin'}))
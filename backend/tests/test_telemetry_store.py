@@ -0,0 +1,116 @@
+"""
+Tests for the columnar telemetry store
+"""
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import endpoint_templates
+from endpoint_templates import EndpointTemplater
+from models import LogQuery, MetricsQuery, RequestLog
+from routes import ingest, metrics
+from telemetry_store import SegmentStore
+from tests.fakes import ScriptedDatabase
+
+HOUR = 1704153600.0  # 2024-01-02 00:00 UTC
+ADMIN = {'id': 1, 'role': 'admin'}
+
+
+def _store(directory, capacity=100):
+    return SegmentStore(str(directory), window_seconds=3600, capacity=capacity, seal_grace=60,
+                        flush_interval=5, retention_days=0, cache_columns=8)
+
+
+def _event(timestamp, api_id=1, endpoint="/users/{id}", status_code=200, latency_ms=10.0):
+    return {
+        'timestamp': timestamp, 'api_id': api_id, 'method': 'GET', 'endpoint': endpoint,
+        'client_ip': '10.0.0.1', 'status_code': status_code, 'latency_ms': latency_ms,
+        'body_size': 0, 'user_agent': None,
+    }
+
+
+def test_scan_reads_open_and_sealed_segments_alike(tmp_path):
+    """Test scans filter by API and time the same way before and after a segment is sealed"""
+    store = _store(tmp_path)
+    for i in range(10):
+        store.append(_event(HOUR + i * 60, api_id=1 + i % 2, status_code=500 if i < 4 else 200))
+    store.append(_event(HOUR + 3600, latency_ms=None))
+
+    def statuses():
+        return [batch['status_code'].tolist() for batch in store.scan([1], HOUR + 60, HOUR + 3600)]
+
+    before = statuses()
+    assert before == [[500, 200, 200, 200], [200]]
+
+    asyncio.run(store.maintain(now=HOUR + 3600 + 60))
+    assert sorted(p.name for p in tmp_path.iterdir() if p.suffix in (".npz", ".open")) == [
+        "0000000000.npz", "0000000001.open"
+    ]
+    assert statuses() == before
+    assert list(store.scan([3])) == []
+
+    newest, = store.recent(1, 1, ['latency_ms', 'endpoint'])
+    assert newest.rows() == [{'latency_ms': None, 'endpoint': "/users/{id}"}]
+    store.close()
+
+
+def test_reopened_store_recovers_flushed_rows(tmp_path):
+    """Test an open segment survives a restart up to its last flush, suspicious marks included"""
+    store = _store(tmp_path, capacity=2)
+    first = store.append(_event(HOUR))
+    store.append(_event(HOUR + 1))
+    store.append(_event(HOUR + 2))  # segment full: continues in a new one
+    store.mark_suspicious(first)
+    store.close()
+
+    store = _store(tmp_path, capacity=2)
+    flags = np.concatenate([batch['is_suspicious'] for batch in store.scan()])
+    assert flags.tolist() == [1, 0, 0]
+    assert store.append(_event(HOUR + 3)) >> 32 == 2
+    store.close()
+
+
+def test_ingest_and_metrics_use_the_store(tmp_path, monkeypatch):
+    """Test ingest appends instead of inserting and metrics aggregate the scanned rows"""
+    store = _store(tmp_path)
+    db = ScriptedDatabase([
+        ("FROM apis WHERE api_key", [{'id': 4, 'is_active': True}]),
+        ("FROM alerts", [{'alerts': 0}]),
+    ])
+    monkeypatch.setattr(ingest.settings, "TELEMETRY_STORE_ENABLED", True)
+    monkeypatch.setattr(ingest, "telemetry", store)
+    monkeypatch.setattr(metrics, "telemetry", store)
+    monkeypatch.setattr(ingest, "get_db_connection", db.connect)
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+    monkeypatch.setattr(endpoint_templates, "get_db_connection", db.connect)
+    monkeypatch.setattr(ingest, "templater", EndpointTemplater(60, 50, 100))
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(detection_engine=None)))
+
+    for i, (status_code, latency) in enumerate([(200, 10.0), (200, 20.0), (503, 400.0)]):
+        response = asyncio.run(ingest._ingest(RequestLog(
+            api_key='k', timestamp=HOUR + i, method='GET', endpoint=f"/orders/{i + 1}",
+            client_ip=f"10.0.0.{i % 2}", status_code=status_code, latency_ms=latency
+        ), request))
+    assert not db.statements("request_logs")
+    # Event ids are not request_logs ids, so they stay out of log_id
+    assert (response['log_id'], response['event_id']) == (None, 2)
+
+    result = metrics._compute_metrics(
+        MetricsQuery(api_id=4, start_time=HOUR - 60, end_time=HOUR + 60, interval='1m'), user=ADMIN
+    )
+    assert (result.total_requests, result.unique_ips) == (3, 2)
+    assert result.error_rate == 1 / 3
+    assert result.top_endpoints[0]['endpoint'] == "/orders/{id}"
+    assert abs(result.latency_percentiles['p50'] - 20.0) <= 0.2
+    assert [point['count'] for point in result.requests_over_time] == [0, 3, 0]
+
+    # Log search only covers request_logs, from before the store's first window
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(metrics.query_logs(LogQuery(), user=ADMIN))
+    assert rejected.value.status_code == 501 and "telemetry store" in rejected.value.detail
+    older = asyncio.run(metrics.query_logs(LogQuery(end_time=HOUR - 1, total="none"), user=ADMIN))
+    assert older['logs'] == []
+    store.close()
@@ -0,0 +1,84 @@
+"""
+Tests for integer time bucketing
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from models import MetricsQuery
+from routes import metrics
+from time_buckets import BucketSpec, MAX_BUCKETS, parse_width
+from tests.fakes import ScriptedDatabase
+
+ADMIN = {'id': 1, 'role': 'admin'}
+JAN_2 = 1704153600    # 2024-01-02 00:00 UTC
+
+
+def test_parse_width_accepts_units_and_names():
+    """Test widths are given with s/m/h/d units or the legacy names"""
+    assert parse_width("10s") == 10
+    assert parse_width("5m") == 300
+    assert parse_width("6h") == 6 * 3600
+    assert parse_width("hour") == 3600
+    for bad in ("0s", "5x", "minutes", ""):
+        with pytest.raises(ValueError):
+            parse_width(bad)
+
+
+def test_buckets_align_to_local_time():
+    """Test day buckets start at local midnight and labels use the timezone"""
+    spec = BucketSpec("1d", "Asia/Kolkata", JAN_2)
+    assert spec.offset == 19800
+    assert spec.sql("timestamp") == "FLOOR((timestamp + 19800) / 86400) * 86400 - 19800"
+
+    bucket = spec.floor(JAN_2 + 3600)             # 06:30 local
+    assert bucket == JAN_2 - 19800
+    assert spec.label(bucket) == "2024-01-02"
+    # Half-hour offsets only nest minute rollups
+    assert spec.rollup_granularity == 'minute'
+    assert BucketSpec("1d", "UTC", JAN_2).rollup_granularity == 'day'
+    assert BucketSpec("10s").rollup_granularity is None
+
+
+def test_window_and_gap_fill():
+    """Test the window keeps the latest buckets and fills missing ones with zeros"""
+    spec = BucketSpec("5m")
+    first, last = spec.window(None, JAN_2 + 1000)
+    assert last == JAN_2 + 900
+    assert (last - first) // 300 == MAX_BUCKETS - 1
+
+    first, last = spec.window(JAN_2 + 10, JAN_2 + 1000)
+    assert spec.fill({JAN_2 + 300: 7}, first, last) == [
+        (JAN_2 + 900, 0), (JAN_2 + 600, 0), (JAN_2 + 300, 7), (JAN_2, 0)
+    ]
+
+
+def test_metrics_series_uses_integer_buckets(monkeypatch):
+    """Test the series query groups by arithmetic on the timestamp column"""
+    db = ScriptedDatabase([
+        ("COUNT(DISTINCT client_ip)", [{
+            'total': 4, 'errors': 0, 'avg_latency': None, 'unique_ips': 1, 'suspicious': 0
+        }]),
+        ("FROM alerts", [{'alerts': 0}]),
+        ("GROUP BY time_bucket", [{'time_bucket': JAN_2 + 20, 'count': 4}]),
+    ])
+    monkeypatch.setattr(metrics, "get_db_connection", db.connect)
+
+    result = asyncio.run(metrics.get_metrics(
+        MetricsQuery(start_time=JAN_2, end_time=JAN_2 + 59, interval="10s"), user=ADMIN
+    ))
+
+    assert [point['count'] for point in result.requests_over_time] == [0, 0, 0, 4, 0, 0]
+    assert result.requests_over_time[3]['time'] == "2024-01-02 00:00:20"
+    series_sql = db.statements("GROUP BY time_bucket")[0]
+    assert "FLOOR(timestamp / 10) * 10" in series_sql
+    assert "DATE_FORMAT" not in series_sql and "FROM request_rollups" not in series_sql
+
+
+def test_metrics_rejects_unknown_interval_and_timezone():
+    """Test invalid widths and timezones are reported as bad requests"""
+    for query in (MetricsQuery(interval="fortnight"), MetricsQuery(timezone="Mars/Olympus")):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(metrics.get_metrics(query, user=ADMIN))
+        assert exc.value.status_code == 400
@@ -0,0 +1,82 @@
+"""
+Tests for per-request span tracing
+"""
+import asyncio
+
+import detection_engine
+from detection_engine import DetectionEngine
+from tests.fakes import FakeDatabase, FakeAlertService
+from tracing import Tracer, InMemorySpanExporter, NOOP_SPAN, tracer
+
+
+def test_child_spans_share_trace_and_parent():
+    """Test nested spans are linked to the root span"""
+    exporter = InMemorySpanExporter()
+    t = Tracer(sample_rate=1.0, max_traces_per_second=0, exporters=[exporter])
+
+    with t.start_trace("ingest") as root:
+        with t.span("ingest.insert_log"):
+            pass
+        with t.span("detection.analyze") as analyze:
+            with t.span("detector.rate_limit"):
+                pass
+
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    assert set(spans) == {"ingest", "ingest.insert_log", "detection.analyze", "detector.rate_limit"}
+    assert all(s.trace_id == root.trace_id for s in spans.values())
+    assert spans["ingest"].parent_span_id is None
+    assert spans["detector.rate_limit"].parent_span_id == analyze.span_id
+    otlp = spans["detector.rate_limit"].to_otlp()
+    assert len(otlp["traceId"]) == 32 and len(otlp["spanId"]) == 16
+
+
+def test_unsampled_traces_record_nothing():
+    """Test spans outside a sampled trace are no-ops"""
+    exporter = InMemorySpanExporter()
+    t = Tracer(sample_rate=0.0, exporters=[exporter])
+
+    with t.start_trace("ingest") as root:
+        with t.span("ingest.insert_log") as child:
+            child.set_attribute("ignored", True)
+
+    assert root is NOOP_SPAN and child is NOOP_SPAN
+    assert exporter.get_finished_spans() == []
+
+
+def test_trace_budget_caps_sampled_traces():
+    """Test the per-second budget bounds how many traces are recorded"""
+    exporter = InMemorySpanExporter()
+    t = Tracer(sample_rate=1.0, max_traces_per_second=5, exporters=[exporter])
+
+    for _ in range(100):
+        with t.start_trace("ingest"):
+            pass
+
+    assert 5 <= len(exporter.get_finished_spans()) <= 6
+
+
+def test_detection_engine_emits_detector_and_alert_spans(monkeypatch):
+    """Test analyze_request produces one span per detector and for alert creation"""
+    exporter = InMemorySpanExporter()
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+    monkeypatch.setattr(tracer, "max_traces_per_second", 0)
+    monkeypatch.setattr(tracer, "exporters", [exporter])
+    monkeypatch.setattr(detection_engine, "get_db_connection", FakeDatabase().connect)
+    engine = DetectionEngine(FakeAlertService())
+
+    async def analyze():
+        with tracer.start_trace("ingest"):
+            return await engine.analyze_request({
+                'log_id': 1, 'api_id': 1, 'timestamp': 1700000000.0, 'method': 'GET',
+                'endpoint': "/users?id=1 UNION SELECT * FROM users--", 'client_ip': '203.0.113.5',
+                'status_code': 200, 'latency_ms': 120.0, 'headers': {}, 'body_size': 0, 'user_agent': 'curl'
+            })
+
+    result = asyncio.run(analyze())
+    names = [s.name for s in exporter.get_finished_spans()]
+    assert result.risk_score >= 8.0
+    for name in ("detector.rate_limit", "detector.ip_blacklist", "detector.attack_signature",
+                 "detector.latency_spike", "detector.ml_anomaly", "alert.create", "ingest"):
+        assert name in names
+    traces = exporter.recent_traces()
+    assert len(traces) == 1 and traces[0]["root"] == "ingest"
@@ -0,0 +1,102 @@
+"""
+Time buckets - Integer bucketing of unix timestamps for time series
+
+Series group rows by FLOOR((timestamp + offset) / width) * width - offset,
+plain arithmetic on the DOUBLE column that an (api_id, timestamp) index
+covers, instead of formatting every row into a date string. Labels are
+rendered in Python in the requested timezone and empty buckets are filled
+with zeros.
+
+Widths are "<n><unit>" with s, m, h or d units ("10s", "5m", "1h"), or one of
+the names minute, hour and day. The timezone offset is taken at the end of
+the range, so across a DST change the local buckets shift by the DST step.
+"""
+import math
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+from rollups import GRANULARITIES, COARSEST_FIRST
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+MAX_BUCKETS = 100
+MAX_WIDTH = 366 * 86400
+
+_WIDTH = re.compile(r"^\s*(\d+)\s*([smhd])\s*$")
+
+
+def parse_width(interval: str) -> int:
+    """Bucket width in seconds for "10s", "5m", "1h", "1d" or minute/hour/day"""
+    if interval in GRANULARITIES:
+        return GRANULARITIES[interval]
+    match = _WIDTH.match(interval or "")
+    if not match:
+        raise ValueError(f"Invalid interval {interval!r}: use e.g. 10s, 5m, 1h, 1d")
+    width = int(match.group(1)) * UNITS[match.group(2)]
+    if not 1 <= width <= MAX_WIDTH:
+        raise ValueError(f"Interval {interval!r} must be between 1s and {MAX_WIDTH // 86400}d")
+    return width
+
+
+class BucketSpec:
+    def __init__(self, interval: str, tz_name: str = "UTC", at: Optional[float] = None):
+        self.width = parse_width(interval)
+        try:
+            self.tz = ZoneInfo(tz_name or "UTC")
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone {tz_name!r}")
+        moment = datetime.fromtimestamp(at if at is not None else 0, tz=self.tz)
+        self.offset = int(moment.utcoffset().total_seconds())
+
+    @property
+    def label_format(self) -> str:
+        if self.width % 86400 == 0:
+            return "%Y-%m-%d"
+        if self.width % 3600 == 0:
+            return "%Y-%m-%d %H:00"
+        if self.width % 60 == 0:
+            return "%Y-%m-%d %H:%M"
+        return "%Y-%m-%d %H:%M:%S"
+
+    def floor(self, timestamp: float) -> int:
+        return math.floor((timestamp + self.offset) / self.width) * self.width - self.offset
+
+    def floor_array(self, timestamps: np.ndarray) -> np.ndarray:
+        """floor() of an array of timestamps"""
+        return (np.floor((timestamps + self.offset) / self.width) * self.width - self.offset).astype(np.int64)
+
+    def sql(self, column: str) -> str:
+        """SQL expression of the bucket start of a unix timestamp column"""
+        if self.offset:
+            return f"FLOOR(({column} + {self.offset}) / {self.width}) * {self.width} - {self.offset}"
+        return f"FLOOR({column} / {self.width}) * {self.width}"
+
+    def label(self, bucket: int) -> str:
+        return datetime.fromtimestamp(bucket, tz=self.tz).strftime(self.label_format)
+
+    @property
+    def rollup_granularity(self) -> Optional[str]:
+        """Coarsest rollup whose buckets nest exactly inside ours, if any"""
+        for name in COARSEST_FIRST:
+            size = GRANULARITIES[name]
+            if self.width % size == 0 and self.offset % size == 0:
+                return name
+        return None
+
+    def window(self, start_time: Optional[float], end_time: float) -> tuple:
+        """First and last bucket of the range, keeping at most MAX_BUCKETS"""
+        last = self.floor(end_time)
+        first = last - (MAX_BUCKETS - 1) * self.width
+        if start_time is not None:
+            first = max(first, self.floor(start_time))
+        return first, last
+
+    def fill(self, counts: Dict[int, object], first: int, last: int, empty=0) -> List[tuple]:
+        """(bucket, value) for every bucket from last to first, empty ones included"""
+        return [
+            (bucket, counts.get(bucket, empty))
+            for bucket in range(last, first - 1, -self.width)
+        ]
@@ -0,0 +1,271 @@
+"""
+Tracing - Lightweight per-request span instrumentation
+
+Spans follow the OpenTelemetry data model (128-bit trace ids, 64-bit span
+ids, parent ids, nanosecond timestamps, attributes, status) and can be
+shipped to any OpenTelemetry collector as OTLP/HTTP JSON, without pulling
+the OpenTelemetry SDK into the ingest path.
+
+Sampling is decided once per trace: a trace is recorded with probability
+TRACING_SAMPLE_RATE and never more than TRACING_MAX_TRACES_PER_SECOND, so
+tracing overhead stays within a fixed budget at full load. Spans opened
+inside an unsampled trace are a shared no-op object.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("boing_current_span", default=None)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = (
+        "tracer", "name", "trace_id", "span_id", "parent_span_id", "kind",
+        "start_time_unix_nano", "end_time_unix_nano", "attributes", "status", "_token"
+    )
+
+    def __init__(self, tracer, name: str, trace_id: str, parent_span_id: Optional[str],
+                 attributes: Dict[str, Any], kind: int = SPAN_KIND_INTERNAL):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = None
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_time_unix_nano = time.time_ns()
+        if exc_type is not None:
+            self.status = STATUS_ERROR
+            self.attributes["exception.type"] = exc_type.__name__
+        _current_span.reset(self._token)
+        self.tracer._on_end(self)
+        return False
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_time_unix_nano or time.time_ns()
+        return (end - self.start_time_unix_nano) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Span in OTLP/JSON form"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time_unix_nano),
+            "endTimeUnixNano": str(self.end_time_unix_nano or self.start_time_unix_nano),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _NoopSpan:
+    """Stand-in for spans that are not sampled"""
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class InMemorySpanExporter:
+    """Keeps finished spans in memory (tests and the debug endpoint)"""
+
+    def __init__(self, max_spans: Optional[int] = None):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, spans: Sequence[Span]):
+        self.spans.extend(spans)
+
+    def get_finished_spans(self) -> List[Span]:
+        return list(self.spans)
+
+    def clear(self):
+        self.spans.clear()
+
+    def recent_traces(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Group recent spans by trace, newest trace first"""
+        traces: Dict[str, List[Span]] = {}
+        for span in reversed(self.spans):
+            if span.trace_id not in traces:
+                if len(traces) >= limit:
+                    continue
+                traces[span.trace_id] = []
+            traces[span.trace_id].append(span)
+
+        result = []
+        for trace_id, spans in traces.items():
+            spans.sort(key=lambda s: s.start_time_unix_nano)
+            root = next((s for s in spans if s.parent_span_id is None), spans[0])
+            result.append({
+                "trace_id": trace_id,
+                "root": root.name,
+                "duration_ms": round(root.duration_ms, 3),
+                "spans": [
+                    {
+                        "name": s.name,
+                        "span_id": s.span_id,
+                        "parent_span_id": s.parent_span_id,
+                        "offset_ms": round((s.start_time_unix_nano - root.start_time_unix_nano) / 1e6, 3),
+                        "duration_ms": round(s.duration_ms, 3),
+                        "status": "error" if s.status == STATUS_ERROR else "ok",
+                        "attributes": s.attributes,
+                    }
+                    for s in spans
+                ],
+            })
+        return result
+
+
+class OTLPHttpExporter:
+    """Batches spans and posts them to an OpenTelemetry collector as OTLP/HTTP JSON"""
+
+    def __init__(self, endpoint: str, service_name: str = "boing-backend",
+                 flush_interval: float = 5.0, max_queue: int = 10000):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.flush_interval = flush_interval
+        self.queue = deque(maxlen=max_queue)
+
+    def export(self, spans: Sequence[Span]):
+        self.queue.extend(spans)
+
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "boing.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    async def flush(self):
+        if not self.queue:
+            return
+        spans = [self.queue.popleft() for _ in range(len(self.queue))]
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(self.endpoint, json=self._payload(spans), timeout=5)
+                response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Failed to export {len(spans)} spans: {e}")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.01, max_traces_per_second: float = 10.0,
+                 exporters: Optional[List[Any]] = None):
+        self.sample_rate = sample_rate
+        self.max_traces_per_second = max_traces_per_second
+        self.exporters = exporters if exporters is not None else []
+        self._tokens = max_traces_per_second
+        self._refilled_at = time.monotonic()
+
+    def _sample(self) -> bool:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        if self.max_traces_per_second <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_traces_per_second,
+            self._tokens + (now - self._refilled_at) * self.max_traces_per_second
+        )
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def start_trace(self, name: str, **attributes):
+        """Open the root span of a new trace, subject to sampling"""
+        if not self._sample():
+            return NOOP_SPAN
+        return Span(self, name, f"{random.getrandbits(128):032x}", None, attributes, SPAN_KIND_SERVER)
+
+    def span(self, name: str, **attributes):
+        """Open a child of the current span; a no-op when the trace is not sampled"""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    def _on_end(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.export((span,))
+            except Exception as e:
+                logger.error(f"Span exporter failed: {e}")
+
+
+def current_span():
+    """The active span, or the no-op span outside a sampled trace"""
+    return _current_span.get() or NOOP_SPAN
+
+
+recent_spans = InMemorySpanExporter(max_spans=settings.TRACING_BUFFER_SPANS)
+otlp_exporter = OTLPHttpExporter(settings.TRACING_OTLP_ENDPOINT) if settings.TRACING_OTLP_ENDPOINT else None
+
+tracer = Tracer(
+    sample_rate=settings.TRACING_SAMPLE_RATE if settings.TRACING_ENABLED else 0.0,
+    max_traces_per_second=settings.TRACING_MAX_TRACES_PER_SECOND,
+    exporters=[recent_spans] + ([otlp_exporter] if otlp_exporter else [])
+)
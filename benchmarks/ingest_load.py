@@ -0,0 +1,295 @@
+"""
+Ingest load generator - Benchmarks /api/ingest against a local Boing backend
+
+Drives the ingestion endpoint with configurable concurrency, request rate,
+attack mix and payload size using an async HTTP client, then reports
+throughput, latency percentiles and error counts. Every run is saved as JSON
+under benchmarks/results/ so runs can be compared over time.
+
+Usage:
+    python benchmarks/ingest_load.py --api-key <key> --concurrency 50 --requests 5000
+    python benchmarks/ingest_load.py --api-key <key> --rate 200 --duration 60 --attack-ratio 0.2
+    python benchmarks/ingest_load.py --api-key <key> --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import string
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+BOING_URL = "http://localhost:8000"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+NORMAL_ENDPOINTS = [
+    "/posts", "/posts/1", "/posts/2", "/posts/3",
+    "/users", "/users/1", "/users/2",
+    "/comments", "/comments/1",
+    "/todos", "/todos/1",
+    "/albums", "/albums/1"
+]
+
+ATTACK_ENDPOINTS = [
+    "/posts?id=' OR 1=1--",
+    "/users?search=<script>alert('xss')</script>",
+    "/posts/../../../etc/passwd",
+    "/users?id=1 UNION SELECT * FROM users--",
+    "/posts?search=<img src=x onerror=alert(1)>",
+    "/admin/../../etc/shadow"
+]
+
+ERROR_ENDPOINTS = [
+    ("/posts/99999", 404),
+    ("/users/99999", 404),
+    ("/invalid", 404),
+    ("/posts", 500),
+    ("/users", 503)
+]
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)",
+    "Mozilla/5.0 (X11; Linux x86_64)",
+    "PostmanRuntime/7.29.2"
+]
+
+
+def build_log(api_key: str, rng: random.Random, attack_ratio: float, error_ratio: float, payload_bytes: int) -> tuple:
+    """Build one telemetry record according to the configured traffic mix"""
+    roll = rng.random()
+    if roll < attack_ratio:
+        kind = "attack"
+        endpoint, status = rng.choice(ATTACK_ENDPOINTS), 200
+    elif roll < attack_ratio + error_ratio:
+        kind = "error"
+        endpoint, status = rng.choice(ERROR_ENDPOINTS)
+    else:
+        kind = "normal"
+        endpoint, status = rng.choice(NORMAL_ENDPOINTS), 200
+
+    headers = {"accept": "application/json", "user-agent": rng.choice(USER_AGENTS)}
+    if payload_bytes > 0:
+        # Pad the headers so the request body reaches roughly the requested size
+        headers["x-padding"] = "".join(rng.choices(string.ascii_letters, k=payload_bytes))
+
+    return kind, {
+        "api_key": api_key,
+        "timestamp": time.time(),
+        "method": "GET" if rng.random() < 0.9 else "POST",
+        "endpoint": endpoint,
+        "client_ip": f"192.168.{rng.randint(0, 3)}.{rng.randint(1, 254)}",
+        "status_code": status,
+        "latency_ms": rng.uniform(20, 250),
+        "headers": headers,
+        "body_size": rng.randint(100, 5000),
+        "user_agent": headers["user-agent"]
+    }
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class LoadRun:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latencies = []
+        self.status_counts = Counter()
+        self.kind_counts = Counter()
+        self.exceptions = Counter()
+        self.suspicious = 0
+        self.issued = 0
+        self.started = 0.0
+
+    def _next_slot(self):
+        """Claim the next request slot, returning its scheduled send time or None when done"""
+        args = self.args
+        if args.requests and self.issued >= args.requests:
+            return None
+        now = time.perf_counter()
+        if args.duration and now - self.started >= args.duration:
+            return None
+        slot = self.issued
+        self.issued += 1
+        if args.rate > 0:
+            return self.started + slot / args.rate
+        return now
+
+    def _build_body(self):
+        """Build the request body, one record or a batch"""
+        args = self.args
+        records = []
+        for _ in range(max(1, args.batch_size)):
+            kind, record = build_log(args.api_key, self.rng, args.attack_ratio, args.error_ratio, args.payload_size)
+            self.kind_counts[kind] += 1
+            records.append(record)
+        return records[0] if args.batch_size <= 1 else records
+
+    async def _worker(self, client: httpx.AsyncClient):
+        """Send requests until the run budget is exhausted"""
+        while True:
+            scheduled = self._next_slot()
+            if scheduled is None:
+                return
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            body = self._build_body()
+            start = time.perf_counter()
+            try:
+                response = await client.post(self.args.path, json=body)
+                self.latencies.append((time.perf_counter() - start) * 1000)
+                self.status_counts[response.status_code] += 1
+                if response.status_code == 200:
+                    data = response.json()
+                    if isinstance(data, dict) and data.get("is_suspicious"):
+                        self.suspicious += 1
+            except Exception as e:
+                self.latencies.append((time.perf_counter() - start) * 1000)
+                self.exceptions[type(e).__name__] += 1
+
+    async def run(self) -> dict:
+        """Execute the load run and return the result summary"""
+        args = self.args
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            self.started = time.perf_counter()
+            await asyncio.gather(*(self._worker(client) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - self.started
+
+        latencies = sorted(self.latencies)
+        sent = len(latencies)
+        ok = self.status_counts.get(200, 0)
+        records = sent * max(1, args.batch_size)
+        return {
+            "run_at": datetime.now().isoformat(timespec="seconds"),
+            "label": args.label,
+            "host": platform.node(),
+            "config": {
+                "url": args.url,
+                "path": args.path,
+                "concurrency": args.concurrency,
+                "rate": args.rate,
+                "requests": args.requests,
+                "duration": args.duration,
+                "attack_ratio": args.attack_ratio,
+                "error_ratio": args.error_ratio,
+                "payload_size": args.payload_size,
+                "batch_size": args.batch_size,
+                "seed": args.seed
+            },
+            "elapsed_seconds": round(elapsed, 3),
+            "requests_sent": sent,
+            "records_sent": records,
+            "throughput_rps": round(sent / elapsed, 2) if elapsed > 0 else 0.0,
+            "records_per_second": round(records / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "min": round(latencies[0], 2) if latencies else 0.0,
+                "mean": round(sum(latencies) / sent, 2) if sent else 0.0,
+                "p50": round(percentile(latencies, 50), 2),
+                "p95": round(percentile(latencies, 95), 2),
+                "p99": round(percentile(latencies, 99), 2),
+                "max": round(latencies[-1], 2) if latencies else 0.0
+            },
+            "status_codes": {str(code): count for code, count in sorted(self.status_counts.items())},
+            "errors": sent - ok,
+            "exceptions": dict(self.exceptions),
+            "traffic_mix": dict(self.kind_counts),
+            "flagged_suspicious": self.suspicious
+        }
+
+
+def print_summary(result: dict, previous: dict = None):
+    """Print a run summary, with deltas against a previous run if given"""
+    def delta(path, lower_is_better):
+        if not previous:
+            return ""
+        cur, old = result, previous
+        for key in path:
+            cur, old = cur.get(key, {}), old.get(key, {})
+        if not isinstance(old, (int, float)) or not old:
+            return ""
+        change = (cur - old) / old * 100
+        better = change < 0 if lower_is_better else change > 0
+        return f"  ({change:+.1f}% {'better' if better else 'worse'})"
+
+    latency = result["latency_ms"]
+    print("=" * 70)
+    print(f"Ingest benchmark{' - ' + result['label'] if result['label'] else ''}")
+    print("=" * 70)
+    print(f"Requests sent:   {result['requests_sent']} in {result['elapsed_seconds']}s")
+    print(f"Throughput:      {result['throughput_rps']} req/s{delta(['throughput_rps'], False)}")
+    print(f"Latency p50:     {latency['p50']} ms{delta(['latency_ms', 'p50'], True)}")
+    print(f"Latency p95:     {latency['p95']} ms{delta(['latency_ms', 'p95'], True)}")
+    print(f"Latency p99:     {latency['p99']} ms{delta(['latency_ms', 'p99'], True)}")
+    print(f"Errors:          {result['errors']}{delta(['errors'], True)}")
+    print(f"Status codes:    {result['status_codes']}")
+    if result["exceptions"]:
+        print(f"Exceptions:      {result['exceptions']}")
+    print(f"Flagged:         {result['flagged_suspicious']} suspicious")
+    print("=" * 70)
+
+
+def save_result(result: dict, output: str = None) -> str:
+    """Write the result JSON and return its path"""
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = f"_{result['label']}" if result["label"] else ""
+        output = os.path.join(RESULTS_DIR, f"ingest_{stamp}{suffix}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    return output
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Boing's ingestion endpoint")
+    parser.add_argument("--url", default=BOING_URL, help="Backend base URL")
+    parser.add_argument("--path", default="/api/ingest", help="Ingestion route to drive")
+    parser.add_argument("--api-key", required=True, help="API key of a monitored API")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent in-flight requests")
+    parser.add_argument("--rate", type=float, default=0, help="Target requests/second (0 = as fast as possible)")
+    parser.add_argument("--requests", type=int, default=0, help="Total requests to send (0 = use --duration)")
+    parser.add_argument("--duration", type=float, default=30, help="Run length in seconds when --requests is 0")
+    parser.add_argument("--attack-ratio", type=float, default=0.1, help="Fraction of requests carrying attack payloads")
+    parser.add_argument("--error-ratio", type=float, default=0.15, help="Fraction of requests reporting 4xx/5xx")
+    parser.add_argument("--payload-size", type=int, default=0, help="Extra header bytes added to each record")
+    parser.add_argument("--batch-size", type=int, default=1, help="Records per request for batch ingestion routes")
+    parser.add_argument("--timeout", type=float, default=10, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for a reproducible traffic mix")
+    parser.add_argument("--label", default="", help="Free-form label stored with the result")
+    parser.add_argument("--output", help="Result file path (default: benchmarks/results/ingest_<time>.json)")
+    parser.add_argument("--compare", help="Previous result JSON to compare against")
+    args = parser.parse_args()
+    if args.requests:
+        args.duration = 0
+    return args
+
+
+def main():
+    args = parse_args()
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    result = asyncio.run(LoadRun(args).run())
+    print_summary(result, previous)
+    print(f"Saved results to {save_result(result, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
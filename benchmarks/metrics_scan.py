@@ -0,0 +1,207 @@
+"""
+Metrics query benchmark - POST /api/metrics against a seeded request_logs table
+
+Seeds a MySQL database (the one configured in backend/.env, or --database)
+with a synthetic request_logs history, then times the current get_metrics
+implementation against the original seven-query version that scanned the
+table once per metric. Results are saved as JSON under benchmarks/results/.
+
+Usage:
+    python benchmarks/metrics_scan.py --seed-rows 5000000
+    python benchmarks/metrics_scan.py --repeat 10 --label after-rollups
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from config import settings  # noqa: E402
+from database import get_db_connection  # noqa: E402
+from models import MetricsQuery  # noqa: E402
+from routes.metrics import get_metrics  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BENCH_EMAIL = "metrics-bench@boing.local"
+BENCH_API = "metrics-bench"
+ADMIN = {'id': 0, 'role': 'admin'}
+
+# The pre-aggregation query set, kept verbatim for comparison
+LEGACY_QUERIES = [
+    "SELECT COUNT(*) as total FROM request_logs {where}",
+    """SELECT COUNT(*) as total,
+              SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) as errors
+       FROM request_logs {where}""",
+    "SELECT AVG(latency_ms) as avg_latency FROM request_logs {where} AND latency_ms IS NOT NULL",
+    "SELECT COUNT(DISTINCT client_ip) as unique_ips FROM request_logs {where}",
+    "SELECT COUNT(*) as suspicious FROM request_logs {where} AND is_suspicious = TRUE",
+    """SELECT endpoint, COUNT(*) as count FROM request_logs {where}
+       GROUP BY endpoint ORDER BY count DESC LIMIT 10""",
+    """SELECT DATE_FORMAT(FROM_UNIXTIME(timestamp), "%%Y-%%m-%%d %%H:00") as time_bucket, COUNT(*) as count
+       FROM request_logs {where} GROUP BY time_bucket ORDER BY time_bucket DESC LIMIT 100""",
+]
+
+
+def ensure_bench_api(cursor) -> int:
+    """Create (or reuse) the user and API that own the synthetic rows"""
+    cursor.execute("SELECT id FROM users WHERE email = %s", (BENCH_EMAIL,))
+    user = cursor.fetchone()
+    if user:
+        user_id = user['id']
+    else:
+        cursor.execute(
+            "INSERT INTO users (email, password_hash, full_name, role) VALUES (%s, 'x', 'Metrics bench', 'user')",
+            (BENCH_EMAIL,)
+        )
+        user_id = cursor.lastrowid
+
+    cursor.execute("SELECT id FROM apis WHERE api_key = %s", (BENCH_API,))
+    api = cursor.fetchone()
+    if api:
+        return api['id']
+    cursor.execute(
+        "INSERT INTO apis (user_id, name, api_key, api_secret_encrypted) VALUES (%s, %s, %s, 'x')",
+        (user_id, BENCH_API, BENCH_API)
+    )
+    return cursor.lastrowid
+
+
+def seed(rows: int, days: int, batch: int = 10000) -> int:
+    """Insert synthetic request logs spread over the last N days"""
+    rng = random.Random(1)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        api_id = ensure_bench_api(cursor)
+        conn.commit()
+        now = time.time()
+        start = now - days * 86400
+        endpoints = [f"/api/v1/resource{i}/{{id}}" for i in range(200)]
+        inserted = 0
+        while inserted < rows:
+            n = min(batch, rows - inserted)
+            values = []
+            for _ in range(n):
+                status = rng.choice((200, 200, 200, 200, 201, 304, 404, 500))
+                values.append((
+                    api_id,
+                    rng.uniform(start, now),
+                    rng.choice(("GET", "GET", "POST", "PUT")),
+                    rng.choice(endpoints).replace("{id}", str(rng.randint(1, 5000))),
+                    f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                    status,
+                    rng.lognormvariate(4.5, 0.6),
+                    rng.randint(0, 20000),
+                    "Mozilla/5.0",
+                    rng.random() < 0.02
+                ))
+            cursor.executemany("""
+                INSERT INTO request_logs (
+                    api_id, timestamp, method, endpoint, client_ip,
+                    status_code, latency_ms, body_size, user_agent, is_suspicious
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, values)
+            conn.commit()
+            inserted += n
+            print(f"  seeded {inserted}/{rows} rows", end="\r")
+        print()
+        return api_id
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def bench_api_id() -> int:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM apis WHERE api_key = %s", (BENCH_API,))
+        api = cursor.fetchone()
+        if not api:
+            raise SystemExit("No benchmark data yet; run with --seed-rows first")
+        cursor.execute("SELECT COUNT(*) as n FROM request_logs WHERE api_id = %s", (api['id'],))
+        print(f"Benchmark API {api['id']} has {cursor.fetchone()['n']} rows")
+        return api['id']
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def time_legacy(api_id: int) -> float:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        for sql in LEGACY_QUERIES:
+            cursor.execute(sql.format(where="WHERE api_id = %s"), (api_id,))
+            cursor.fetchall()
+        return time.perf_counter() - start
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def time_current(api_id: int, interval: str) -> float:
+    start = time.perf_counter()
+    asyncio.run(get_metrics(MetricsQuery(api_id=api_id, interval=interval), user=ADMIN))
+    return time.perf_counter() - start
+
+
+def summarize(samples: list) -> dict:
+    return {
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'min_ms': round(min(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark POST /api/metrics query cost")
+    parser.add_argument("--database", help="Override DB_NAME (use a scratch database)")
+    parser.add_argument("--seed-rows", type=int, default=0, help="Insert this many synthetic rows first")
+    parser.add_argument("--days", type=int, default=30, help="Spread seeded rows over this many days")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per variant")
+    parser.add_argument("--interval", default="hour", help="requests_over_time interval")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the current implementation")
+    parser.add_argument("--label", default="", help="Free-form label stored with the result")
+    args = parser.parse_args()
+
+    if args.database:
+        settings.DB_NAME = args.database
+    if args.seed_rows:
+        print(f"Seeding {args.seed_rows} rows into {settings.DB_NAME}...")
+        seed(args.seed_rows, args.days)
+    api_id = bench_api_id()
+
+    result = {
+        'run_at': datetime.now().isoformat(timespec="seconds"),
+        'label': args.label,
+        'database': settings.DB_NAME,
+        'interval': args.interval,
+        'repeat': args.repeat,
+    }
+    # One warm-up each so both variants run against a warm buffer pool
+    time_current(api_id, args.interval)
+    result['current'] = summarize([time_current(api_id, args.interval) for _ in range(args.repeat)])
+    if not args.skip_legacy:
+        time_legacy(api_id)
+        result['legacy'] = summarize([time_legacy(api_id) for _ in range(args.repeat)])
+        result['speedup'] = round(result['legacy']['median_ms'] / max(result['current']['median_ms'], 0.001), 2)
+
+    print(json.dumps(result, indent=2))
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
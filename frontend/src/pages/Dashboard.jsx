@@ -100,6 +100,7 @@ function Dashboard({ token }) {
   const fetchMetrics = async () => {
     try {
       const body = selectedApiId === 'all' ? {} : { api_id: parseInt(selectedApiId) };
+      body.timezone = Intl.DateTimeFormat().resolvedOptions().timeZone || 'UTC';
       const res = await fetch('/api/metrics', {
         method: 'POST',
         headers: {
@@ -238,7 +239,9 @@ function Dashboard({ token }) {
             </svg>
           </div>
           <div className="stat-value">{metrics?.avg_latency_ms?.toFixed(0) || 0}ms</div>
-          <p className="stat-change">Response time</p>
+          <p className="stat-change">
+            p95 {metrics?.latency_percentiles?.p95?.toFixed(0) ?? '-'}ms · p99 {metrics?.latency_percentiles?.p99?.toFixed(0) ?? '-'}ms
+          </p>
         </div>
         
         <div className="stat-card">
@@ -289,6 +292,42 @@ function Dashboard({ token }) {
             </ResponsiveContainer>
           </div>
         </div>
+
+        <div className="card">
+          <div className="card-header">
+            <h3 className="card-title">Top Client IPs</h3>
+            <p className="card-description">Heaviest clients in the selected range</p>
+          </div>
+          <div className="card-content">
+            <ResponsiveContainer width="100%" height={250}>
+              <BarChart data={metrics?.top_client_ips?.slice(0, 5) || []}>
+                <CartesianGrid strokeDasharray="3 3" stroke="hsl(var(--border))" />
+                <XAxis dataKey="client_ip" fontSize={11} stroke="hsl(var(--muted-foreground))" />
+                <YAxis fontSize={12} stroke="hsl(var(--muted-foreground))" />
+                <Tooltip contentStyle={{ background: 'hsl(var(--popover))', border: '1px solid hsl(var(--border))' }} />
+                <Bar dataKey="count" fill="hsl(var(--primary))" />
+              </BarChart>
+            </ResponsiveContainer>
+          </div>
+        </div>
+
+        <div className="card">
+          <div className="card-header">
+            <h3 className="card-title">Top User Agents</h3>
+            <p className="card-description">Most common clients by user agent</p>
+          </div>
+          <div className="card-content">
+            <ResponsiveContainer width="100%" height={250}>
+              <BarChart data={metrics?.top_user_agents?.slice(0, 5) || []}>
+                <CartesianGrid strokeDasharray="3 3" stroke="hsl(var(--border))" />
+                <XAxis dataKey="user_agent" fontSize={11} stroke="hsl(var(--muted-foreground))" />
+                <YAxis fontSize={12} stroke="hsl(var(--muted-foreground))" />
+                <Tooltip contentStyle={{ background: 'hsl(var(--popover))', border: '1px solid hsl(var(--border))' }} />
+                <Bar dataKey="count" fill="hsl(var(--primary))" />
+              </BarChart>
+            </ResponsiveContainer>
+          </div>
+        </div>
       </div>
 
       <div className="live-monitor">
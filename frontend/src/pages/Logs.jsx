@@ -3,6 +3,7 @@ import { useState, useEffect } from 'react';
 function Logs({ token }) {
   const [logs, setLogs] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [error, setError] = useState('');
   const [suspiciousOnly, setSuspiciousOnly] = useState(false);
 
   useEffect(() => {
@@ -20,12 +21,17 @@ function Logs({ token }) {
         body: JSON.stringify({
           suspicious_only: suspiciousOnly,
           limit: 100,
-          offset: 0
+          offset: 0,
+          total: 'none'
         })
       });
+      const data = await res.json();
       if (res.ok) {
-        const data = await res.json();
         setLogs(data.logs);
+        setError('');
+      } else {
+        setLogs([]);
+        setError(data.detail || 'Failed to load logs');
       }
     } catch (err) {
       console.error('Failed to fetch logs:', err);
@@ -42,10 +48,10 @@ function Logs({ token }) {
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'application/json'
         },
+        // The download is buffered in the browser: full exports go through the API
         body: JSON.stringify({
           suspicious_only: suspiciousOnly,
-          limit: 1000,
-          offset: 0
+          limit: 1000
         })
       });
       if (res.ok) {
@@ -80,6 +86,8 @@ function Logs({ token }) {
         </div>
       </div>
 
+      {error && <div className="alert alert-error">{error}</div>}
+
       {logs.length === 0 ? (
         <div className="card">
           <p className="text-secondary">No logs found.</p>